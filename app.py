@@ -23,10 +23,22 @@ from io import StringIO, BytesIO
 import sys
 import re
 import hashlib
+import unicodedata
 import shutil
 import uuid
+import csv
+import sqlite3
+import warnings
+import concurrent.futures
+import multiprocessing
+import signal
+import contextvars
+from collections import deque, OrderedDict
+import random
 import tempfile
 import platform
+import httpx
+import anyio
 # Document processing
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor
@@ -57,6 +69,21 @@ try:
 except ImportError:
     CHARTS_AVAILABLE = False
     logging.warning("Chart libraries not available. Chart generation disabled.")
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
 import asyncio
 from datetime import timedelta
 from PIL import Image as PILImage
@@ -175,6 +202,14 @@ try:
     import markdown
 except ImportError:
     markdown = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
 # Pydantic models for request/response documentation
 # Azure OpenAI client configuration
 AZURE_ENDPOINT = "https://kb-stellar.openai.azure.com/" # Replace with your endpoint if different
@@ -264,22 +299,376 @@ class TestEndpointResponse(BaseModel):
     test_data: Optional[str] = Field(None, description="Test data used")
     result: Optional[Dict[str, Any]] = Field(None, description="Test result")
     error: Optional[str] = Field(None, description="Error if test failed")
+# Thread lock backend configuration
+# "local" (single process), "file" (multiple workers on one host) or "redis" (multiple hosts)
+THREAD_LOCK_BACKEND = os.getenv("THREAD_LOCK_BACKEND", "local").lower()
+THREAD_LOCK_DIR = os.getenv("THREAD_LOCK_DIR", os.path.join(tempfile.gettempdir(), "copilot_thread_locks"))
+THREAD_LOCK_LEASE_SECONDS = float(os.getenv("THREAD_LOCK_LEASE_SECONDS", "60"))
+# Safety net: stop renewing a lease held longer than this (e.g. an abandoned stream)
+THREAD_LOCK_MAX_HOLD_SECONDS = float(os.getenv("THREAD_LOCK_MAX_HOLD_SECONDS", "900"))
+REDIS_URL = os.getenv("REDIS_URL")
+
+class ThreadLockLease:
+    """A held thread lock: owner token, fencing token and the heartbeat keeping it alive."""
+    def __init__(self, thread_id: str, owner: str, fencing_token: int):
+        self.thread_id = thread_id
+        self.owner = owner
+        self.fencing_token = fencing_token
+        self.acquired_at = time.time()
+        self.lost = False
+        self.released = False
+        self.heartbeat_task: Optional[asyncio.Task] = None
+
+class LocalLockBackend:
+    """In-process leases. Only safe with a single worker process."""
+    name = "local"
+
+    def __init__(self):
+        self.holders: Dict[str, Tuple[str, float]] = {}  # thread_id -> (owner, expires_at)
+        self.fences: Dict[str, int] = {}
+
+    async def try_acquire(self, thread_id: str, owner: str, lease_seconds: float) -> Optional[int]:
+        holder = self.holders.get(thread_id)
+        if holder and holder[1] > time.time():
+            return None
+        self.holders[thread_id] = (owner, time.time() + lease_seconds)
+        self.fences[thread_id] = self.fences.get(thread_id, 0) + 1
+        return self.fences[thread_id]
+
+    async def renew(self, thread_id: str, owner: str, lease_seconds: float) -> bool:
+        holder = self.holders.get(thread_id)
+        if not holder or holder[0] != owner:
+            return False
+        self.holders[thread_id] = (owner, time.time() + lease_seconds)
+        return True
+
+    async def is_held(self, thread_id: str, owner: str) -> bool:
+        holder = self.holders.get(thread_id)
+        return bool(holder and holder[0] == owner and holder[1] > time.time())
+
+    async def release(self, thread_id: str, owner: str) -> bool:
+        holder = self.holders.get(thread_id)
+        if holder and holder[0] == owner:
+            del self.holders[thread_id]
+            return True
+        return False
+
+    def forget(self, thread_id: str):
+        if thread_id not in self.holders:
+            self.fences.pop(thread_id, None)
+
+class FileLockBackend:
+    """
+    flock-based leases for several worker processes on one host.
+
+    The kernel drops the lock if the holding process dies, so no expiry is needed;
+    the lock file stores a fencing counter that increments on every acquisition.
+    """
+    name = "file"
+
+    def __init__(self, lock_dir: str = THREAD_LOCK_DIR):
+        if fcntl is None:
+            raise RuntimeError("File lock backend requires fcntl (POSIX only)")
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self.handles: Dict[str, Tuple[str, Any]] = {}  # thread_id -> (owner, open file)
+
+    def _path(self, thread_id: str) -> str:
+        return os.path.join(self.lock_dir, hashlib.sha1(thread_id.encode()).hexdigest() + ".lock")
+
+    async def try_acquire(self, thread_id: str, owner: str, lease_seconds: float) -> Optional[int]:
+        locked = await asyncio.to_thread(self._lock_file, thread_id)
+        if locked is None:
+            return None
+        handle, fencing_token = locked
+        self.handles[thread_id] = (owner, handle)
+        return fencing_token
+
+    def _lock_file(self, thread_id: str) -> Optional[Tuple[Any, int]]:
+        """Take the flock and bump the fencing counter; returns (open file, fencing token) or None if held."""
+        handle = open(self._path(thread_id), "a+")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        try:
+            handle.seek(0)
+            content = handle.read().strip()
+            fencing_token = int(content or 0) + 1
+            handle.seek(0)
+            handle.truncate()
+            handle.write(str(fencing_token))
+            handle.flush()
+        except Exception:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            handle.close()
+            raise
+        return handle, fencing_token
+
+    async def renew(self, thread_id: str, owner: str, lease_seconds: float) -> bool:
+        return await self.is_held(thread_id, owner)
+
+    async def is_held(self, thread_id: str, owner: str) -> bool:
+        entry = self.handles.get(thread_id)
+        return bool(entry and entry[0] == owner and not entry[1].closed)
+
+    async def release(self, thread_id: str, owner: str) -> bool:
+        entry = self.handles.get(thread_id)
+        if not entry or entry[0] != owner:
+            return False
+        del self.handles[thread_id]
+        await asyncio.to_thread(self._unlock_file, entry[1])
+        return True
+
+    @staticmethod
+    def _unlock_file(handle):
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            handle.close()
+
+    def forget(self, thread_id: str):
+        pass
+
+class RedisLockBackend:
+    """
+    Redis leases for several hosts: SET NX PX with a compare-and-delete release.
+
+    Works with any redis.asyncio-compatible client exposing set/get/incr/eval,
+    so it can be exercised against a local fake such as fakeredis.
+    """
+    name = "redis"
+
+    RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, client: Any, prefix: str = "copilot:thread_lock:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, thread_id: str) -> str:
+        return f"{self.prefix}{thread_id}"
+
+    @staticmethod
+    def _decode(value: Any) -> Optional[str]:
+        if isinstance(value, bytes):
+            return value.decode()
+        return value
+
+    async def try_acquire(self, thread_id: str, owner: str, lease_seconds: float) -> Optional[int]:
+        acquired = await self.client.set(self._key(thread_id), owner, nx=True, px=int(lease_seconds * 1000))
+        if not acquired:
+            return None
+        return int(await self.client.incr(self._key(thread_id) + ":fence"))
+
+    async def renew(self, thread_id: str, owner: str, lease_seconds: float) -> bool:
+        result = await self.client.eval(self.RENEW_SCRIPT, 1, self._key(thread_id), owner, int(lease_seconds * 1000))
+        return bool(result)
+
+    async def is_held(self, thread_id: str, owner: str) -> bool:
+        return self._decode(await self.client.get(self._key(thread_id))) == owner
+
+    async def release(self, thread_id: str, owner: str) -> bool:
+        return bool(await self.client.eval(self.RELEASE_SCRIPT, 1, self._key(thread_id), owner))
+
+    def forget(self, thread_id: str):
+        pass
+
+def create_lock_backend(backend_name: str = THREAD_LOCK_BACKEND):
+    """Build the configured lock backend, falling back to local locks if it is unavailable."""
+    try:
+        if backend_name == "file":
+            return FileLockBackend()
+        if backend_name == "redis":
+            if redis_asyncio is None:
+                raise RuntimeError("the 'redis' package is not installed")
+            if not REDIS_URL:
+                raise RuntimeError("REDIS_URL is not set")
+            return RedisLockBackend(redis_asyncio.from_url(REDIS_URL))
+    except Exception as e:
+        logging.warning(f"Thread lock backend '{backend_name}' unavailable ({e}); using local locks")
+    return LocalLockBackend()
+
 # Thread lock manager to prevent concurrent access to the same thread
 class ThreadLockManager:
-    def __init__(self):
-        self.locks: Dict[str, asyncio.Lock] = {}
+    def __init__(self, backend: Any = None, lease_seconds: float = THREAD_LOCK_LEASE_SECONDS,
+                 max_hold_seconds: float = THREAD_LOCK_MAX_HOLD_SECONDS):
+        self.backend = backend or create_lock_backend()
+        self.lease_seconds = lease_seconds
+        self.max_hold_seconds = max_hold_seconds
+        # Per-thread FIFO of waiters in this process; only the head competes for the backend lease
+        self.queues: Dict[str, deque] = {}
+        self.active_turns: set = set()
+        self.queue_stats: Dict[str, Dict[str, Any]] = {}
+        # Wakes waiters in this process when a lease is released here; remote releases are polled
+        self.release_events: Dict[str, asyncio.Event] = {}
         self.lock_access_times: Dict[str, datetime] = {}
+        self.held: Dict[str, ThreadLockLease] = {}
         self.manager_lock = asyncio.Lock()
+        self.stats = {"acquired": 0, "timeouts": 0, "leases_lost": 0, "total_wait_time": 0.0}
     
-    async def get_lock(self, thread_id: str) -> asyncio.Lock:
-        async with self.manager_lock:
-            if thread_id not in self.locks:
-                self.locks[thread_id] = asyncio.Lock()
-            self.lock_access_times[thread_id] = datetime.now()
-            return self.locks[thread_id]
+    async def acquire(self, thread_id: str, timeout: float = 30.0) -> ThreadLockLease:
+        """
+        Acquire the lease for a thread, waiting up to `timeout` seconds.
+
+        Args:
+            thread_id: Thread ID to lock
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The held lease (release it with release())
+
+        Raises:
+            asyncio.TimeoutError if the lease could not be acquired in time
+        """
+        owner = uuid.uuid4().hex
+        start_time = time.time()
+        deadline = start_time + timeout
+        poll_interval = 0.05
+        self.lock_access_times[thread_id] = datetime.now()
+
+        await self._wait_for_turn(thread_id, timeout)
+        try:
+            lease = await self._acquire_lease(thread_id, owner, deadline, poll_interval)
+        except BaseException:
+            self._pass_turn(thread_id)
+            self._record_wait(thread_id, time.time() - start_time, timed_out=True)
+            raise
+        wait_time = time.time() - start_time
+        self.stats["acquired"] += 1
+        self.stats["total_wait_time"] += wait_time
+        self._record_wait(thread_id, wait_time)
+        return lease
+
+    async def _wait_for_turn(self, thread_id: str, timeout: float):
+        """Wait in this thread's FIFO queue until it is our turn."""
+        queue = self.queues.setdefault(thread_id, deque())
+        if thread_id not in self.active_turns and not queue:
+            self.active_turns.add(thread_id)
+            return
+
+        turn = asyncio.get_running_loop().create_future()
+        queue.append(turn)
+        try:
+            await asyncio.wait_for(turn, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._abandon_turn(thread_id, turn)
+            self.stats["timeouts"] += 1
+            self._record_wait(thread_id, timeout, timed_out=True)
+            raise
+        except BaseException:
+            self._abandon_turn(thread_id, turn)
+            raise
+
+    def _abandon_turn(self, thread_id: str, turn: asyncio.Future):
+        """Leave the queue after a timeout or cancellation."""
+        queue = self.queues.get(thread_id)
+        if turn.done() and not turn.cancelled():
+            # The turn was handed to us just as we gave up; hand it on
+            self._pass_turn(thread_id)
+        elif queue and turn in queue:
+            queue.remove(turn)
+
+    def _pass_turn(self, thread_id: str):
+        """Hand the turn to the next live waiter, or mark the thread idle."""
+        queue = self.queues.get(thread_id)
+        while queue:
+            turn = queue.popleft()
+            if not turn.done():
+                turn.set_result(True)
+                return
+        self.active_turns.discard(thread_id)
+
+    def _record_wait(self, thread_id: str, wait_time: float, timed_out: bool = False):
+        stats = self.queue_stats.setdefault(thread_id, {
+            "acquired": 0, "timeouts": 0, "total_wait_time": 0.0, "max_wait_time": 0.0, "last_wait_time": 0.0
+        })
+        if timed_out:
+            stats["timeouts"] += 1
+            return
+        stats["acquired"] += 1
+        stats["total_wait_time"] += wait_time
+        stats["max_wait_time"] = max(stats["max_wait_time"], wait_time)
+        stats["last_wait_time"] = wait_time
+
+    async def _acquire_lease(self, thread_id: str, owner: str, deadline: float, poll_interval: float) -> ThreadLockLease:
+        """Compete for the backend lease; other processes may hold it."""
+        while True:
+            # Clear before trying so a release in between still wakes us
+            event = self.release_events.setdefault(thread_id, asyncio.Event())
+            event.clear()
+            fencing_token = await self.backend.try_acquire(thread_id, owner, self.lease_seconds)
+            if fencing_token is not None:
+                lease = ThreadLockLease(thread_id, owner, fencing_token)
+                lease.heartbeat_task = asyncio.create_task(self._heartbeat(lease))
+                self.held[thread_id] = lease
+                return lease
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.stats["timeouts"] += 1
+                raise asyncio.TimeoutError(f"Timed out acquiring lock for thread {thread_id}")
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(poll_interval, remaining))
+            except asyncio.TimeoutError:
+                poll_interval = min(poll_interval * 2, 1.0)
+
+    async def release(self, lease: ThreadLockLease):
+        """Release a lease; safe to call more than once."""
+        if lease.released:
+            return
+        lease.released = True
+        if lease.heartbeat_task and lease.heartbeat_task is not asyncio.current_task():
+            lease.heartbeat_task.cancel()
+        try:
+            if not await self.backend.release(lease.thread_id, lease.owner):
+                logging.warning(f"Lock for thread {lease.thread_id} was no longer held at release (fencing token {lease.fencing_token})")
+        finally:
+            if self.held.get(lease.thread_id) is lease:
+                del self.held[lease.thread_id]
+            self.lock_access_times[lease.thread_id] = datetime.now()
+            event = self.release_events.get(lease.thread_id)
+            if event:
+                event.set()
+            self._pass_turn(lease.thread_id)
+
+    async def is_valid(self, lease: ThreadLockLease) -> bool:
+        """Check that a lease is still held before doing work that must not overlap (e.g. runs.create)."""
+        if lease.lost or lease.released:
+            return False
+        try:
+            return await self.backend.is_held(lease.thread_id, lease.owner)
+        except Exception as e:
+            logging.warning(f"Could not verify lock for thread {lease.thread_id}: {e}")
+            return False
+
+    async def _heartbeat(self, lease: ThreadLockLease):
+        """Keep renewing the lease while it is held."""
+        try:
+            while not lease.released:
+                await asyncio.sleep(self.lease_seconds / 3)
+                if lease.released:
+                    break
+                if time.time() - lease.acquired_at > self.max_hold_seconds:
+                    logging.warning(f"Lock for thread {lease.thread_id} held for over {self.max_hold_seconds}s; releasing")
+                    await self.release(lease)
+                    break
+                try:
+                    renewed = await self.backend.renew(lease.thread_id, lease.owner, self.lease_seconds)
+                except Exception as e:
+                    logging.warning(f"Lock heartbeat failed for thread {lease.thread_id}: {e}")
+                    continue
+                if not renewed:
+                    lease.lost = True
+                    self.stats["leases_lost"] += 1
+                    logging.error(f"Lost lock for thread {lease.thread_id} (fencing token {lease.fencing_token})")
+                    break
+        except asyncio.CancelledError:
+            pass
     
     async def cleanup_old_locks(self, max_age_minutes: int = 30):
-        """Remove locks that haven't been accessed in a while to prevent memory leaks"""
+        """Remove bookkeeping for threads that haven't been accessed in a while to prevent memory leaks"""
         async with self.manager_lock:
             current_time = datetime.now()
             threads_to_remove = []
@@ -287,18 +676,568 @@ class ThreadLockManager:
             for thread_id, last_access in self.lock_access_times.items():
                 if current_time - last_access > timedelta(minutes=max_age_minutes):
                     # Only remove if lock is not currently held
-                    if thread_id in self.locks and not self.locks[thread_id].locked():
+                    if thread_id not in self.held and thread_id not in self.active_turns:
                         threads_to_remove.append(thread_id)
             
             for thread_id in threads_to_remove:
-                del self.locks[thread_id]
                 del self.lock_access_times[thread_id]
+                self.release_events.pop(thread_id, None)
+                self.queues.pop(thread_id, None)
+                self.queue_stats.pop(thread_id, None)
+                self.backend.forget(thread_id)
                 logging.info(f"Cleaned up lock for thread {thread_id}")
 
+    def get_stats(self) -> Dict[str, Any]:
+        acquired = self.stats["acquired"]
+        return {
+            "backend": self.backend.name,
+            "lease_seconds": self.lease_seconds,
+            "held": len(self.held),
+            "acquired": acquired,
+            "timeouts": self.stats["timeouts"],
+            "leases_lost": self.stats["leases_lost"],
+            "avg_wait_time": round(self.stats["total_wait_time"] / acquired, 4) if acquired else 0.0,
+            "queued": sum(len(q) for q in self.queues.values()),
+            "busiest_sessions": sorted(
+                ({"session": t, "queue_depth": len(q)} for t, q in self.queues.items() if q),
+                key=lambda item: item["queue_depth"], reverse=True
+            )[:10],
+        }
+
+    def get_queue_stats(self, thread_id: str) -> Dict[str, Any]:
+        """Queue depth and wait-time metrics for one session."""
+        queue = self.queues.get(thread_id) or ()
+        stats = self.queue_stats.get(thread_id, {})
+        acquired = stats.get("acquired", 0)
+        lease = self.held.get(thread_id)
+        return {
+            "session": thread_id,
+            "locked": thread_id in self.active_turns,
+            "queue_depth": sum(1 for turn in queue if not turn.done()),
+            "held_for_seconds": round(time.time() - lease.acquired_at, 3) if lease else None,
+            "fencing_token": lease.fencing_token if lease else None,
+            "acquired": acquired,
+            "timeouts": stats.get("timeouts", 0),
+            "avg_wait_time": round(stats.get("total_wait_time", 0.0) / acquired, 4) if acquired else 0.0,
+            "max_wait_time": round(stats.get("max_wait_time", 0.0), 4),
+            "last_wait_time": round(stats.get("last_wait_time", 0.0), 4),
+        }
+
 # Create global instance
 thread_lock_manager = ThreadLockManager()
-# Simple status updates for long-running operations
-operation_statuses = {}
+
+# Run states reported by the Assistants API
+ACTIVE_RUN_STATUSES = {"queued", "in_progress", "requires_action", "cancelling"}
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete"}
+
+class RunTracker:
+    """
+    Tracks assistant run state per thread so callers can wait for a run without polling.
+
+    State is learned from the run stream events the service already consumes
+    (streaming chat, tracked non-streaming runs, tool output submissions). Waiters
+    get a future that resolves as soon as a matching event is observed. Adaptive
+    polling with jitter is only used while no live stream is reporting on the thread.
+    """
+    def __init__(self, initial_poll_interval: float = 0.5, max_poll_interval: float = 5.0, backoff: float = 1.5):
+        self.initial_poll_interval = initial_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        # thread_id -> {"run_id", "status", "run", "updated"}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        # run_id -> [(loop, future, statuses)]
+        self.waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future, set]]] = {}
+        # thread_id -> number of run streams currently being consumed
+        self.live_streams: Dict[str, int] = {}
+        self._tasks: set = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "events_observed": 0,
+            "waits": 0,
+            "resolved_by_event": 0,
+            "resolved_by_poll": 0,
+            "resolved_from_cache": 0,
+            "polls": 0,
+            "timeouts": 0,
+        }
+
+    def observe(self, thread_id: str, run_id: str, status: str, run: Any = None, source: str = "event"):
+        """
+        Record a run state change and resolve any waiters interested in it.
+        Safe to call from worker threads.
+        """
+        if not thread_id or not run_id or not status:
+            return
+        with self._lock:
+            record = self.runs.get(thread_id)
+            if record and record["run_id"] == run_id and record.get("run") is not None and run is None:
+                run = record["run"] if record["status"] == status else None
+            self.runs[thread_id] = {
+                "run_id": run_id,
+                "status": status,
+                "run": run,
+                "updated": time.time(),
+            }
+            if source == "event":
+                self.stats["events_observed"] += 1
+            ready = []
+            remaining = []
+            for loop, future, statuses in self.waiters.get(run_id, []):
+                if status in statuses and run is not None:
+                    ready.append((loop, future))
+                else:
+                    remaining.append((loop, future, statuses))
+            if remaining:
+                self.waiters[run_id] = remaining
+            else:
+                self.waiters.pop(run_id, None)
+
+        for loop, future in ready:
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, run, source)
+            except RuntimeError:
+                # Loop already closed; the waiter is gone with it
+                pass
+
+    def observe_event(self, thread_id: str, event: Any):
+        """Record the run state carried by an assistant stream event, ignoring non-run events."""
+        try:
+            event_name = getattr(event, "event", "") or ""
+            if not event_name.startswith("thread.run.") or event_name.startswith("thread.run.step"):
+                return
+            run = event.data
+            self.observe(thread_id, run.id, run.status, run)
+        except Exception as e:
+            logging.debug(f"Could not record run event for thread {thread_id}: {e}")
+
+    def attach(self, thread_id: str):
+        """Mark that a run stream for this thread is being consumed."""
+        with self._lock:
+            self.live_streams[thread_id] = self.live_streams.get(thread_id, 0) + 1
+
+    def detach(self, thread_id: str):
+        """Mark that a run stream for this thread has ended; waiters fall back to polling."""
+        with self._lock:
+            count = self.live_streams.get(thread_id, 0) - 1
+            if count > 0:
+                self.live_streams[thread_id] = count
+            else:
+                self.live_streams.pop(thread_id, None)
+
+    def has_live_stream(self, thread_id: str) -> bool:
+        with self._lock:
+            return self.live_streams.get(thread_id, 0) > 0
+
+    def get_run(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """Return the last known run record for a thread, if any."""
+        with self._lock:
+            record = self.runs.get(thread_id)
+            return dict(record) if record else None
+
+    async def follow_stream(self, thread_id: str, stream: Any) -> Optional[str]:
+        """
+        Consume a run event stream in the background, feeding the tracker.
+
+        Args:
+            thread_id: Thread the run belongs to
+            stream: AsyncStream of assistant events (runs.create/submit_tool_outputs with stream=True)
+
+        Returns:
+            The run ID from the first run event, or None if the stream ended without one
+        """
+        self.attach(thread_id)
+        run_id = None
+        try:
+            async for event in stream:
+                self.observe_event(thread_id, event)
+                if getattr(event, "event", "").startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                    run_id = event.data.id
+                    break
+        except Exception as e:
+            logging.warning(f"Run stream for thread {thread_id} ended early: {e}")
+            self.detach(thread_id)
+            return run_id
+        if run_id is None:
+            self.detach(thread_id)
+            return None
+
+        async def pump():
+            try:
+                async for event in stream:
+                    self.observe_event(thread_id, event)
+            except Exception as e:
+                logging.warning(f"Run stream for thread {thread_id} ended early: {e}")
+            finally:
+                self.detach(thread_id)
+
+        task = asyncio.create_task(pump())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return run_id
+
+    async def wait_for_run(self, client: AsyncAzureOpenAI, thread_id: str, run_id: str,
+                           timeout: float = 300, statuses: Optional[set] = None) -> Any:
+        """
+        Wait until a run reaches one of the given statuses.
+
+        Args:
+            client: Azure OpenAI client, used only when polling is needed
+            thread_id: Thread ID
+            run_id: Run ID to wait on
+            timeout: Maximum seconds to wait
+            statuses: Statuses to wait for (defaults to terminal states plus requires_action)
+
+        Returns:
+            The Run object in the requested state
+
+        Raises:
+            asyncio.TimeoutError if the run does not get there in time
+        """
+        statuses = set(statuses or (TERMINAL_RUN_STATUSES | {"requires_action"}))
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.stats["waits"] += 1
+
+        with self._lock:
+            record = self.runs.get(thread_id)
+            if record and record["run_id"] == run_id and record["status"] in statuses and record.get("run") is not None:
+                self.stats["resolved_from_cache"] += 1
+                return record["run"]
+            self.waiters.setdefault(run_id, []).append((loop, future, statuses))
+
+        deadline = loop.time() + timeout
+        interval = self.initial_poll_interval
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise asyncio.TimeoutError(f"Run {run_id} did not reach {sorted(statuses)} within {timeout}s")
+
+                if self.has_live_stream(thread_id):
+                    # Events are flowing; re-check periodically in case the stream dies
+                    wait_time = min(remaining, self.max_poll_interval)
+                else:
+                    run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+                    self.stats["polls"] += 1
+                    self.observe(thread_id, run_id, run.status, run, source="poll")
+                    if run.status in statuses:
+                        self.stats["resolved_by_poll"] += 1
+                        return run
+                    wait_time = min(remaining, interval * random.uniform(0.8, 1.2))
+                    interval = min(interval * self.backoff, self.max_poll_interval)
+
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), timeout=wait_time)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            with self._lock:
+                waiters = [w for w in self.waiters.get(run_id, []) if w[1] is not future]
+                if waiters:
+                    self.waiters[run_id] = waiters
+                else:
+                    self.waiters.pop(run_id, None)
+            if not future.done():
+                future.cancel()
+
+    async def wait_for_idle(self, client: AsyncAzureOpenAI, thread_id: str, timeout: float = 30) -> bool:
+        """
+        Wait until the thread has no active run.
+
+        Returns:
+            True if the thread is idle, False on timeout
+        """
+        record = self.get_run(thread_id)
+        if record and record["status"] in TERMINAL_RUN_STATUSES:
+            return True
+
+        if record and record["status"] in ACTIVE_RUN_STATUSES:
+            run_id = record["run_id"]
+        else:
+            runs = await client.beta.threads.runs.list(thread_id=thread_id, limit=1)
+            if not runs.data:
+                return True
+            latest_run = runs.data[0]
+            self.observe(thread_id, latest_run.id, latest_run.status, latest_run, source="poll")
+            if latest_run.status not in ACTIVE_RUN_STATUSES:
+                return True
+            run_id = latest_run.id
+
+        logging.info(f"Waiting for run {run_id} on thread {thread_id} to finish")
+        try:
+            await self.wait_for_run(client, thread_id, run_id, timeout=timeout, statuses=TERMINAL_RUN_STATUSES)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def cleanup(self, max_age_minutes: int = 30):
+        """Drop run records for threads that have been quiet for a while."""
+        cutoff = time.time() - max_age_minutes * 60
+        with self._lock:
+            stale = [t for t, r in self.runs.items() if r["updated"] < cutoff and t not in self.live_streams]
+            for thread_id in stale:
+                del self.runs[thread_id]
+        if stale:
+            logging.info(f"Cleaned up {len(stale)} stale run records")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "tracked_threads": len(self.runs),
+                "live_streams": sum(self.live_streams.values()),
+                "pending_waiters": sum(len(w) for w in self.waiters.values()),
+            }
+
+    def _resolve(self, future: asyncio.Future, run: Any, source: str):
+        if not future.done():
+            future.set_result(run)
+            self.stats["resolved_by_poll" if source == "poll" else "resolved_by_event"] += 1
+
+run_tracker = RunTracker()
+
+class ConversationStreamStats:
+    """
+    Counters for /conversation SSE streams.
+
+    Streams are async generators served on the event loop, so a stream costs a
+    coroutine and a pooled Azure connection rather than a worker thread. The worker
+    threadpool usage is reported next to the stream counts so that can be checked
+    under load.
+    """
+    def __init__(self):
+        self.active = 0
+        self.stats = {
+            "started": 0,
+            "completed": 0,
+            "disconnected": 0,
+            "peak_active": 0,
+            "first_chunks": 0,
+            "total_first_chunk_seconds": 0.0,
+        }
+
+    def started(self) -> float:
+        """Record a new stream; returns its start time."""
+        self.active += 1
+        self.stats["started"] += 1
+        self.stats["peak_active"] = max(self.stats["peak_active"], self.active)
+        return time.perf_counter()
+
+    def first_chunk(self, started_at: float):
+        self.stats["first_chunks"] += 1
+        self.stats["total_first_chunk_seconds"] += time.perf_counter() - started_at
+
+    def finished(self, disconnected: bool = False):
+        self.active -= 1
+        self.stats["disconnected" if disconnected else "completed"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        first_chunks = self.stats["first_chunks"]
+        stats = {
+            "active": self.active,
+            "started": self.stats["started"],
+            "completed": self.stats["completed"],
+            "disconnected": self.stats["disconnected"],
+            "peak_active": self.stats["peak_active"],
+            "avg_time_to_first_chunk": round(self.stats["total_first_chunk_seconds"] / first_chunks, 4) if first_chunks else None,
+        }
+        try:
+            limiter = anyio.to_thread.current_default_thread_limiter()
+            stats["worker_threads"] = {"total": limiter.total_tokens, "in_use": limiter.borrowed_tokens}
+        except Exception:
+            stats["worker_threads"] = None
+        return stats
+
+conversation_streams = ConversationStreamStats()
+
+# Status updates for long-running operations (pandas analyses)
+OPERATION_STATUS_TTL_SECONDS = int(os.getenv("OPERATION_STATUS_TTL_SECONDS", "3600"))
+OPERATION_STATUS_MAX_ENTRIES = int(os.getenv("OPERATION_STATUS_MAX_ENTRIES", "1000"))
+TERMINAL_OPERATION_STATUSES = {"completed", "error"}
+
+class OperationStatusStore:
+    """
+    Bounded store for operation progress.
+
+    Entries expire after `ttl_seconds` and the least recently updated entries are
+    evicted beyond `max_entries`, so memory stays flat. Subscribers (SSE clients)
+    receive every update for the operation they follow. Updates may come from
+    worker threads.
+    """
+    def __init__(self, max_entries: int = OPERATION_STATUS_MAX_ENTRIES, ttl_seconds: int = OPERATION_STATUS_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"updates": 0, "expired": 0, "evicted": 0}
+
+    def update(self, operation_id: str, status: str, progress: float, message: str, session: Optional[str] = None) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            previous = self.entries.pop(operation_id, None) or {}
+            entry = {
+                "operation_id": operation_id,
+                "session": session or previous.get("session"),
+                "status": status,
+                "progress": progress,
+                "message": message,
+                "created_at": previous.get("created_at", now),
+                "updated_at": now,
+            }
+            self.entries[operation_id] = entry
+            self.stats["updates"] += 1
+            self._evict(now)
+            subscribers = list(self.subscribers.get(operation_id, []))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, dict(entry))
+            except RuntimeError:
+                pass
+        return entry
+
+    def _evict(self, now: float):
+        # Entries are kept in update order, so expired ones are at the front
+        while self.entries:
+            operation_id, entry = next(iter(self.entries.items()))
+            if now - entry["updated_at"] <= self.ttl_seconds:
+                break
+            del self.entries[operation_id]
+            self.stats["expired"] += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def get(self, operation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.entries.get(operation_id)
+            if entry and time.time() - entry["updated_at"] > self.ttl_seconds:
+                del self.entries[operation_id]
+                self.stats["expired"] += 1
+                return None
+            return dict(entry) if entry else None
+
+    def list(self, session: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recently updated operations first, optionally for one session."""
+        with self._lock:
+            self._evict(time.time())
+            matches = [dict(e) for e in reversed(self.entries.values()) if session is None or e["session"] == session]
+        return matches[:limit]
+
+    def subscribe(self, operation_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self.subscribers.setdefault(operation_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, operation_id: str, queue: asyncio.Queue):
+        with self._lock:
+            remaining = [s for s in self.subscribers.get(operation_id, []) if s[1] is not queue]
+            if remaining:
+                self.subscribers[operation_id] = remaining
+            else:
+                self.subscribers.pop(operation_id, None)
+
+    def cleanup(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "subscribers": sum(len(s) for s in self.subscribers.values()),
+            }
+
+operation_status_store = OperationStatusStore()
+
+class ProgressTicker:
+    """
+    Single shared scheduler for operation progress.
+
+    Worker threads report real progress with report(); one asyncio task applies the
+    latest pending update per operation to the status store at a fixed cadence and
+    refreshes running operations that have gone quiet, so clients can tell they are
+    still alive without a thread per request.
+    """
+    def __init__(self, interval: float = 0.5, heartbeat_interval: float = 5.0):
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.pending: Dict[str, Tuple[str, float, str]] = {}
+        self.running: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.task: Optional[asyncio.Task] = None
+
+    def report(self, operation_id: str, status: str, progress: float, message: str):
+        """Queue a progress update; safe to call from any thread."""
+        current = operation_status_store.get(operation_id)
+        if current and current["status"] in TERMINAL_OPERATION_STATUSES:
+            return  # Late report for an operation that already finished
+        now = time.time()
+        with self._lock:
+            self.pending[operation_id] = (status, progress, message)
+            state = self.running.setdefault(operation_id, {"started": now})
+            state.update({"status": status, "progress": progress, "message": message, "last_update": now})
+
+    def callback_for(self, operation_id: str):
+        """Return a progress callback bound to an operation, for PandasAgentManager.analyze."""
+        def callback(status: str, progress: float, message: str):
+            self.report(operation_id, status, progress, message)
+        return callback
+
+    def finish(self, operation_id: str):
+        """Stop tracking an operation; pending updates for it are dropped."""
+        with self._lock:
+            self.pending.pop(operation_id, None)
+            self.running.pop(operation_id, None)
+
+    def flush(self):
+        now = time.time()
+        with self._lock:
+            updates = self.pending
+            self.pending = {}
+            heartbeats = []
+            for operation_id in [o for o, st in self.running.items() if now - st["started"] > operation_status_store.ttl_seconds]:
+                del self.running[operation_id]  # Abandoned without a final status
+            for operation_id, state in self.running.items():
+                if operation_id not in updates and now - state["last_update"] >= self.heartbeat_interval:
+                    state["last_update"] = now
+                    elapsed = int(now - state["started"])
+                    heartbeats.append((operation_id, state["status"], state["progress"], f"{state['message']} ({elapsed}s elapsed)"))
+
+        for operation_id, (status, progress, message) in updates.items():
+            update_operation_status(operation_id, status, progress, message)
+        for operation_id, status, progress, message in heartbeats:
+            operation_status_store.update(operation_id, status, progress, message)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing progress updates: {e}")
+
+progress_ticker = ProgressTicker()
 
 
 # Configure logging
@@ -1702,11 +2641,36 @@ async def startup_event():
             try:
                 await asyncio.sleep(300)  # Run every 5 minutes
                 await thread_lock_manager.cleanup_old_locks()
+                run_tracker.cleanup()
+                operation_status_store.cleanup()
+                # SQLite deletes and the blob store walk run off the event loop
+                await asyncio.to_thread(file_registry.cleanup)
+                referenced = await asyncio.to_thread(file_registry.referenced_paths)
+                await asyncio.to_thread(upload_store.cleanup, referenced=referenced)
             except Exception as e:
                 logging.error(f"Error in periodic cleanup: {e}")
     
+    # Warm up the shared Azure OpenAI clients
+    azure_client_pool.start()
+    
+    # Start the shared progress scheduler
+    progress_ticker.start()
+    
+    # Pre-start the sandbox workers for agent-generated code
+    if PANDAS_AGENT_ISOLATION == "sandbox":
+        sandbox_executor.start()
+    
     # Start the cleanup task
     asyncio.create_task(periodic_cleanup())
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources"""
+    await progress_ticker.stop()
+    pandas_job_pool.shutdown()
+    if PandasAgentManager._instance is not None:
+        PandasAgentManager._instance.shutdown()
+    sandbox_executor.shutdown()
+    await azure_client_pool.close()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Configure based on your needs
@@ -3336,47 +4300,10 @@ async def extract_text_internal(
         logger.error(f"Internal text extraction failed: {str(e)}")
         raise
 
-def sync_wait_for_run_completion(client: AzureOpenAI, thread_id: str, max_wait_time: int = 30) -> bool:
-    """
-    Synchronous version: Wait for any active runs on a thread to complete before proceeding.
-    
-    Args:
-        client: Azure OpenAI client
-        thread_id: Thread ID to check
-        max_wait_time: Maximum seconds to wait
-        
-    Returns:
-        True if thread is ready, False if timeout
-    """
-    start_time = time.time()
-    check_interval = 1  # Check every second
-    
-    while time.time() - start_time < max_wait_time:
-        try:
-            runs = client.beta.threads.runs.list(thread_id=thread_id, limit=1)
-            if not runs.data:
-                return True  # No runs, safe to proceed
-                
-            latest_run = runs.data[0]
-            if latest_run.status not in ["in_progress", "queued", "requires_action"]:
-                return True  # Run is complete
-                
-            logging.info(f"Waiting for run {latest_run.id} to complete (status: {latest_run.status})")
-            time.sleep(check_interval)
-            
-        except Exception as e:
-            logging.warning(f"Error checking run status: {e}")
-            # On error, wait a bit and return True to proceed
-            time.sleep(1)
-            return True
-    
-    logging.warning(f"Timeout waiting for run completion on thread {thread_id}")
-    return False
-
-
-async def wait_for_run_completion(client: AzureOpenAI, thread_id: str, max_wait_time: int = 30) -> bool:
+async def wait_for_run_completion(client: AsyncAzureOpenAI, thread_id: str, max_wait_time: int = 30) -> bool:
     """
     Async version: Wait for any active runs on a thread to complete before proceeding.
+    Resolves from run stream events when available; polls adaptively otherwise.
     
     Args:
         client: Azure OpenAI client
@@ -3386,27 +4313,13 @@ async def wait_for_run_completion(client: AzureOpenAI, thread_id: str, max_wait_
     Returns:
         True if thread is ready, False if timeout
     """
-    start_time = time.time()
-    check_interval = 1  # Check every second
-    
-    while time.time() - start_time < max_wait_time:
-        try:
-            runs = client.beta.threads.runs.list(thread_id=thread_id, limit=1)
-            if not runs.data:
-                return True  # No runs, safe to proceed
-                
-            latest_run = runs.data[0]
-            if latest_run.status not in ["in_progress", "queued", "requires_action"]:
-                return True  # Run is complete
-                
-            logging.info(f"Waiting for run {latest_run.id} to complete (status: {latest_run.status})")
-            await asyncio.sleep(check_interval)
-            
-        except Exception as e:
-            logging.warning(f"Error checking run status: {e}")
-            # On error, wait a bit and return True to proceed
-            await asyncio.sleep(1)
+    try:
+        if await run_tracker.wait_for_idle(client, thread_id, timeout=max_wait_time):
             return True
+    except Exception as e:
+        logging.warning(f"Error checking run status: {e}")
+        # On error, return True to proceed
+        return True
     
     logging.warning(f"Timeout waiting for run completion on thread {thread_id}")
     return False
@@ -3471,7 +4384,7 @@ def get_content_generation_tools():
 
 # Create downloads directory if it doesn't exist
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
-async def get_conversation_context(client, thread_id: str, limit: int = 3) -> str:
+async def get_conversation_context(client: AsyncAzureOpenAI, thread_id: str, limit: int = 3) -> str:
     """
     Get recent conversation context from thread messages.
     
@@ -3484,7 +4397,7 @@ async def get_conversation_context(client, thread_id: str, limit: int = 3) -> st
         Formatted context string
     """
     try:
-        messages = client.beta.threads.messages.list(
+        messages = await client.beta.threads.messages.list(
             thread_id=thread_id,
             order="desc",
             limit=limit + 1  # +1 to skip current message
@@ -3551,7 +4464,7 @@ async def enhance_prompt_with_context(prompt: str, thread_id: str, client, outpu
     
     return enhanced_prompt
 
-async def trim_thread(client: AzureOpenAI, thread_id: str, keep_messages: int = 30):
+async def trim_thread(client: AsyncAzureOpenAI, thread_id: str, keep_messages: int = 30):
     """
     Trim thread to keep only the most recent messages.
     Returns True if trimming was performed, False otherwise.
@@ -3563,7 +4476,7 @@ async def trim_thread(client: AzureOpenAI, thread_id: str, keep_messages: int =
         after = None
         
         while has_more:
-            messages = client.beta.threads.messages.list(
+            messages = await client.beta.threads.messages.list(
                 thread_id=thread_id,
                 order="desc",
                 limit=100,
@@ -3590,7 +4503,7 @@ async def trim_thread(client: AzureOpenAI, thread_id: str, keep_messages: int =
                     if msg_type in ['user_persona_context', 'file_awareness', 'pandas_agent_files', 'pandas_agent_instruction']:
                         continue
                         
-                client.beta.threads.messages.delete(
+                await client.beta.threads.messages.delete(
                     thread_id=thread_id,
                     message_id=msg.id
                 )
@@ -3939,18 +4852,173 @@ def get_downloads_directory():
 
 # Update the global variable
 DOWNLOADS_DIR = get_downloads_directory()
-def create_client() -> AzureOpenAI:
-    """Creates an AzureOpenAI client instance with extended timeout."""
-    return AzureOpenAI(
-        azure_endpoint=AZURE_ENDPOINT,
-        api_key=AZURE_API_KEY,
-        api_version=AZURE_API_VERSION,
-        timeout=120.0,
-        max_retries=3
-    )
-def construct_download_url(request: Request, filename: str) -> str:
+# Shared Azure OpenAI connection pool configuration
+AZURE_POOL_MAX_CONNECTIONS = int(os.getenv("AZURE_POOL_MAX_CONNECTIONS", "100"))
+AZURE_POOL_MAX_KEEPALIVE = int(os.getenv("AZURE_POOL_MAX_KEEPALIVE", "20"))
+AZURE_POOL_KEEPALIVE_EXPIRY = float(os.getenv("AZURE_POOL_KEEPALIVE_EXPIRY", "60"))
+AZURE_CONNECT_TIMEOUT = float(os.getenv("AZURE_CONNECT_TIMEOUT", "10"))
+AZURE_READ_TIMEOUT = float(os.getenv("AZURE_READ_TIMEOUT", "120"))
+AZURE_HTTP2 = os.getenv("AZURE_HTTP2", "true").lower() == "true"
+AZURE_MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "3"))
+
+class AzureClientPool:
     """
-    Construct the download URL for a file.
+    Owns the long-lived Azure OpenAI clients and their keep-alive HTTP connection pools.
+    
+    One AsyncAzureOpenAI (and a sync AzureOpenAI for code that still runs in worker
+    threads) is created at startup and shared by every request, so requests reuse
+    warm TLS connections instead of paying a new handshake each time.
+    Connection reuse is measured with httpcore trace events: every request counts as
+    a pool hit unless it had to open a new TCP connection.
+    """
+    
+    def __init__(self):
+        self._async_client: Optional[AsyncAzureOpenAI] = None
+        self._sync_client: Optional[AzureOpenAI] = None
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._sync_http: Optional[httpx.Client] = None
+        self._create_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "connection_misses": 0,
+            "clients_created": 0
+        }
+        self.http2 = AZURE_HTTP2
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logging.warning("AZURE_HTTP2 requested but the 'h2' package is not installed; using HTTP/1.1")
+                self.http2 = False
+    
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=AZURE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=AZURE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=AZURE_POOL_KEEPALIVE_EXPIRY
+        )
+    
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(AZURE_READ_TIMEOUT, connect=AZURE_CONNECT_TIMEOUT)
+    
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+    
+    def _sync_trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            self._count("connection_misses")
+    
+    async def _async_trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            self._count("connection_misses")
+    
+    def _on_sync_request(self, request: httpx.Request):
+        self._count("requests")
+        request.extensions["trace"] = self._sync_trace
+    
+    async def _on_async_request(self, request: httpx.Request):
+        self._count("requests")
+        request.extensions["trace"] = self._async_trace
+    
+    def start(self):
+        """Create both clients up front so the first request doesn't pay for it."""
+        self.get_async_client()
+        self.get_sync_client()
+        logging.info(
+            f"Azure client pool started (max_connections={AZURE_POOL_MAX_CONNECTIONS}, "
+            f"keepalive={AZURE_POOL_MAX_KEEPALIVE}, http2={self.http2})"
+        )
+    
+    def get_async_client(self) -> AsyncAzureOpenAI:
+        """Return the shared AsyncAzureOpenAI client, creating it on first use."""
+        if self._async_client is None:
+            with self._create_lock:
+                if self._async_client is None:
+                    self._async_http = httpx.AsyncClient(
+                        limits=self._limits(),
+                        timeout=self._timeout(),
+                        http2=self.http2,
+                        event_hooks={"request": [self._on_async_request]}
+                    )
+                    self._async_client = AsyncAzureOpenAI(
+                        azure_endpoint=AZURE_ENDPOINT,
+                        api_key=AZURE_API_KEY,
+                        api_version=AZURE_API_VERSION,
+                        max_retries=AZURE_MAX_RETRIES,
+                        http_client=self._async_http
+                    )
+                    self._count("clients_created")
+        return self._async_client
+    
+    def get_sync_client(self) -> AzureOpenAI:
+        """Return the shared sync AzureOpenAI client, creating it on first use."""
+        if self._sync_client is None:
+            with self._create_lock:
+                if self._sync_client is None:
+                    self._sync_http = httpx.Client(
+                        limits=self._limits(),
+                        timeout=self._timeout(),
+                        http2=self.http2,
+                        event_hooks={"request": [self._on_sync_request]}
+                    )
+                    self._sync_client = AzureOpenAI(
+                        azure_endpoint=AZURE_ENDPOINT,
+                        api_key=AZURE_API_KEY,
+                        api_version=AZURE_API_VERSION,
+                        max_retries=AZURE_MAX_RETRIES,
+                        http_client=self._sync_http
+                    )
+                    self._count("clients_created")
+        return self._sync_client
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return pool configuration and connection hit/miss counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["connection_hits"] = max(stats["requests"] - stats["connection_misses"], 0)
+        stats["hit_rate"] = round(stats["connection_hits"] / stats["requests"], 4) if stats["requests"] else None
+        stats.update({
+            "max_connections": AZURE_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": AZURE_POOL_MAX_KEEPALIVE,
+            "keepalive_expiry": AZURE_POOL_KEEPALIVE_EXPIRY,
+            "http2": self.http2,
+            "async_client_open": self._async_client is not None,
+            "sync_client_open": self._sync_client is not None
+        })
+        return stats
+    
+    async def close(self):
+        """Close both HTTP pools; called from the shutdown hook."""
+        with self._create_lock:
+            async_http, sync_http = self._async_http, self._sync_http
+            self._async_client = self._sync_client = None
+            self._async_http = self._sync_http = None
+        if async_http is not None:
+            try:
+                await async_http.aclose()
+            except Exception as e:
+                logging.warning(f"Error closing async Azure HTTP pool: {e}")
+        if sync_http is not None:
+            try:
+                sync_http.close()
+            except Exception as e:
+                logging.warning(f"Error closing sync Azure HTTP pool: {e}")
+        logging.info("Azure client pool closed")
+
+azure_client_pool = AzureClientPool()
+
+def get_azure_client() -> AzureOpenAI:
+    """FastAPI dependency returning the shared sync AzureOpenAI client."""
+    return azure_client_pool.get_sync_client()
+
+def get_async_azure_client() -> AsyncAzureOpenAI:
+    """FastAPI dependency returning the shared AsyncAzureOpenAI client."""
+    return azure_client_pool.get_async_client()
+def construct_download_url(request: Request, filename: str) -> str:
+    """
+    Construct the download URL for a file.
     
     Args:
         request: FastAPI request object
@@ -4118,253 +5186,2005 @@ def debug_print_files(self, thread_id: str):
     dataframes = self.dataframes_cache.get(thread_id, {})
     debug_output.append(f"\nLoaded DataFrames: {len(dataframes)}")
     
-    for df_name, df in dataframes.items():
+    for df_name in dataframes.keys():
         debug_output.append(f"\nDataFrame: {df_name}")
         try:
-            debug_output.append(f"  Shape: {df.shape}")
-            debug_output.append(f"  Columns: {list(df.columns)}")
-            debug_output.append(f"  Types: {df.dtypes.to_dict()}")
-            
-            # Sample data (first 3 rows)
-            debug_output.append(f"  Sample data (3 rows):")
-            debug_output.append(f"{df.head(3).to_string()}")
-            
-            # Detect potential issues
-            has_nulls = df.isnull().any().any()
-            debug_output.append(f"  Contains nulls: {has_nulls}")
+            # Use the profile computed at registration instead of rescanning the dataframe
+            profile = self.get_profile(thread_id, df_name)
+            if profile:
+                debug_output.append(dataframe_profiler.format_report(df_name, profile))
+                has_nulls = any(entry["null_count"] for entry in profile["column_profiles"])
+                debug_output.append(f"  Contains nulls: {has_nulls}")
+            else:
+                debug_output.append("  Profile not available")
             
         except Exception as e:
             debug_output.append(f"  Error examining dataframe: {str(e)}")
     
     # Return as string
     return "\n".join(debug_output)
-class PandasAgentManager:
-    """
-    Enhanced class to manage pandas agents and dataframes for different threads.
-    Provides thread isolation, FIFO file storage, and prevents duplicate agent creation.
+# Content-addressed upload storage
+UPLOAD_STORE_DIR = os.getenv("UPLOAD_STORE_DIR", os.path.join(tempfile.gettempdir(), "copilot_uploads"))
+UPLOAD_STORE_TTL_HOURS = float(os.getenv("UPLOAD_STORE_TTL_HOURS", "24"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read from the request per iteration
+
+class UploadStore:
     """
+    Content-addressed storage for uploaded files.
     
-    # Class-level singleton instance
-    _instance = None
-    
-    @classmethod
-    def get_instance(cls):
-        """Get or create the singleton instance"""
-        if cls._instance is None:
-            cls._instance = cls()
-        return cls._instance
-    
-    def __init__(self):
-        """Initialize the manager"""
-        # Cache for pandas agents by thread_id
-        self.agents_cache = {}
-        
-        # Cache for dataframes by thread_id
-        self.dataframes_cache = {}
-        
-        # Cache for file info by thread_id
-        self.file_info_cache = {}
-        
-        # Cache for filepaths by thread_id
-        self.file_paths_cache = {}
-        
-        # Maximum files per thread
-        self.max_files_per_thread = 3
-        
-        # Initialize LangChain LLM
-        self.langchain_llm = None
-        
-        # Check for required dependencies
-        self._check_dependencies()
-        
-        logging.info("PandasAgentManager initialized")
+    Uploads are streamed to disk once and stored read-only under their SHA-256
+    digest. Every consumer receives the blob path instead of its own copy, and
+    identical uploads from different sessions share the same blob.
+    """
+    def __init__(self, root_dir: str = UPLOAD_STORE_DIR, ttl_hours: float = UPLOAD_STORE_TTL_HOURS):
+        self.root_dir = root_dir
+        self.blob_dir = os.path.join(root_dir, "blobs")
+        self.staging_dir = os.path.join(root_dir, "staging")
+        self.ttl_seconds = ttl_hours * 3600
+        self.lock = threading.Lock()
+        self.stats = {"stored": 0, "deduplicated": 0, "expired": 0, "bytes_written": 0, "bytes_saved": 0}
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+    
+    def _blob_path(self, digest: str, filename: str) -> str:
+        """Blob location for a digest; the extension is kept so loaders can sniff the type."""
+        ext = os.path.splitext(filename)[1].lower()
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}{ext}")
     
-    def _check_dependencies(self):
-        """Check if required dependencies are available"""
-        missing_deps = []
+    async def save_upload(self, upload: UploadFile, filename: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Stream an upload into the store, hashing it on the way.
         
-        try:
-            import pandas as pd
-            logging.info("Pandas version: %s", pd.__version__)
-        except ImportError:
-            missing_deps.append("pandas")
+        Args:
+            upload: The incoming FastAPI upload
+            filename: Original filename (defaults to upload.filename)
+            
+        Returns:
+            Dict with the blob path, digest, size and whether it was deduplicated
+        """
+        filename = filename or upload.filename or "upload"
+        staging_path = os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
         
         try:
-            import numpy as np
-            logging.info("NumPy version: %s", np.__version__)
-        except ImportError:
-            missing_deps.append("numpy")
+            with open(staging_path, "wb") as staging_file:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    staging_file.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            self._discard(staging_path)
+            raise
+        
+        # The rename, utime and lock in _commit stay off the event loop
+        return await asyncio.to_thread(self._commit, staging_path, digest.hexdigest(), size, filename)
+    
+    def _commit(self, staging_path: str, digest: str, size: int, filename: str) -> Dict[str, Any]:
+        """Move a staged upload into place, or drop it if the blob already exists."""
+        blob_path = self._blob_path(digest, filename)
+        
+        with self.lock:
+            deduplicated = os.path.exists(blob_path)
+            if deduplicated:
+                self._discard(staging_path)
+                os.utime(blob_path)  # Refresh so the shared blob is not expired
+                self.stats["deduplicated"] += 1
+                self.stats["bytes_saved"] += size
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.chmod(staging_path, 0o444)
+                os.replace(staging_path, blob_path)
+                self.stats["stored"] += 1
+                self.stats["bytes_written"] += size
         
+        logging.info(f"{'Reused' if deduplicated else 'Stored'} upload '{filename}' ({size} bytes) as {blob_path}")
+        return {
+            "name": filename,
+            "path": blob_path,
+            "sha256": digest,
+            "size": size,
+            "deduplicated": deduplicated
+        }
+    
+    def _discard(self, path: str):
         try:
-            import tabulate
-            logging.info("Tabulate version: %s", tabulate.__version__)
-        except ImportError:
-            try:
-                # Try to install tabulate automatically
-                import subprocess
-                logging.info("Installing missing tabulate dependency...")
-                subprocess.check_call(["pip", "install", "tabulate"])
-                logging.info("Successfully installed tabulate")
-            except Exception as e:
-                missing_deps.append("tabulate")
-                logging.warning(f"Could not install tabulate: {str(e)}")
-        
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Error removing staged upload {path}: {e}")
+    
+    def touch(self, path: str):
+        """Mark a blob as recently used so cleanup keeps it."""
+        if not path or not os.path.abspath(path).startswith(self.blob_dir + os.sep):
+            return
         try:
-            # Try to import LangChain's create_pandas_dataframe_agent function
-            try:
-                from langchain_experimental.agents import create_pandas_dataframe_agent
-                logging.info("Using langchain_experimental for pandas agent")
-            except ImportError:
-                try:
-                    from langchain.agents import create_pandas_dataframe_agent
-                    logging.info("Using langchain for pandas agent")
-                except ImportError:
-                    missing_deps.append("langchain[experimental]")
-        except Exception as e:
-            missing_deps.append("langchain components")
-            logging.error(f"Error checking for LangChain: {str(e)}")
+            os.utime(path)
+        except OSError:
+            pass
+    
+    def cleanup(self, referenced: Optional[set] = None) -> int:
+        """
+        Remove blobs and staged uploads that have not been used within the TTL.
         
-        if missing_deps:
-            logging.warning(f"Missing dependencies: {', '.join(missing_deps)}")
-            logging.warning("Install them with: pip install " + " ".join(missing_deps))
+        Args:
+            referenced: Blob paths still registered to a session; these are kept
+            
+        Returns:
+            Number of files removed
+        """
+        cutoff = time.time() - self.ttl_seconds
+        referenced = referenced or set()
+        removed = 0
+        
+        for directory in (self.blob_dir, self.staging_dir):
+            for dirpath, _, filenames in os.walk(directory):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if path in referenced:
+                        continue
+                    try:
+                        if os.path.getmtime(path) < cutoff:
+                            os.remove(path)
+                            removed += 1
+                    except OSError:
+                        continue
         
-        return len(missing_deps) == 0
+        if removed:
+            with self.lock:
+                self.stats["expired"] += removed
+            logging.info(f"Removed {removed} expired uploads from {self.root_dir}")
+        return removed
     
-    def get_llm(self):
-        """Get or initialize the LangChain LLM"""
-        if self.langchain_llm is None:
-            try:
-                from langchain_openai import AzureChatOpenAI
-                
-                # Use the existing client configuration
-                self.langchain_llm = AzureChatOpenAI(
-                    azure_endpoint=AZURE_ENDPOINT,
-                    api_key=AZURE_API_KEY,
-                    api_version=AZURE_API_VERSION,
-                    deployment_name="gpt-4o",
-                    temperature=0
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "root_dir": self.root_dir,
+                **self.stats
+            }
+
+# Global upload store
+upload_store = UploadStore()
+
+# Registry of uploaded files per session
+FILE_REGISTRY_PATH = os.getenv("FILE_REGISTRY_PATH", os.path.join(UPLOAD_STORE_DIR, "file_registry.sqlite3"))
+
+class FileRegistry:
+    """
+    Persistent index mapping (session, filename) to a stored upload.
+    
+    Lookups are single primary-key queries against a local SQLite database, so
+    resolving a file never scans the filesystem and never crosses sessions.
+    The registry doubles as the pandas session state: each session's file
+    manifest, plus Parquet snapshots of parsed dataframes keyed by upload digest,
+    so any worker on the host can serve a tool call after a restart.
+    Entries unused for longer than the TTL are garbage collected.
+    """
+    def __init__(self, db_path: str = FILE_REGISTRY_PATH, ttl_hours: float = UPLOAD_STORE_TTL_HOURS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_hours * 3600
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    session TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    file_type TEXT,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (session, name)
                 )
-                logging.info("Initialized LangChain LLM for pandas agents")
-            except Exception as e:
-                logging.error(f"Failed to initialize LangChain LLM: {e}")
-                raise
-        
-        return self.langchain_llm
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_last_used ON files (last_used)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    sha256 TEXT NOT NULL,
+                    sheet TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, sheet)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    sha256 TEXT NOT NULL,
+                    sheet TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, sheet)
+                )
+            """)
     
-    def initialize_thread(self, thread_id: str):
-        """Initialize storage for a thread if it doesn't exist yet"""
-        if thread_id not in self.dataframes_cache:
-            self.dataframes_cache[thread_id] = {}
+    def register(self, session: Optional[str], stored_upload: Dict[str, Any], file_type: Optional[str] = None):
+        """
+        Record a stored upload for a session, replacing any earlier file with the same name.
         
-        if thread_id not in self.file_info_cache:
-            self.file_info_cache[thread_id] = []
-            
-        if thread_id not in self.file_paths_cache:
-            self.file_paths_cache[thread_id] = []
+        Args:
+            session: Thread ID the file belongs to (None for uploads without a session)
+            stored_upload: Result of UploadStore.save_upload
+            file_type: Optional file type label (csv, excel, ...)
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO files (session, name, path, sha256, size, file_type, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (session, name) DO UPDATE SET
+                    path = excluded.path,
+                    sha256 = excluded.sha256,
+                    size = excluded.size,
+                    file_type = excluded.file_type,
+                    last_used = excluded.last_used
+                """,
+                (session or "", stored_upload["name"], stored_upload["path"], stored_upload["sha256"],
+                 stored_upload["size"], file_type, now, now)
+            )
+        logging.info(f"Registered '{stored_upload['name']}' for session {session or '-'} -> {stored_upload['path']}")
     
-    def remove_oldest_file(self, thread_id: str):
+    def lookup(self, session: Optional[str], name: str) -> Optional[Dict[str, Any]]:
         """
-        Remove the oldest file for a thread when max files is reached
+        Find the stored upload registered for a session and filename.
         
         Args:
-            thread_id (str): Thread ID
+            session: Thread ID
+            name: Original filename
             
         Returns:
-            str or None: Name of removed file or None
+            Registry entry as a dict, or None if not registered or the blob is gone
         """
-        if thread_id not in self.file_info_cache or len(self.file_info_cache[thread_id]) <= self.max_files_per_thread:
-            return None
-        
-        # Get the oldest file info
-        oldest_file_info = self.file_info_cache[thread_id][0]
-        oldest_file_name = oldest_file_info.get("name", "")
-        
-        # Remove the file info
-        self.file_info_cache[thread_id].pop(0)
-        
-        # Remove the file path and delete file from disk
-        if thread_id in self.file_paths_cache and len(self.file_paths_cache[thread_id]) > 0:
-            oldest_path = self.file_paths_cache[thread_id].pop(0)
-            # Delete the file from disk
-            if os.path.exists(oldest_path):
-                try:
-                    os.remove(oldest_path)
-                    logging.info(f"Deleted oldest file: {oldest_path} for thread {thread_id}")
-                except Exception as e:
-                    logging.error(f"Error deleting file {oldest_path}: {e}")
-        
-        # Remove any dataframes associated with this file
-        if thread_id in self.dataframes_cache:
-            # For exact filename match
-            if oldest_file_name in self.dataframes_cache[thread_id]:
-                del self.dataframes_cache[thread_id][oldest_file_name]
-                
-            # For Excel sheets with this filename
-            keys_to_remove = []
-            for key in self.dataframes_cache[thread_id].keys():
-                if key.startswith(oldest_file_name + " [Sheet:"):
-                    keys_to_remove.append(key)
-            
-            for key in keys_to_remove:
-                del self.dataframes_cache[thread_id][key]
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM files WHERE session = ? AND name = ?", (session or "", name)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE files SET last_used = ? WHERE session = ? AND name = ?",
+                (time.time(), session or "", name)
+            )
         
-        # Invalidate the agent for this thread since dataframes changed
-        if thread_id in self.agents_cache:
-            self.agents_cache[thread_id] = None
-            
-        return oldest_file_name
-    
-    def add_file(self, thread_id, file_info):
+        entry = dict(row)
+        if not os.path.exists(entry["path"]):
+            logging.warning(f"Registered blob for '{name}' in session {session} is missing: {entry['path']}")
+            return None
+        upload_store.touch(entry["path"])
+        return entry
+    
+    def list_session(self, session: Optional[str]) -> List[Dict[str, Any]]:
+        """All files registered for a session, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM files WHERE session = ? ORDER BY created_at", (session or "",)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def manifest(self, session: Optional[str], filename: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        Add a file to the thread, implementing FIFO if needed.
-        Enhanced to prevent accidental deletion of files needed for follow-up queries.
+        Pandas file manifest for a session, in the file_info shape the agent expects.
         
         Args:
-            thread_id (str): The thread ID
-            file_info (dict): File information dictionary
+            session: Thread ID
+            filename: Optional filename to restrict the manifest to
             
         Returns:
-            tuple: (dict of dataframes or None, error message or None, removed_file or None)
+            List of file info dicts (name, path, type, sha256) whose blobs still exist
         """
-        # Initialize thread storage if needed
-        self.initialize_thread(thread_id)
-        
-        file_name = file_info.get("name", "unnamed_file")
-        file_path = file_info.get("path", None)
-        
-        logging.info(f"Adding file '{file_name}' from path {file_path} to thread {thread_id}")
-        
-        # Verify file exists
-        if not file_path or not os.path.exists(file_path):
-            # Try to locate a matching file in /tmp with a more thorough search
-            located_file_path = self._locate_file_in_tmp(file_name)
-            if located_file_path:
-                logging.info(f"Found alternative path for '{file_name}': {located_file_path}")
-                file_path = located_file_path
-                file_info["path"] = file_path
-            else:
-                error_msg = f"File path for '{file_name}' is invalid or does not exist (path: {file_path})"
-                logging.error(error_msg)
-                
-                # Look for the safe copy that might have been created previously
-                safe_pattern = f"/tmp/safe_*_{re.sub(r'[^a-zA-Z0-9.]', '_', file_name)}"
-                try:
-                    import glob
-                    safe_copies = glob.glob(safe_pattern)
-                    if safe_copies:
-                        newest_safe_copy = max(safe_copies, key=os.path.getctime)
-                        logging.info(f"Found safe copy for '{file_name}': {newest_safe_copy}")
-                        file_path = newest_safe_copy
-                        file_info["path"] = file_path
-                    else:
-                        return None, error_msg, None
-                except Exception as e:
-                    logging.error(f"Error looking for safe copies: {e}")
-                    return None, error_msg, None
-        
-        # Check if we already have this file (same name)
-        existing_file_names = [f.get("name", "") for f in self.file_info_cache[thread_id]]
-        existing_file_index = None
+        files = []
+        for entry in self.list_session(session):
+            if entry["file_type"] not in ("csv", "excel"):
+                continue
+            if filename and entry["name"] != filename:
+                continue
+            if not os.path.exists(entry["path"]):
+                continue
+            files.append({
+                "name": entry["name"],
+                "path": entry["path"],
+                "type": entry["file_type"],
+                "sha256": entry["sha256"]
+            })
+        return files
+    
+    def get_snapshots(self, sha256: str) -> List[Tuple[str, str]]:
+        """
+        Parquet snapshots recorded for an upload digest.
+        
+        Returns:
+            List of (sheet, path) in load order, or an empty list if any file is missing
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT sheet, path FROM snapshots WHERE sha256 = ? ORDER BY position", (sha256,)
+            ).fetchall()
+        snapshots = [(row["sheet"], row["path"]) for row in rows]
+        if any(not os.path.exists(path) for _, path in snapshots):
+            return []
+        return snapshots
+    
+    def save_snapshots(self, sha256: str, snapshots: List[Tuple[str, str]]):
+        """Record the Parquet snapshots written for an upload digest, replacing earlier ones."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("DELETE FROM snapshots WHERE sha256 = ?", (sha256,))
+                self.conn.executemany(
+                    "INSERT INTO snapshots (sha256, sheet, position, path, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(sha256, sheet, position, path, now) for position, (sheet, path) in enumerate(snapshots)]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    def get_snapshot(self, sha256: str, sheet: str) -> Optional[str]:
+        """Path of the Parquet snapshot of one sheet of an upload, if it exists."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path FROM snapshots WHERE sha256 = ? AND sheet = ?", (sha256, sheet)
+            ).fetchone()
+        return row["path"] if row and os.path.exists(row["path"]) else None
+    
+    def save_snapshot(self, sha256: str, sheet: str, position: int, path: str):
+        """Record the Parquet snapshot of a single sheet, keeping the upload's other sheets."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots (sha256, sheet, position, path, created_at) VALUES (?, ?, ?, ?, ?)",
+                (sha256, sheet, position, path, time.time())
+            )
+    
+    def get_profile(self, sha256: str, sheet: str) -> Optional[Dict[str, Any]]:
+        """Stored dataframe profile for an upload digest and sheet ('' for single-frame files)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT profile FROM profiles WHERE sha256 = ? AND sheet = ?", (sha256, sheet)
+            ).fetchone()
+        return json.loads(row["profile"]) if row else None
+    
+    def get_profiles(self, sha256: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """All stored profiles for an upload digest as (sheet, profile) pairs."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT sheet, profile FROM profiles WHERE sha256 = ? ORDER BY created_at, sheet", (sha256,)
+            ).fetchall()
+        return [(row["sheet"], json.loads(row["profile"])) for row in rows]
+    
+    def save_profile(self, sha256: str, sheet: str, profile: Dict[str, Any]):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO profiles (sha256, sheet, profile, created_at) VALUES (?, ?, ?, ?)",
+                (sha256, sheet, json.dumps(profile), time.time())
+            )
+    
+    def referenced_paths(self) -> set:
+        """Blob paths that are still registered to some session."""
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT path FROM files").fetchall()
+        return {row["path"] for row in rows}
+    
+    def cleanup(self) -> int:
+        """Drop entries that have not been used within the TTL."""
+        cutoff = time.time() - self.ttl_seconds
+        with self.lock:
+            removed = self.conn.execute("DELETE FROM files WHERE last_used < ?", (cutoff,)).rowcount
+            # Snapshots are only useful while some session still references the upload
+            orphaned = self.conn.execute(
+                "SELECT path FROM snapshots WHERE sha256 NOT IN (SELECT sha256 FROM files)"
+            ).fetchall()
+            self.conn.execute("DELETE FROM snapshots WHERE sha256 NOT IN (SELECT sha256 FROM files)")
+            self.conn.execute("DELETE FROM profiles WHERE sha256 NOT IN (SELECT sha256 FROM files)")
+        
+        for row in orphaned:
+            try:
+                os.remove(row["path"])
+            except OSError:
+                pass
+        if removed or orphaned:
+            logging.info(f"Removed {removed} expired file registry entries and {len(orphaned)} dataframe snapshots")
+        return removed
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS entries, COUNT(DISTINCT session) AS sessions, COUNT(DISTINCT path) AS blobs FROM files"
+            ).fetchone()
+            snapshot_count = self.conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        return {"db_path": self.db_path, "snapshots": snapshot_count, **dict(row)}
+
+# Global file registry
+file_registry = FileRegistry()
+
+# Pandas agent job pool configuration
+PANDAS_AGENT_MAX_WORKERS = int(os.getenv("PANDAS_AGENT_MAX_WORKERS", "4"))
+PANDAS_AGENT_MAX_QUEUE = int(os.getenv("PANDAS_AGENT_MAX_QUEUE", "8"))
+PANDAS_AGENT_RETRY_AFTER = int(os.getenv("PANDAS_AGENT_RETRY_AFTER", "15"))
+# "thread" runs agents in the job pool threads; "process" runs each agent in a worker
+# process that loads Parquet snapshots of the thread's dataframes; "sandbox" keeps the
+# agent in the job pool threads but executes its generated code in resource-limited workers
+PANDAS_AGENT_ISOLATION = os.getenv("PANDAS_AGENT_ISOLATION", "thread").lower()
+PANDAS_AGENT_PROCESS_TIMEOUT = int(os.getenv("PANDAS_AGENT_PROCESS_TIMEOUT", "180"))
+PANDAS_SNAPSHOT_DIR = os.getenv("PANDAS_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "pandas_snapshots"))
+
+# Sandbox workers for agent-generated code (PANDAS_AGENT_ISOLATION=sandbox)
+PANDAS_SANDBOX_WORKERS = int(os.getenv("PANDAS_SANDBOX_WORKERS", str(PANDAS_AGENT_MAX_WORKERS)))
+PANDAS_SANDBOX_CPU_SECONDS = int(os.getenv("PANDAS_SANDBOX_CPU_SECONDS", "60"))  # CPU time per code execution
+PANDAS_SANDBOX_WALL_SECONDS = int(os.getenv("PANDAS_SANDBOX_WALL_SECONDS", "120"))  # Wall time per code execution
+PANDAS_SANDBOX_MEMORY_MB = int(os.getenv("PANDAS_SANDBOX_MEMORY_MB", "2048"))  # Resident memory per worker
+# Dataframes are shared with the workers as Arrow files on tmpfs, memory-mapped read-only
+PANDAS_SANDBOX_SHM_DIR = os.getenv(
+    "PANDAS_SANDBOX_SHM_DIR",
+    "/dev/shm/copilot_frames" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "copilot_frames")
+)
+SANDBOX_START_TIMEOUT = 120  # Seconds a new worker may take to import the application
+
+class PandasJobsBusyError(Exception):
+    """Raised when the pandas job pool is full; carries a retry hint in seconds."""
+    def __init__(self, retry_after: int, in_flight: int):
+        self.retry_after = retry_after
+        self.in_flight = in_flight
+        super().__init__(f"Data analysis is at capacity ({in_flight} jobs in flight); retry after {retry_after}s")
+
+class PandasJobPool:
+    """
+    Bounded worker pool for pandas agent jobs.
+
+    At most `max_workers` jobs run at once and at most `max_queue` wait behind them;
+    anything beyond that is rejected immediately with PandasJobsBusyError so callers
+    can answer with 429/retry_after instead of piling up work. Async callers await
+    the result without blocking the event loop.
+    """
+    def __init__(self, max_workers: int = PANDAS_AGENT_MAX_WORKERS, max_queue: int = PANDAS_AGENT_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pandas-agent")
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "total_run_time": 0.0, "total_queue_time": 0.0}
+
+    def _admit(self):
+        with self._lock:
+            in_flight = self.running + self.queued
+            if in_flight >= self.max_workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise PandasJobsBusyError(self._retry_after(), in_flight)
+            self.queued += 1
+            self.stats["submitted"] += 1
+
+    def _retry_after(self) -> int:
+        # Rough estimate: time for the queue ahead to drain, never below the configured floor
+        finished = self.stats["completed"] + self.stats["failed"]
+        avg_run_time = self.stats["total_run_time"] / finished if finished else 0
+        estimate = avg_run_time * (self.queued + 1) / max(self.max_workers, 1)
+        return int(max(PANDAS_AGENT_RETRY_AFTER, estimate))
+
+    def _wrap(self, fn, args, kwargs):
+        submitted_at = time.time()
+
+        def job():
+            started_at = time.time()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.stats["total_queue_time"] += started_at - submitted_at
+            try:
+                result = fn(*args, **kwargs)
+                with self._lock:
+                    self.stats["completed"] += 1
+                return result
+            except Exception:
+                with self._lock:
+                    self.stats["failed"] += 1
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.stats["total_run_time"] += time.time() - started_at
+        return job
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a job in the pool and await its result (raises PandasJobsBusyError when full)."""
+        self._admit()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._wrap(fn, args, kwargs))
+
+    def run_sync(self, fn, *args, **kwargs):
+        """Blocking variant for callers already on a worker thread (e.g. the streaming generator)."""
+        self._admit()
+        return self.executor.submit(self._wrap(fn, args, kwargs)).result()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.stats["completed"] + self.stats["failed"]
+            started = finished + self.running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.queued,
+                "submitted": self.stats["submitted"],
+                "completed": self.stats["completed"],
+                "failed": self.stats["failed"],
+                "rejected": self.stats["rejected"],
+                "avg_run_time": round(self.stats["total_run_time"] / finished, 3) if finished else 0.0,
+                "avg_queue_time": round(self.stats["total_queue_time"] / started, 3) if started else 0.0,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+pandas_job_pool = PandasJobPool()
+
+# Global memory budget for dataframes held by PandasAgentManager
+PANDAS_CACHE_MAX_BYTES = int(float(os.getenv("PANDAS_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+# Ingestion tuning for CSV/Excel uploads
+CSV_SNIFF_BYTES = 1024 * 1024  # Sample used to detect encoding and delimiter
+CATEGORY_MAX_UNIQUE_RATIO = 0.05  # Strings become categoricals only when distinct values are at most this share of rows...
+CATEGORY_MAX_UNIQUE = 1000  # ...and no more than this many
+
+def sniff_csv_format(file_path: str, sample_size: int = CSV_SNIFF_BYTES) -> Tuple[str, str]:
+    """
+    Detect encoding and delimiter of a CSV file from a sample, without parsing the whole file.
+    
+    Args:
+        file_path: Path to the CSV file
+        sample_size: Number of bytes to sample
+        
+    Returns:
+        Tuple of (encoding, delimiter)
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+    
+    # Byte order marks are authoritative
+    if sample.startswith(b'\xef\xbb\xbf'):
+        encoding = 'utf-8-sig'
+    elif sample.startswith((b'\xff\xfe', b'\xfe\xff')):
+        encoding = 'utf-16'
+    else:
+        try:
+            sample.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off at the end of the sample is still UTF-8
+            if len(sample) == sample_size and e.start >= len(sample) - 3:
+                encoding = 'utf-8'
+            else:
+                detected = chardet.detect(sample[:64 * 1024])
+                encoding = detected.get('encoding') or 'latin-1'
+    
+    text = sample.decode(encoding, errors='ignore')
+    lines = [line for line in text.splitlines()[:50] if line.strip()]
+    # Drop the last line of a truncated sample; it is probably incomplete
+    if len(sample) == sample_size and len(lines) > 1:
+        lines = lines[:-1]
+    
+    delimiter = ','
+    if lines:
+        try:
+            delimiter = csv.Sniffer().sniff("\n".join(lines), delimiters=",;\t|").delimiter
+        except csv.Error:
+            # Pick the candidate that appears most consistently across lines
+            best_score = 0
+            for candidate in [',', ';', '\t', '|']:
+                counts = [line.count(candidate) for line in lines]
+                if min(counts) > 0 and min(counts) * len(counts) > best_score:
+                    best_score = min(counts) * len(counts)
+                    delimiter = candidate
+    
+    return encoding, delimiter
+
+def optimize_dataframe_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep columns in compact native dtypes: nullable integers/floats/booleans,
+    parsed datetimes for date-like text, and categoricals for low-cardinality strings.
+    
+    Args:
+        df: DataFrame to convert
+        
+    Returns:
+        The converted DataFrame
+    """
+    df = df.convert_dtypes(dtype_backend="numpy_nullable")
+    row_count = len(df)
+    
+    for column in df.columns:
+        series = df[column]
+        if not (pd.api.types.is_string_dtype(series.dtype) or series.dtype == object):
+            continue
+        
+        non_null = series.dropna()
+        if non_null.empty:
+            continue
+        
+        # Date-like text: at least 90% of a sample must parse, and the column must not be plain numbers
+        sample = non_null.head(200).astype(str)
+        if sample.str.contains(r'\d', regex=True).all() and not sample.str.fullmatch(r'[-+]?\d+(\.\d+)?').all():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                parsed_sample = pd.to_datetime(sample, errors='coerce', format='mixed')
+            if parsed_sample.notna().mean() >= 0.9:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    parsed = pd.to_datetime(series, errors='coerce', format='mixed')
+                if parsed.notna().sum() >= 0.9 * len(non_null):
+                    df[column] = parsed
+                    continue
+        
+        distinct = non_null.nunique()
+        if row_count and distinct <= CATEGORY_MAX_UNIQUE and distinct <= CATEGORY_MAX_UNIQUE_RATIO * row_count:
+            df[column] = series.astype('category')
+    
+    return df
+
+class ThreadDataFrames(dict):
+    """Dataframes of one thread; reports changes to its DataFrameCache so sizes stay current."""
+    def __init__(self, cache, thread_id, frames=None):
+        super().__init__()
+        self.cache = cache
+        self.thread_id = thread_id
+        self.sizes: Dict[str, int] = {}
+        if frames:
+            self.update(frames)
+
+    def __setitem__(self, name, df):
+        super().__setitem__(name, df)
+        self.sizes[name] = DataFrameCache.measure(df)
+        self.cache._resized(self.thread_id)
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.sizes.pop(name, None)
+        self.cache._resized(self.thread_id)
+
+    def update(self, *args, **kwargs):
+        for name, df in dict(*args, **kwargs).items():
+            super().__setitem__(name, df)
+            self.sizes[name] = DataFrameCache.measure(df)
+        self.cache._resized(self.thread_id)
+
+    def pop(self, name, *default):
+        self.sizes.pop(name, None)
+        value = super().pop(name, *default)
+        self.cache._resized(self.thread_id)
+        return value
+
+    def clear(self):
+        super().clear()
+        self.sizes.clear()
+        self.cache._resized(self.thread_id)
+
+    def total_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+class DataFrameCache:
+    """
+    Per-thread dataframe storage under a global memory budget.
+
+    Behaves like the dict of dicts it replaces (cache[thread_id][name] = df). Sizes are
+    measured with DataFrame.memory_usage(deep=True); when the total exceeds the budget the
+    least recently used threads are evicted. An evicted thread is reloaded from disk
+    through `loader` the next time it is accessed.
+    """
+    def __init__(self, max_bytes: int = PANDAS_CACHE_MAX_BYTES, loader=None, on_evict=None):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.on_evict = on_evict
+        self.entries: "OrderedDict[str, ThreadDataFrames]" = OrderedDict()
+        self.evicted: set = set()
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "reloads": 0, "reload_failures": 0}
+
+    @staticmethod
+    def measure(df) -> int:
+        try:
+            return int(df.memory_usage(deep=True).sum())
+        except Exception:
+            return 0
+
+    def __contains__(self, thread_id) -> bool:
+        with self._lock:
+            return thread_id in self.entries or thread_id in self.evicted
+
+    def __getitem__(self, thread_id) -> ThreadDataFrames:
+        with self._lock:
+            frames = self.entries.get(thread_id)
+            if frames is not None:
+                self.stats["hits"] += 1
+                self.entries.move_to_end(thread_id)
+                return frames
+            if thread_id not in self.evicted:
+                raise KeyError(thread_id)
+            self.stats["misses"] += 1
+            self.evicted.discard(thread_id)
+
+        # Reload outside the lock; file reads can be slow
+        loaded = {}
+        if self.loader:
+            try:
+                loaded = self.loader(thread_id) or {}
+                self.stats["reloads"] += 1
+                logging.info(f"Reloaded {len(loaded)} dataframe(s) for thread {thread_id} after eviction")
+            except Exception as e:
+                self.stats["reload_failures"] += 1
+                logging.error(f"Failed to reload dataframes for thread {thread_id}: {e}")
+
+        with self._lock:
+            frames = self.entries.get(thread_id)
+            if frames is None:
+                frames = ThreadDataFrames(self, thread_id)
+                self.entries[thread_id] = frames
+                frames.update(loaded)
+            return frames
+
+    def __setitem__(self, thread_id, frames):
+        with self._lock:
+            self.evicted.discard(thread_id)
+            self.entries[thread_id] = ThreadDataFrames(self, thread_id)
+            self.entries[thread_id].update(frames or {})
+
+    def __delitem__(self, thread_id):
+        with self._lock:
+            found = self.entries.pop(thread_id, None) is not None or thread_id in self.evicted
+            self.evicted.discard(thread_id)
+        if not found:
+            raise KeyError(thread_id)
+
+    def get(self, thread_id, default=None):
+        return self[thread_id] if thread_id in self else default
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(frames.total_bytes() for frames in self.entries.values())
+
+    def _resized(self, thread_id):
+        """Enforce the budget after a thread's dataframes changed."""
+        to_evict = []
+        with self._lock:
+            if thread_id in self.entries:
+                self.entries.move_to_end(thread_id)
+            total = sum(frames.total_bytes() for frames in self.entries.values())
+            for candidate in list(self.entries.keys()):
+                if total <= self.max_bytes:
+                    break
+                if candidate == thread_id:
+                    continue  # Never evict the thread being worked on
+                frames = self.entries.pop(candidate)
+                total -= frames.total_bytes()
+                self.evicted.add(candidate)
+                self.stats["evictions"] += 1
+                to_evict.append((candidate, frames.total_bytes()))
+
+        for candidate, size in to_evict:
+            logging.info(f"Evicted dataframes for thread {candidate} ({size / (1024 * 1024):.1f} MB) to stay within memory budget")
+            if self.on_evict:
+                try:
+                    self.on_evict(candidate)
+                except Exception as e:
+                    logging.warning(f"Error releasing resources for evicted thread {candidate}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "resident_bytes": sum(frames.total_bytes() for frames in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "threads_resident": len(self.entries),
+                "threads_evicted": len(self.evicted),
+            }
+
+# Excel workbooks with at least this many sheets are loaded one sheet at a time
+EXCEL_LAZY_SHEET_THRESHOLD = int(os.getenv("EXCEL_LAZY_SHEET_THRESHOLD", "4"))
+EXCEL_OPEN_WORKBOOKS_MAX = 16  # Workbook handles kept open for on-demand sheet parsing
+
+class LazyWorkbook:
+    """
+    Excel workbook whose sheets are parsed on demand.
+
+    Sheet names are read from the workbook metadata without parsing any cells. A sheet
+    is parsed the first time it is requested (calamine when installed, otherwise
+    openpyxl in read-only mode) and cached as a Parquet snapshot keyed by the upload
+    digest, so later requests from any worker read Arrow data instead of the XML.
+    """
+    def __init__(self, path: str, sha256: Optional[str] = None):
+        self.path = path
+        self.sha256 = sha256
+        self.excel_file = None
+        self.lock = threading.Lock()
+        self.sheet_names = self._read_sheet_names()
+
+    @property
+    def lazy(self) -> bool:
+        return len(self.sheet_names) >= EXCEL_LAZY_SHEET_THRESHOLD
+
+    def _read_sheet_names(self) -> List[str]:
+        import zipfile
+        import xml.etree.ElementTree as ET
+
+        # .xlsx/.xlsm files list their sheets in xl/workbook.xml; no worksheet needs to be read
+        if zipfile.is_zipfile(self.path):
+            try:
+                with zipfile.ZipFile(self.path) as archive:
+                    root = ET.fromstring(archive.read("xl/workbook.xml"))
+                names = [sheet.get("name") for sheet in root.iterfind("{*}sheets/{*}sheet")]
+                if names:
+                    return names
+            except Exception as e:
+                logging.warning(f"Could not read sheet names from workbook metadata of {self.path}: {e}")
+
+        with pd.ExcelFile(self.path) as xls:
+            return list(xls.sheet_names)
+
+    def _open(self):
+        if CALAMINE_AVAILABLE:
+            try:
+                return pd.ExcelFile(self.path, engine="calamine")
+            except Exception as e:
+                # Older pandas releases have no calamine engine
+                logging.warning(f"Calamine engine unavailable, falling back to openpyxl: {e}")
+        return pd.ExcelFile(self.path, engine="openpyxl")
+
+    def parse(self, sheet_name: str) -> pd.DataFrame:
+        """Parse one sheet from the workbook, keeping the workbook open for further sheets."""
+        with self.lock:
+            if self.excel_file is None:
+                self.excel_file = self._open()
+            df = self.excel_file.parse(sheet_name, dtype_backend="numpy_nullable")
+        df.columns = df.columns.astype(str).str.strip()
+        return optimize_dataframe_dtypes(df)
+
+    def load_sheet(self, sheet_name: str) -> Tuple[pd.DataFrame, bool]:
+        """
+        Load one sheet, from its Parquet snapshot when available.
+
+        Args:
+            sheet_name: Name of the sheet in the workbook
+
+        Returns:
+            Tuple of (dataframe, whether it came from a snapshot)
+        """
+        if sheet_name not in self.sheet_names:
+            raise KeyError(f"Sheet '{sheet_name}' not found. Available sheets: {self.sheet_names}")
+
+        use_snapshots = bool(self.sha256) and PYARROW_AVAILABLE
+        snapshot_path = file_registry.get_snapshot(self.sha256, sheet_name) if use_snapshots else None
+        if snapshot_path:
+            try:
+                return pd.read_parquet(snapshot_path, engine="pyarrow"), True
+            except Exception as e:
+                logging.warning(f"Could not read snapshot of sheet '{sheet_name}', parsing the workbook: {e}")
+
+        start_time = time.perf_counter()
+        df = self.parse(sheet_name)
+        logging.info(f"Parsed sheet '{sheet_name}' of {self.path} in {time.perf_counter() - start_time:.2f}s. Shape: {df.shape}")
+
+        if use_snapshots:
+            try:
+                snapshot_dir = os.path.join(PANDAS_SNAPSHOT_DIR, "uploads", self.sha256)
+                os.makedirs(snapshot_dir, exist_ok=True)
+                position = self.sheet_names.index(sheet_name)
+                path = os.path.join(snapshot_dir, f"{position}.parquet")
+                staging_path = f"{path}.{uuid.uuid4().hex}.part"
+                df.to_parquet(staging_path, engine="pyarrow")
+                os.replace(staging_path, path)
+                file_registry.save_snapshot(self.sha256, sheet_name, position, path)
+            except Exception as e:
+                logging.warning(f"Could not snapshot sheet '{sheet_name}': {e}")
+
+        return df, False
+
+    def close(self):
+        with self.lock:
+            if self.excel_file is not None:
+                try:
+                    self.excel_file.close()
+                except Exception:
+                    pass
+                self.excel_file = None
+
+# CSVs at least this large are queried out of core (Parquet chunks + DuckDB) instead of loaded into pandas
+PANDAS_OUT_OF_CORE_THRESHOLD_MB = int(os.getenv("PANDAS_OUT_OF_CORE_THRESHOLD_MB", "512"))
+PANDAS_OUT_OF_CORE_MEMORY_MB = int(os.getenv("PANDAS_OUT_OF_CORE_MEMORY_MB", "1024"))
+OUT_OF_CORE_THREADS = 2  # DuckDB worker threads; memory use grows with parallelism
+
+class OutOfCoreEngine:
+    """
+    Embedded DuckDB database shared by every out-of-core table.
+
+    A single database enforces one memory limit across all sessions' queries; operators
+    that exceed it spill to disk under PANDAS_SNAPSHOT_DIR instead of growing the process.
+    """
+    def __init__(self, memory_mb: int = PANDAS_OUT_OF_CORE_MEMORY_MB):
+        self.memory_mb = memory_mb
+        self.conn = None
+        self.lock = threading.Lock()
+        self.stats = {"tables_ingested": 0, "tables_reused": 0, "bytes_ingested": 0, "ingest_seconds_total": 0.0, "queries": 0}
+
+    @staticmethod
+    def quote(value: str) -> str:
+        """SQL string literal."""
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def cursor(self):
+        """New cursor on the shared database; each cursor may be used by one thread at a time."""
+        with self.lock:
+            if self.conn is None:
+                spill_dir = os.path.join(PANDAS_SNAPSHOT_DIR, "duckdb_spill")
+                os.makedirs(spill_dir, exist_ok=True)
+                self.conn = duckdb.connect(database=":memory:", config={
+                    "memory_limit": f"{self.memory_mb}MB",
+                    "temp_directory": spill_dir,
+                    "threads": OUT_OF_CORE_THREADS,
+                })
+                logging.info(f"Started out-of-core engine with a {self.memory_mb} MB memory limit")
+            return self.conn.cursor()
+
+    def ingest_csv(self, file_path: str, sha256: Optional[str] = None) -> str:
+        """
+        Convert a CSV to Parquet chunks without loading it into memory.
+
+        Args:
+            file_path: Path of the stored upload
+            sha256: Upload digest; chunks are shared by identical uploads
+
+        Returns:
+            Glob matching the Parquet chunks
+        """
+        key = sha256 or hashlib.sha256(f"{file_path}:{os.path.getmtime(file_path)}".encode()).hexdigest()
+        chunk_dir = os.path.join(PANDAS_SNAPSHOT_DIR, "uploads", key, "chunks")
+        chunk_glob = os.path.join(chunk_dir, "*.parquet")
+        if os.path.isdir(chunk_dir) and any(name.endswith(".parquet") for name in os.listdir(chunk_dir)):
+            with self.lock:
+                self.stats["tables_reused"] += 1
+            return chunk_glob
+
+        encoding, delimiter = sniff_csv_format(file_path)
+        options = [f"delim = {self.quote(delimiter)}", "header = true"]
+        if encoding.lower() in ("latin-1", "iso-8859-1", "cp1252", "windows-1252"):
+            options.append("encoding = 'latin-1'")
+        elif encoding.lower().startswith("utf-16"):
+            options.append("encoding = 'utf-16'")
+
+        # Write to a staging directory so readers never see a partial set of chunks
+        staging_dir = f"{chunk_dir}.{uuid.uuid4().hex}.part"
+        os.makedirs(os.path.dirname(chunk_dir), exist_ok=True)  # COPY does not create parent directories
+        start_time = time.perf_counter()
+        cursor = self.cursor()
+        try:
+            cursor.execute(
+                f"COPY (SELECT * FROM read_csv({self.quote(file_path)}, {', '.join(options)})) "
+                f"TO {self.quote(staging_dir)} (FORMAT PARQUET, PER_THREAD_OUTPUT TRUE)"
+            )
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        finally:
+            cursor.close()
+
+        if os.path.isdir(chunk_dir):
+            # Another worker finished the same upload first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        else:
+            os.rename(staging_dir, chunk_dir)
+
+        elapsed = time.perf_counter() - start_time
+        with self.lock:
+            self.stats["tables_ingested"] += 1
+            self.stats["bytes_ingested"] += os.path.getsize(file_path)
+            self.stats["ingest_seconds_total"] += elapsed
+        logging.info(f"Ingested {file_path} into Parquet chunks in {elapsed:.1f}s")
+        return chunk_glob
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "available": DUCKDB_AVAILABLE, "memory_limit_mb": self.memory_mb,
+                    "threshold_mb": PANDAS_OUT_OF_CORE_THRESHOLD_MB, "started": self.conn is not None}
+
+# Global out-of-core engine
+out_of_core_engine = OutOfCoreEngine()
+
+class OutOfCoreTable:
+    """
+    A CSV too large for memory, stored as Parquet chunks and queried lazily through DuckDB.
+
+    Bound to the agent in place of a pandas DataFrame. Only query results become pandas
+    frames; sql() refers to the table as 'df'. Other attributes are delegated to the
+    underlying DuckDB relation (filter, aggregate, project, limit, ...).
+    """
+    def __init__(self, name: str, chunk_glob: str):
+        self.name = name
+        self.chunk_glob = chunk_glob
+        # Identical uploads share chunks, so the chunk location identifies the content
+        self.fingerprint = chunk_glob
+        self.cursor = out_of_core_engine.cursor()
+        self.relation = self.cursor.read_parquet(chunk_glob)
+        self.columns = list(self.relation.columns)
+        self.dtypes = {column: str(dtype) for column, dtype in zip(self.relation.columns, self.relation.types)}
+        # Row counts come from the Parquet footers
+        row_count = self.cursor.execute(
+            f"SELECT count(*) FROM read_parquet({OutOfCoreEngine.quote(chunk_glob)})"
+        ).fetchone()[0]
+        self.shape = (row_count, len(self.columns))
+
+    def sql(self, query: str) -> pd.DataFrame:
+        """Run SQL against the table (named 'df' in the query) and return the result as pandas."""
+        with out_of_core_engine.lock:
+            out_of_core_engine.stats["queries"] += 1
+        return self.relation.query("df", query).df()
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return self.relation.limit(n).df()
+
+    def sample(self, n: int = 5) -> pd.DataFrame:
+        return self.sql(f"SELECT * FROM df USING SAMPLE {int(n)} ROWS")
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getattr__(self, name):
+        if name == "relation":
+            raise AttributeError(name)
+        return getattr(self.relation, name)
+
+    def __repr__(self) -> str:
+        return f"<OutOfCoreTable '{self.name}' rows={self.shape[0]} columns={self.columns}>"
+
+PROFILE_TOP_K = 5  # Most frequent values kept per column
+PROFILE_HLL_PRECISION = 12  # 4096 HyperLogLog registers, ~1.6% standard error
+PROFILE_SAMPLE_ROWS = 5
+PROFILE_PROMPT_MAX_COLUMNS = 30  # Columns described in agent prompts and fallbacks
+
+class DataFrameProfiler:
+    """
+    Compact per-column profiles computed once when a file is registered.
+    
+    A profile holds row/column counts, memory use, a few sample rows and, per
+    column: dtype, null count, a HyperLogLog distinct estimate, min/max,
+    quartiles and top-k values. Profiles are JSON-serializable so they can be
+    persisted in the file registry and served without touching the dataframe.
+    """
+    @staticmethod
+    def _json_value(value):
+        """Convert numpy/pandas scalars into JSON-friendly values."""
+        if value is None:
+            return None
+        try:
+            if pd.isna(value):
+                return None
+        except (TypeError, ValueError):
+            pass
+        if isinstance(value, (bool, np.bool_)):
+            return bool(value)
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        if isinstance(value, (float, np.floating)):
+            return float(value)
+        if isinstance(value, str):
+            return value
+        return str(value)
+    
+    @staticmethod
+    def estimate_distinct(series: pd.Series, precision: int = PROFILE_HLL_PRECISION) -> int:
+        """
+        HyperLogLog estimate of the number of distinct non-null values.
+        
+        Args:
+            series: Column to estimate
+            precision: Number of index bits (2**precision registers)
+            
+        Returns:
+            Estimated distinct count
+        """
+        values = series.dropna()
+        if values.empty:
+            return 0
+        
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        register_count = 1 << precision
+        remaining_bits = 64 - precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << remaining_bits) - 1)
+        
+        # Rank = position of the leftmost 1-bit within the remaining bits (frexp exponent = bit length)
+        _, bit_length = np.frexp(remainder.astype(np.float64))
+        rank = (remaining_bits - bit_length + 1).astype(np.uint8)
+        registers = np.zeros(register_count, dtype=np.uint8)
+        np.maximum.at(registers, index, rank)
+        
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count * register_count / np.sum(np.power(2.0, -registers.astype(np.float64)))
+        empty_registers = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * register_count and empty_registers:
+            # Small-range correction (linear counting)
+            estimate = register_count * np.log(register_count / empty_registers)
+        return int(round(min(estimate, len(values))))
+    
+    def profile(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Profile a dataframe.
+        
+        Args:
+            df: Dataframe to profile
+            
+        Returns:
+            JSON-serializable profile dict
+        """
+        column_profiles = []
+        for column in df.columns:
+            series = df[column]
+            entry = {
+                "name": str(column),
+                "dtype": str(series.dtype),
+                "null_count": int(series.isna().sum()),
+            }
+            try:
+                entry["distinct_estimate"] = self.estimate_distinct(series)
+            except Exception:
+                entry["distinct_estimate"] = None  # e.g. unhashable cell values
+            
+            is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+            if is_numeric or pd.api.types.is_datetime64_any_dtype(series):
+                non_null = series.dropna()
+                if not non_null.empty:
+                    entry["min"] = self._json_value(non_null.min())
+                    entry["max"] = self._json_value(non_null.max())
+                    if is_numeric:
+                        quartiles = non_null.quantile([0.25, 0.5, 0.75])
+                        entry["mean"] = self._json_value(non_null.mean())
+                        entry["quantiles"] = {
+                            "p25": self._json_value(quartiles.loc[0.25]),
+                            "p50": self._json_value(quartiles.loc[0.5]),
+                            "p75": self._json_value(quartiles.loc[0.75]),
+                        }
+            
+            if not is_numeric or (entry["distinct_estimate"] or 0) <= 20:
+                try:
+                    counts = series.value_counts(dropna=True).head(PROFILE_TOP_K)
+                    entry["top_values"] = [
+                        {"value": self._json_value(value), "count": int(count)} for value, count in counts.items()
+                    ]
+                except Exception:
+                    pass
+            column_profiles.append(entry)
+        
+        sample = df.head(PROFILE_SAMPLE_ROWS)
+        return {
+            "rows": int(len(df)),
+            "columns": int(len(df.columns)),
+            "memory_bytes": int(df.memory_usage(deep=True).sum()),
+            "column_profiles": column_profiles,
+            "sample": [
+                {str(key): self._json_value(value) for key, value in row.items()}
+                for row in sample.to_dict(orient="records")
+            ],
+            "profiled_at": datetime.now().isoformat(),
+        }
+    
+    @staticmethod
+    def describe_column(entry: Dict[str, Any]) -> str:
+        """One-line description of a column profile."""
+        parts = [entry["dtype"]]
+        if entry.get("null_count"):
+            parts.append(f"{entry['null_count']:,} nulls")
+        if entry.get("distinct_estimate") is not None:
+            parts.append(f"~{entry['distinct_estimate']:,} distinct")
+        if "min" in entry:
+            parts.append(f"range {entry['min']} to {entry['max']}")
+        if entry.get("quantiles"):
+            parts.append(f"median {entry['quantiles']['p50']}")
+        if entry.get("top_values"):
+            parts.append("top: " + ", ".join(f"{item['value']} ({item['count']:,})" for item in entry["top_values"][:3]))
+        return f"{entry['name']} ({'; '.join(parts)})"
+    
+    def prompt_summary(self, profile: Dict[str, Any], max_columns: int = PROFILE_PROMPT_MAX_COLUMNS) -> str:
+        """Compact column summary for agent prompts."""
+        lines = [f"      - {self.describe_column(entry)}" for entry in profile["column_profiles"][:max_columns]]
+        if profile["columns"] > max_columns:
+            lines.append(f"      - ... and {profile['columns'] - max_columns} more columns")
+        return "\n".join(lines)
+    
+    def format_report(self, name: str, profile: Dict[str, Any], sample_rows: int = 3) -> str:
+        """Readable summary of a profile, used for fallbacks and debugging output."""
+        lines = [
+            f"## Summary of {name}",
+            f"* Shape: {profile['rows']:,} rows, {profile['columns']:,} columns",
+            "* Columns:",
+        ]
+        for entry in profile["column_profiles"][:PROFILE_PROMPT_MAX_COLUMNS]:
+            lines.append(f"  - {self.describe_column(entry)}")
+        if profile["columns"] > PROFILE_PROMPT_MAX_COLUMNS:
+            lines.append(f"  - ... and {profile['columns'] - PROFILE_PROMPT_MAX_COLUMNS} more columns")
+        if profile.get("sample") and sample_rows:
+            lines.append(f"\n### Sample Data (First {min(sample_rows, len(profile['sample']))} rows):")
+            lines.append(pd.DataFrame(profile["sample"][:sample_rows]).to_string())
+        return "\n".join(lines)
+
+# Global dataframe profiler
+dataframe_profiler = DataFrameProfiler()
+
+PANDAS_FAST_PATH_ENABLED = os.getenv("PANDAS_FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+PANDAS_FAST_PATH_MAX_ROWS = 50  # Rows shown for grouped / top-N answers
+
+class PandasQueryPlanner:
+    """
+    Rule-based planner that answers common data questions with vectorized pandas.
+    
+    Recognizes row/column counts, schema, describe, aggregates (optionally grouped),
+    top/bottom-N, unique values and simple filtered counts. Whenever a question
+    does not map unambiguously onto one dataframe and its columns, answer()
+    returns None and the caller falls through to the LLM agent.
+    """
+    AGGREGATES = {
+        "average": "mean", "avg": "mean", "mean": "mean",
+        "sum": "sum", "total": "sum",
+        "maximum": "max", "max": "max", "highest": "max", "largest": "max",
+        "minimum": "min", "min": "min", "lowest": "min", "smallest": "min",
+        "median": "median",
+        "count": "count",
+    }
+    COMPARATORS = {
+        ">": "gt", "greater than": "gt", "more than": "gt", "above": "gt", "over": "gt",
+        "<": "lt", "less than": "lt", "below": "lt", "under": "lt",
+        ">=": "ge", "at least": "ge", "<=": "le", "at most": "le",
+        "=": "eq", "==": "eq", "is": "eq", "equals": "eq", "equal to": "eq",
+        "!=": "ne", "is not": "ne", "not": "ne",
+    }
+    
+    DATA_NOUN = r"(?:data(?:set|frame)?|file|table|sheet|spreadsheet|csv|excel)"
+    LEADING_PHRASES = re.compile(
+        r"^(?:(?:please|pls|can you|could you|would you|tell me|show me|give me|show|list|display|find|"
+        r"calculate|compute|get|return|what(?:'s| is| are| was)?|which(?: is| are)?)\s+)+"
+    )
+    TRAILING_PHRASES = re.compile(r"\s+(?:are there|are in it|are available|does it have|do we have|do i have|exist|are|is|there)$")
+    
+    ROW_COUNT = re.compile(
+        r"(?:how many|number of|count of|count|total number of)\s+(?:rows|records|entries|lines|observations)"
+        r"(?:\s+(?:by|per|for each|in each)\s+(?P<group>.+))?"
+    )
+    COLUMN_COUNT = re.compile(r"(?:how many|number of|count of)\s+(?:columns|fields|variables)")
+    SHAPE = re.compile(r"(?:the\s+)?(?:shape|size|dimensions)")
+    SCHEMA = re.compile(r"(?:all\s+)?(?:the\s+)?(?:column names|columns|fields|schema|(?:column\s+)?(?:data\s*)?types|dtypes)")
+    DESCRIBE = re.compile(r"describe|(?:summary|descriptive)\s+stat(?:istic)?s|statistical summary")
+    HEAD = re.compile(r"(?:the\s+)?(?:first|top)\s+(?P<n>\d+)\s+(?:rows|records|entries|lines)")
+    UNIQUE_VALUES = re.compile(r"(?:the\s+)?(?:unique|distinct)\s+values\s+(?:of|in|for)\s+(?P<col>.+)")
+    UNIQUE_COUNT = re.compile(r"(?:how many|number of|count of)\s+(?:unique|distinct)\s+(?P<col>.+)")
+    TOP_N = re.compile(
+        r"(?:the\s+)?(?P<dir>top|bottom|highest|lowest|largest|smallest)\s+(?P<n>\d+)"
+        r"(?:\s+(?:rows|records|entries))?\s+(?:by|on|based on|sorted by|ordered by|in terms of)\s+(?P<col>.+)"
+    )
+    TOP_N_INLINE = re.compile(r"(?:the\s+)?(?P<n>\d+)\s+(?P<dir>highest|lowest|largest|smallest)\s+(?P<col>.+)")
+    FILTER_COUNT = re.compile(
+        r"(?:how many|number of|count of|count)\s+(?:rows|records|entries)\s+(?:where|with|have|has|in which)\s+(?P<col>.+?)\s+"
+        r"(?P<op>>=|<=|!=|==|=|>|<|is greater than|greater than|more than|above|over|is less than|less than|below|under|"
+        r"at least|at most|is not|not|equals|equal to|is)\s+(?P<value>.+)"
+    )
+    # A filter value holding more than one condition ("west and status is active", "west or east")
+    COMPOUND_VALUE = re.compile(
+        r"[,;&|<>=!]|\b(?:and|or|nor|but|either|both|is|not|equals|equal to|greater than|less than|"
+        r"more than|above|below|over|under|at least|at most|between)\b"
+    )
+    AGGREGATE = re.compile(
+        r"(?:the\s+)?(?P<agg>average|avg|mean|sum|total|maximum|max|highest|largest|minimum|min|lowest|smallest|median|count)"
+        r"\s+(?:value\s+)?(?:of\s+)?(?:the\s+)?(?P<col>.+?)"
+        r"(?:\s+(?:by|per|for each|in each|grouped by|across|for every)\s+(?P<group>.+))?"
+    )
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {
+            "queries": 0,
+            "hits": 0,
+            "fast_seconds_total": 0.0,
+            "agent_runs": 0,
+            "agent_seconds_total": 0.0,
+            "estimated_seconds_saved": 0.0,
+            "intents": {},
+        }
+    
+    # --- Parsing helpers ---
+    
+    @staticmethod
+    def _normalize_name(text: str) -> str:
+        return re.sub(r"[\s_\-]+", " ", str(text).strip().strip("'\"`").lower()).strip()
+    
+    def _clean_query(self, query: str, frame_names: List[str]) -> str:
+        """Lower-case the query and strip politeness, file mentions and filler phrases."""
+        q = " " + re.sub(r"\s+", " ", query.lower()).strip().rstrip("?.!") + " "
+        
+        # Remove mentions of the loaded files ("in sales.csv", "of the file 'sales.csv'")
+        for name in frame_names:
+            for mention in {name.lower(), name.split(" [Sheet:")[0].lower()}:
+                q = re.sub(
+                    r"(?:\s+(?:in|of|from|for|within))?(?:\s+the)?(?:\s+(?:file|sheet|dataset))?\s+['\"`]?" + re.escape(mention) + r"['\"`]?(?=\s)",
+                    " ", q
+                )
+        q = re.sub(r"(?:\s+(?:in|of|from|for|within))?\s+(?:the|this|my|that|these|all)\s+" + self.DATA_NOUN + r"s?(?=\s)", " ", q)
+        
+        q = re.sub(r"\s+", " ", q).strip()
+        q = self.LEADING_PHRASES.sub("", q)
+        q = self.TRAILING_PHRASES.sub("", q)
+        return q.strip()
+    
+    def _resolve_column(self, text: Optional[str], df: pd.DataFrame) -> Optional[str]:
+        """Map a column phrase onto exactly one column of df, or None."""
+        if not text:
+            return None
+        phrase = self._normalize_name(re.sub(r"^(?:the\s+)|\s+(?:column|field|values?)$", "", text.strip()))
+        columns = {self._normalize_name(col): col for col in df.columns}
+        if phrase in columns:
+            return columns[phrase]
+        # Allow a simple plural ("prices" for "price")
+        if phrase.endswith("s") and phrase[:-1] in columns:
+            return columns[phrase[:-1]]
+        return None
+    
+    @staticmethod
+    def _format_value(value) -> str:
+        if isinstance(value, (bool, np.bool_)):
+            return str(bool(value))
+        if isinstance(value, (int, np.integer)):
+            return f"{int(value):,}"
+        if isinstance(value, (float, np.floating)):
+            if pd.isna(value):
+                return "no value"
+            return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.4f}".rstrip("0").rstrip(".")
+        return str(value)
+    
+    @staticmethod
+    def _format_table(obj) -> str:
+        return f"```\n{obj.to_string()}\n```"
+    
+    def _truncated_table(self, obj, what: str) -> str:
+        if len(obj) > PANDAS_FAST_PATH_MAX_ROWS:
+            return f"{self._format_table(obj.head(PANDAS_FAST_PATH_MAX_ROWS))}\n(Showing the first {PANDAS_FAST_PATH_MAX_ROWS} of {len(obj):,} {what}.)"
+        return self._format_table(obj)
+    
+    # --- Intents ---
+    
+    def _frame_level(self, q: str, name: str, df: pd.DataFrame) -> Optional[Tuple[str, str]]:
+        """Intents that need no column resolution."""
+        if self.ROW_COUNT.fullmatch(q) and not self.ROW_COUNT.fullmatch(q).group("group"):
+            return "row_count", f"**{name}** has {len(df):,} rows."
+        if self.COLUMN_COUNT.fullmatch(q):
+            return "column_count", f"**{name}** has {len(df.columns):,} columns."
+        if self.SHAPE.fullmatch(q):
+            return "shape", f"**{name}** has {len(df):,} rows and {len(df.columns):,} columns."
+        if self.SCHEMA.fullmatch(q):
+            schema = pd.DataFrame({
+                "column": [str(c) for c in df.columns],
+                "type": [str(t) for t in df.dtypes],
+                "non_null": df.notna().sum().values,
+            })
+            return "schema", f"**{name}** has {len(df.columns):,} columns:\n{self._format_table(schema.set_index('column'))}"
+        if self.DESCRIBE.fullmatch(q):
+            return "describe", f"Summary statistics for **{name}** ({len(df):,} rows):\n{self._format_table(df.describe(include='all').transpose())}"
+        match = self.HEAD.fullmatch(q)
+        if match:
+            n = int(match.group("n"))
+            return "head", f"First {min(n, len(df)):,} rows of **{name}**:\n{self._truncated_table(df.head(n), 'requested rows')}"
+        return None
+    
+    def _column_level(self, q: str, name: str, df: pd.DataFrame) -> Optional[Tuple[str, str]]:
+        """Intents that must resolve one or two columns of the dataframe."""
+        match = self.ROW_COUNT.fullmatch(q)
+        if match and match.group("group"):
+            group = self._resolve_column(match.group("group"), df)
+            if group is None:
+                return None
+            counts = df[group].value_counts(dropna=False)
+            return "group_count", f"Rows per **{group}** in **{name}**:\n{self._truncated_table(counts, 'groups')}"
+        
+        match = self.FILTER_COUNT.fullmatch(q)
+        if match:
+            return self._filter_count(match, name, df)
+        
+        match = self.UNIQUE_COUNT.fullmatch(q)
+        if match:
+            column = self._resolve_column(match.group("col"), df)
+            if column is None:
+                return None
+            return "unique_count", f"**{column}** has {df[column].nunique():,} distinct values in **{name}**."
+        
+        match = self.UNIQUE_VALUES.fullmatch(q)
+        if match:
+            column = self._resolve_column(match.group("col"), df)
+            if column is None:
+                return None
+            counts = df[column].value_counts(dropna=False)
+            return "unique_values", f"Distinct values of **{column}** in **{name}** ({len(counts):,} total, with row counts):\n{self._truncated_table(counts, 'values')}"
+        
+        match = self.TOP_N.fullmatch(q) or self.TOP_N_INLINE.fullmatch(q)
+        if match:
+            column = self._resolve_column(match.group("col"), df)
+            if column is None or not (pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_datetime64_any_dtype(df[column])):
+                return None
+            n = int(match.group("n"))
+            if match.group("dir") in ("top", "highest", "largest"):
+                rows, label = df.nlargest(n, column), "Top"
+            else:
+                rows, label = df.nsmallest(n, column), "Bottom"
+            return "top_n", f"{label} {len(rows):,} rows of **{name}** by **{column}**:\n{self._truncated_table(rows, 'rows')}"
+        
+        match = self.AGGREGATE.fullmatch(q)
+        if match:
+            return self._aggregate(match, name, df)
+        
+        return None
+    
+    def _aggregate(self, match, name: str, df: pd.DataFrame) -> Optional[Tuple[str, str]]:
+        func = self.AGGREGATES[match.group("agg")]
+        column = self._resolve_column(match.group("col"), df)
+        if column is None:
+            return None
+        series = df[column]
+        if func in ("mean", "sum", "median") and not (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)):
+            return None
+        if func in ("max", "min") and not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)):
+            return None
+        
+        label = {"mean": "Average", "sum": "Total", "max": "Maximum", "min": "Minimum", "median": "Median", "count": "Count"}[func]
+        if match.group("group"):
+            group = self._resolve_column(match.group("group"), df)
+            if group is None or group == column:
+                return None
+            result = df.groupby(group, dropna=False, observed=True, sort=False)[column].agg(func).sort_values(ascending=False)
+            return f"grouped_{func}", f"{label} **{column}** by **{group}** in **{name}**:\n{self._truncated_table(result, 'groups')}"
+        
+        value = getattr(series, func)()
+        return func, f"{label} **{column}** in **{name}**: {self._format_value(value)}"
+    
+    def _filter_count(self, match, name: str, df: pd.DataFrame) -> Optional[Tuple[str, str]]:
+        column = self._resolve_column(match.group("col"), df)
+        if column is None:
+            return None
+        op = self.COMPARATORS.get(match.group("op").replace("is greater than", "greater than").replace("is less than", "less than"))
+        raw_value = match.group("value").strip().strip("'\"`")
+        # Only single conditions are answered here; thousands separators ("1,000") are not a list
+        if self.COMPOUND_VALUE.search(re.sub(r"(?<=\d),(?=\d{3}\b)", "", raw_value)):
+            return None
+        series = df[column]
+        
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            try:
+                value = float(raw_value.replace(",", ""))
+            except ValueError:
+                return None
+            mask = getattr(series, op)(value)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            value = pd.to_datetime(raw_value, errors="coerce")
+            if pd.isna(value):
+                return None
+            mask = getattr(series, op)(value)
+        elif op in ("eq", "ne"):
+            mask = getattr(series.astype("string").str.strip().str.lower(), op)(raw_value.lower())
+        else:
+            return None
+        
+        count = int(mask.fillna(False).sum())
+        return "filter_count", f"{count:,} of {len(df):,} rows in **{name}** have **{column}** {match.group('op')} {raw_value}."
+    
+    # --- Entry points ---
+    
+    def _plan(self, query: str, dataframes: Dict[str, pd.DataFrame]) -> Optional[Tuple[str, str]]:
+        names = list(dataframes.keys())
+        q = self._clean_query(query, names)
+        if not q:
+            return None
+        
+        # Restrict to files mentioned in the query, if any
+        query_lower = query.lower()
+        mentioned = [n for n in names if n.split(" [Sheet:")[0].lower() in query_lower]
+        candidates = mentioned or names
+        
+        frame_answers = [self._frame_level(q, n, dataframes[n]) for n in candidates]
+        if all(frame_answers):
+            return frame_answers[0][0], "\n\n".join(answer for _, answer in frame_answers)
+        
+        # Column questions must resolve against exactly one dataframe
+        column_answers = [a for a in (self._column_level(q, n, dataframes[n]) for n in candidates) if a]
+        if len(column_answers) == 1:
+            return column_answers[0]
+        return None
+    
+    def answer(self, query: str, dataframes: Dict[str, pd.DataFrame]) -> Optional[str]:
+        """
+        Answer a query directly if it matches a known pattern.
+        
+        Args:
+            query: The user's question
+            dataframes: Loaded dataframes keyed by name
+            
+        Returns:
+            The answer text, or None to fall through to the agent
+        """
+        if not query or not dataframes:
+            return None
+        
+        start_time = time.perf_counter()
+        try:
+            planned = self._plan(query, dataframes)
+        except Exception as e:
+            logging.info(f"Fast path could not answer '{query}', falling back to agent: {e}")
+            planned = None
+        elapsed = time.perf_counter() - start_time
+        
+        with self.lock:
+            self.stats["queries"] += 1
+            if planned is None:
+                return None
+            intent, answer = planned
+            self.stats["hits"] += 1
+            self.stats["fast_seconds_total"] += elapsed
+            self.stats["intents"][intent] = self.stats["intents"].get(intent, 0) + 1
+            avg_agent_seconds = self.stats["agent_seconds_total"] / self.stats["agent_runs"] if self.stats["agent_runs"] else None
+            saved = max(avg_agent_seconds - elapsed, 0.0) if avg_agent_seconds is not None else None
+            if saved is not None:
+                self.stats["estimated_seconds_saved"] += saved
+        
+        saved_text = f"~{saved:.1f}s saved vs. agent average" if saved is not None else "no agent baseline yet"
+        logging.info(f"Fast path answered '{query}' as {intent} in {elapsed * 1000:.1f} ms ({saved_text})")
+        return answer
+    
+    def record_agent_run(self, seconds: float):
+        """Record the latency of a query that fell through to the LLM agent."""
+        with self.lock:
+            self.stats["agent_runs"] += 1
+            self.stats["agent_seconds_total"] += seconds
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = {**self.stats, "intents": dict(self.stats["intents"])}
+        stats["enabled"] = PANDAS_FAST_PATH_ENABLED
+        stats["hit_rate"] = round(stats["hits"] / stats["queries"], 4) if stats["queries"] else 0.0
+        stats["avg_fast_ms"] = round(stats["fast_seconds_total"] / stats["hits"] * 1000, 2) if stats["hits"] else None
+        stats["avg_agent_seconds"] = round(stats["agent_seconds_total"] / stats["agent_runs"], 2) if stats["agent_runs"] else None
+        return stats
+
+# Global fast-path planner
+pandas_query_planner = PandasQueryPlanner()
+
+PANDAS_RESULT_CACHE_TTL_SECONDS = int(os.getenv("PANDAS_RESULT_CACHE_TTL_SECONDS", "3600"))
+PANDAS_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("PANDAS_RESULT_CACHE_MAX_ENTRIES", "500"))
+# Cosine similarity needed to reuse an answer for a reworded question; 0 disables embedding lookups
+PANDAS_RESULT_CACHE_SIMILARITY = float(os.getenv("PANDAS_RESULT_CACHE_SIMILARITY", "0"))
+PANDAS_RESULT_CACHE_EMBEDDING_DEPLOYMENT = os.getenv("PANDAS_RESULT_CACHE_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+
+class PandasResultCache:
+    """
+    Cache of pandas agent answers keyed by (dataframe fingerprint, normalized query).
+    
+    The fingerprint is a content hash of every dataframe bound to the thread, so a
+    changed file set never hits stale answers and identical uploads in other
+    sessions share entries. Lookups match the normalized query exactly and, when
+    PANDAS_RESULT_CACHE_SIMILARITY is set, fall back to embedding similarity among
+    entries with the same fingerprint. Entries expire after a TTL and the cache is
+    bounded with LRU eviction.
+    """
+    # Single letters ("a", "i") are not filler: they are often values, e.g. grade = 'A'
+    FILLER_WORDS = {
+        "please", "pls", "can", "could", "would", "you", "me", "tell", "show", "give", "want", "to", "know",
+        "the", "an", "of", "in", "for", "what", "whats", "is", "are", "was", "were", "do", "does", "data", "dataset",
+        "file", "this", "that", "my",
+    }
+    
+    def __init__(self, ttl_seconds: int = PANDAS_RESULT_CACHE_TTL_SECONDS, max_entries: int = PANDAS_RESULT_CACHE_MAX_ENTRIES,
+                 similarity_threshold: float = PANDAS_RESULT_CACHE_SIMILARITY):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()  # (fingerprint, normalized query) -> {"answer", "created", "embedding"}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+    
+    def normalize_query(self, query: str) -> str:
+        # \w keeps non-Latin words (Cyrillic, CJK, accented letters); NFKC unifies their encodings
+        words = re.findall(r"[\w.%<>=!-]+", unicodedata.normalize("NFKC", query).lower())
+        return " ".join(w for w in words if w not in self.FILLER_WORDS)
+    
+    @staticmethod
+    def fingerprint(dataframes: Dict[str, pd.DataFrame]) -> Optional[str]:
+        """
+        Content hash of a set of dataframes (names, schema and values).
+        
+        Returns:
+            Hex digest, or None if a dataframe cannot be hashed (e.g. unhashable cell values)
+        """
+        digest = hashlib.sha256()
+        try:
+            for name in sorted(dataframes):
+                df = dataframes[name]
+                digest.update(name.encode("utf-8"))
+                if isinstance(df, OutOfCoreTable):
+                    digest.update(df.fingerprint.encode("utf-8"))
+                    continue
+                digest.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+                digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        except Exception as e:
+            logging.warning(f"Could not fingerprint dataframes for result cache: {e}")
+            return None
+        return digest.hexdigest()
+    
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            response = get_azure_client().embeddings.create(model=PANDAS_RESULT_CACHE_EMBEDDING_DEPLOYMENT, input=text)
+            vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            return vector / norm if norm else None
+        except Exception as e:
+            logging.warning(f"Result cache embedding failed, using exact matching only: {e}")
+            return None
+    
+    def _expire(self, now: float):
+        expired = [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self.entries[key]
+        self.stats["expired"] += len(expired)
+    
+    def get(self, fingerprint: Optional[str], query: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Look up a cached answer.
+        
+        Args:
+            fingerprint: Dataframe fingerprint from fingerprint()
+            query: The user's question
+            
+        Returns:
+            (answer or None, query embedding or None); pass the embedding back to put()
+            on a miss so it is not computed twice
+        """
+        if not fingerprint:
+            return None, None
+        key = (fingerprint, self.normalize_query(query))
+        if not key[1]:
+            return None, None
+        
+        with self.lock:
+            self._expire(time.time())
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                logging.info(f"Result cache hit for '{query}'")
+                return entry["answer"], None
+            candidates = [
+                (k, e["embedding"]) for k, e in self.entries.items()
+                if k[0] == fingerprint and e["embedding"] is not None
+            ]
+        
+        embedding = None
+        if self.similarity_threshold > 0 and candidates:
+            embedding = self._embed(key[1])
+            if embedding is not None:
+                best_key, best_score = max(
+                    ((k, float(np.dot(embedding, e))) for k, e in candidates), key=lambda item: item[1]
+                )
+                if best_score >= self.similarity_threshold:
+                    with self.lock:
+                        entry = self.entries.get(best_key)
+                        if entry is not None:
+                            self.entries.move_to_end(best_key)
+                            self.stats["semantic_hits"] += 1
+                            logging.info(f"Result cache semantic hit for '{query}' (similarity {best_score:.3f} to '{best_key[1]}')")
+                            return entry["answer"], embedding
+        
+        with self.lock:
+            self.stats["misses"] += 1
+        return None, embedding
+    
+    def put(self, fingerprint: Optional[str], query: str, answer: str, embedding: Optional[np.ndarray] = None):
+        """Store an answer for a fingerprint and query."""
+        if not fingerprint or not answer:
+            return
+        normalized = self.normalize_query(query)
+        if not normalized:
+            return
+        if embedding is None and self.similarity_threshold > 0:
+            embedding = self._embed(normalized)
+        
+        with self.lock:
+            self.entries[(fingerprint, normalized)] = {"answer": answer, "created": time.time(), "embedding": embedding}
+            self.entries.move_to_end((fingerprint, normalized))
+            self.stats["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hit_rate": round((self.stats["hits"] + self.stats["semantic_hits"]) / lookups, 4) if lookups else 0.0,
+                "semantic_matching": self.similarity_threshold > 0,
+            }
+
+# Global pandas answer cache
+pandas_result_cache = PandasResultCache()
+
+class PandasAgentManager:
+    """
+    Enhanced class to manage pandas agents and dataframes for different threads.
+    Provides thread isolation, FIFO file storage, and prevents duplicate agent creation.
+    """
+    
+    # Class-level singleton instance
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls):
+        """Get or create the singleton instance"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+    
+    def __init__(self):
+        """Initialize the manager"""
+        # Cache for pandas agents by thread_id
+        self.agents_cache = {}
+        
+        # Cache for dataframes by thread_id, bounded by a global memory budget
+        self.dataframes_cache = DataFrameCache(loader=self._reload_dataframes, on_evict=self._release_thread)
+        
+        # Cache for file info by thread_id
+        self.file_info_cache = {}
+        
+        # Cache for filepaths by thread_id
+        self.file_paths_cache = {}
+        
+        # Maximum files per thread
+        self.max_files_per_thread = 3
+        
+        # Initialize LangChain LLM
+        self.langchain_llm = None
+        
+        # Dataframe binding currently loaded into each thread's agent
+        self.agent_bindings = {}
+        
+        # Content fingerprint of each thread's dataframes for the result cache: thread_id -> (binding, fingerprint)
+        self.fingerprints = {}
+        
+        # Dataframe profiles by thread_id and dataframe name (kept when dataframes are evicted)
+        self.profiles = {}
+        self.agent_stats = {"builds": 0, "rebinds": 0, "build_seconds_total": 0.0, "last_build_seconds": None, "last_rebind_seconds": None}
+        self.agent_stats_lock = threading.Lock()
+        
+        # Process isolation: Parquet snapshots per thread, worker pool, agents built in workers
+        self.snapshot_cache = {}
+        self.process_pool = None
+        self.process_pool_lock = threading.Lock()
+        self.worker_frames = OrderedDict()
+        self.worker_agent = None
+        
+        # One analysis per thread at a time: thread_id -> [asyncio.Lock, analyses holding or waiting for it]
+        self.analysis_locks = {}
+        
+        # Excel workbooks by stored upload path; large ones keep their unused sheets unparsed
+        self.workbooks = OrderedDict()
+        self.workbooks_lock = threading.Lock()
+        self.workbook_stats = {"lazy_workbooks": 0, "sheets_parsed": 0, "sheets_from_snapshot": 0, "sheets_materialized": 0}
+        
+        # Check for required dependencies
+        self._check_dependencies()
+        
+        logging.info("PandasAgentManager initialized")
+    
+    def _check_dependencies(self):
+        """Check if required dependencies are available"""
+        missing_deps = []
+        
+        try:
+            import pandas as pd
+            logging.info("Pandas version: %s", pd.__version__)
+        except ImportError:
+            missing_deps.append("pandas")
+        
+        try:
+            import numpy as np
+            logging.info("NumPy version: %s", np.__version__)
+        except ImportError:
+            missing_deps.append("numpy")
+        
+        try:
+            import tabulate
+            logging.info("Tabulate version: %s", tabulate.__version__)
+        except ImportError:
+            try:
+                # Try to install tabulate automatically
+                import subprocess
+                logging.info("Installing missing tabulate dependency...")
+                subprocess.check_call(["pip", "install", "tabulate"])
+                logging.info("Successfully installed tabulate")
+            except Exception as e:
+                missing_deps.append("tabulate")
+                logging.warning(f"Could not install tabulate: {str(e)}")
+        
+        try:
+            # Try to import LangChain's create_pandas_dataframe_agent function
+            try:
+                from langchain_experimental.agents import create_pandas_dataframe_agent
+                logging.info("Using langchain_experimental for pandas agent")
+            except ImportError:
+                try:
+                    from langchain.agents import create_pandas_dataframe_agent
+                    logging.info("Using langchain for pandas agent")
+                except ImportError:
+                    missing_deps.append("langchain[experimental]")
+        except Exception as e:
+            missing_deps.append("langchain components")
+            logging.error(f"Error checking for LangChain: {str(e)}")
+        
+        if missing_deps:
+            logging.warning(f"Missing dependencies: {', '.join(missing_deps)}")
+            logging.warning("Install them with: pip install " + " ".join(missing_deps))
+        
+        return len(missing_deps) == 0
+    
+    def get_llm(self):
+        """Get or initialize the LangChain LLM"""
+        if self.langchain_llm is None:
+            try:
+                from langchain_openai import AzureChatOpenAI
+                
+                # Use the existing client configuration
+                self.langchain_llm = AzureChatOpenAI(
+                    azure_endpoint=AZURE_ENDPOINT,
+                    api_key=AZURE_API_KEY,
+                    api_version=AZURE_API_VERSION,
+                    deployment_name="gpt-4o",
+                    temperature=0,
+                    streaming=True  # Answer tokens reach callbacks as they are generated
+                )
+                logging.info("Initialized LangChain LLM for pandas agents")
+            except Exception as e:
+                logging.error(f"Failed to initialize LangChain LLM: {e}")
+                raise
+        
+        return self.langchain_llm
+    
+    def initialize_thread(self, thread_id: str):
+        """Initialize storage for a thread if it doesn't exist yet"""
+        if thread_id not in self.dataframes_cache:
+            self.dataframes_cache[thread_id] = {}
+        
+        if thread_id not in self.file_info_cache:
+            self.file_info_cache[thread_id] = []
+            
+        if thread_id not in self.file_paths_cache:
+            self.file_paths_cache[thread_id] = []
+    
+    def _reload_dataframes(self, thread_id: str):
+        """
+        Reload a thread's dataframes from disk after they were evicted from memory.
+        
+        Args:
+            thread_id (str): Thread ID
+            
+        Returns:
+            dict: Dataframes keyed by name
+        """
+        frames = {}
+        for file_info in self.file_info_cache.get(thread_id, []):
+            dfs_dict, error = self.load_dataframe_from_file(file_info, thread_id)
+            if dfs_dict:
+                frames.update(dfs_dict)
+            else:
+                logging.warning(f"Could not reload '{file_info.get('name')}' for thread {thread_id}: {error}")
+        return frames
+    
+    def _release_thread(self, thread_id: str):
+        """Drop objects that keep an evicted thread's dataframes alive."""
+        self.agents_cache.pop(thread_id, None)
+        self.agent_bindings.pop(thread_id, None)
+        self.fingerprints.pop(thread_id, None)
+        for _, snapshot_path in self.snapshot_cache.pop(thread_id, {}).values():
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+        sandbox_executor.release_thread(thread_id)
+    
+    def remove_oldest_file(self, thread_id: str):
+        """
+        Remove the oldest file for a thread when max files is reached
+        
+        Args:
+            thread_id (str): Thread ID
+            
+        Returns:
+            str or None: Name of removed file or None
+        """
+        if thread_id not in self.file_info_cache or len(self.file_info_cache[thread_id]) <= self.max_files_per_thread:
+            return None
+        
+        # Get the oldest file info
+        oldest_file_info = self.file_info_cache[thread_id][0]
+        oldest_file_name = oldest_file_info.get("name", "")
+        
+        # Remove the file info
+        self.file_info_cache[thread_id].pop(0)
+        
+        # Remove the file path; the stored upload may be shared with other sessions,
+        # so it is left for the upload store to expire
+        if thread_id in self.file_paths_cache and len(self.file_paths_cache[thread_id]) > 0:
+            oldest_path = self.file_paths_cache[thread_id].pop(0)
+            logging.info(f"Released oldest file: {oldest_path} for thread {thread_id}")
+        
+        # Remove any dataframes associated with this file
+        if thread_id in self.dataframes_cache:
+            # For exact filename match
+            if oldest_file_name in self.dataframes_cache[thread_id]:
+                del self.dataframes_cache[thread_id][oldest_file_name]
+                
+            # For Excel sheets with this filename
+            keys_to_remove = []
+            for key in self.dataframes_cache[thread_id].keys():
+                if key.startswith(oldest_file_name + " [Sheet:"):
+                    keys_to_remove.append(key)
+            
+            for key in keys_to_remove:
+                del self.dataframes_cache[thread_id][key]
+        
+        # Drop the removed file's profiles
+        thread_profiles = self.profiles.get(thread_id, {})
+        for key in [k for k in thread_profiles if k == oldest_file_name or k.startswith(oldest_file_name + " [Sheet:")]:
+            del thread_profiles[key]
+            
+        return oldest_file_name
+    
+    def add_file(self, thread_id, file_info):
+        """
+        Add a file to the thread, implementing FIFO if needed.
+        Enhanced to prevent accidental deletion of files needed for follow-up queries.
+        
+        Args:
+            thread_id (str): The thread ID
+            file_info (dict): File information dictionary
+            
+        Returns:
+            tuple: (dict of dataframes or None, error message or None, removed_file or None)
+        """
+        # Initialize thread storage if needed
+        self.initialize_thread(thread_id)
+        
+        file_name = file_info.get("name", "unnamed_file")
+        file_path = file_info.get("path", None)
+        
+        logging.info(f"Adding file '{file_name}' from path {file_path} to thread {thread_id}")
+        
+        # Verify file exists
+        if not file_path or not os.path.exists(file_path):
+            # Try to resolve the file through the upload registry
+            located_file_path = self._locate_file(thread_id, file_name)
+            if located_file_path:
+                logging.info(f"Found alternative path for '{file_name}': {located_file_path}")
+                file_path = located_file_path
+                file_info["path"] = file_path
+            else:
+                error_msg = f"File path for '{file_name}' is invalid or does not exist (path: {file_path})"
+                logging.error(error_msg)
+                return None, error_msg, None
+        
+        # Check if we already have this file (same name)
+        existing_file_names = [f.get("name", "") for f in self.file_info_cache[thread_id]]
+        existing_file_index = None
         
         if file_name in existing_file_names:
             # File already exists - we'll treat this as an update, but ONLY if we have a valid new file
@@ -4394,7 +7214,7 @@ class PandasAgentManager:
                 logging.info(f"Removed oldest file '{removed_file}' for thread {thread_id} to maintain FIFO limit")
         
         # Load the dataframe(s)
-        dfs_dict, error = self.load_dataframe_from_file(file_info)
+        dfs_dict, error = self.load_dataframe_from_file(file_info, thread_id)
         
         if error:
             # If there was an error loading the new dataframe but we have an existing one, keep using it
@@ -4413,20 +7233,15 @@ class PandasAgentManager:
                 if existing_file_index < len(self.file_paths_cache[thread_id]):
                     old_path = self.file_paths_cache[thread_id].pop(existing_file_index)
                     
-                    # Only delete the old file if it's different from the new one
-                    if old_path and old_path != file_path and os.path.exists(old_path):
-                        try:
-                            # Create a backup before deleting
-                            backup_path = f"{old_path}.bak"
-                            with open(old_path, 'rb') as src, open(backup_path, 'wb') as dst:
-                                dst.write(src.read())
-                                
-                            os.remove(old_path)
-                            logging.info(f"Deleted old file: {old_path} for thread {thread_id} (backup at {backup_path})")
-                        except Exception as e:
-                            logging.error(f"Error deleting file {old_path}: {e}")
+                    # Stored uploads are immutable and may be shared with other sessions,
+                    # so the old blob is left for the upload store to expire
+                    if old_path and old_path != file_path:
+                        logging.info(f"Replaced file path {old_path} with {file_path} for thread {thread_id}")
                 
-                # Remove old dataframes
+                # Remove old dataframes and their profiles
+                thread_profiles = self.profiles.get(thread_id, {})
+                for key in [k for k in thread_profiles if k == file_name or k.startswith(file_name + " [Sheet:")]:
+                    del thread_profiles[key]
                 if file_name in self.dataframes_cache[thread_id]:
                     del self.dataframes_cache[thread_id][file_name]
                 
@@ -4442,6 +7257,9 @@ class PandasAgentManager:
             # Add dataframes to cache
             self.dataframes_cache[thread_id].update(dfs_dict)
             
+            # Profile once at registration; agent prompts and fallbacks reuse the profiles
+            self.profiles.setdefault(thread_id, {}).update(self._profile_dataframes(file_info, dfs_dict))
+            
             # Add file info to cache (append to end for FIFO ordering)
             self.file_info_cache[thread_id].append(file_info)
             
@@ -4449,89 +7267,321 @@ class PandasAgentManager:
             if file_path:
                 self.file_paths_cache[thread_id].append(file_path)
             
-            # Reset agent to ensure it's recreated with new dataframes
-            if thread_id in self.agents_cache:
-                self.agents_cache[thread_id] = None
-                
             logging.info(f"Added dataframe(s) for file '{file_name}' to thread {thread_id}")
             return dfs_dict, None, removed_file
         else:
             return None, f"Failed to load any dataframes from file '{file_name}'", removed_file
 
-    def _locate_file_in_tmp(self, filename):
+    def _locate_file(self, thread_id, filename):
+        """
+        Resolve a file through the upload registry.
+        
+        Args:
+            thread_id (str): Thread the file was uploaded to
+            filename (str): Original filename
+            
+        Returns:
+            str or None: Path of the stored upload if registered, None otherwise
+        """
+        if not thread_id:
+            return None
+        try:
+            entry = file_registry.lookup(thread_id, filename)
+            return entry["path"] if entry else None
+        except Exception as e:
+            logging.error(f"Error looking up '{filename}' in file registry: {e}")
+            return None
+
+    @staticmethod
+    def _sheet_name(file_name, key):
+        """Sheet part of a dataframe key ("name [Sheet: X]" -> "X"), or '' for single-frame files."""
+        sheet_prefix = f"{file_name} [Sheet: "
+        return key[len(sheet_prefix):-1] if key.startswith(sheet_prefix) else ""
+    
+    def _profile_dataframes(self, file_info, dfs_dict):
+        """
+        Profile a file's dataframes once, reusing profiles stored for the same upload.
+        
+        Args:
+            file_info (dict): File information (sha256 is used to persist profiles)
+            dfs_dict (dict): Dataframes keyed by name
+            
+        Returns:
+            dict: Profile per dataframe name
+        """
+        sha256 = file_info.get("sha256")
+        file_name = file_info.get("name", "unnamed_file")
+        profiles = {}
+        
+        for key, df in dfs_dict.items():
+            if isinstance(df, OutOfCoreTable):
+                # Profiling would scan the whole file; its prompt describes the schema instead
+                continue
+            sheet = self._sheet_name(file_name, key)
+            profile = file_registry.get_profile(sha256, sheet) if sha256 else None
+            if profile is None:
+                try:
+                    start_time = time.perf_counter()
+                    profile = dataframe_profiler.profile(df)
+                    logging.info(f"Profiled '{key}' ({profile['rows']} rows, {profile['columns']} columns) in {time.perf_counter() - start_time:.2f}s")
+                except Exception as e:
+                    logging.warning(f"Could not profile '{key}': {e}")
+                    continue
+                if sha256:
+                    file_registry.save_profile(sha256, sheet, profile)
+            profiles[key] = profile
+        
+        return profiles
+    
+    def profile_upload(self, file_info):
+        """
+        Parse and profile an uploaded file ahead of the first query.
+        Writes the Parquet snapshots and profiles to the registry without adding
+        the file to any thread's dataframes.
+        
+        Args:
+            file_info (dict): File information including path and sha256
+        """
+        dfs_dict, error = self.load_dataframe_from_file(file_info)
+        if error:
+            logging.warning(f"Could not profile upload '{file_info.get('name')}': {error}")
+            return
+        self._profile_dataframes(file_info, dfs_dict)
+    
+    def get_profile(self, thread_id, name):
+        """
+        Profile of one of a thread's dataframes, computing it if it is missing.
+        
+        Args:
+            thread_id (str): Thread ID
+            name (str): Dataframe name
+            
+        Returns:
+            dict or None: The profile
+        """
+        thread_profiles = self.profiles.setdefault(thread_id, {})
+        if name not in thread_profiles:
+            dataframes = self.dataframes_cache.get(thread_id) or {}
+            if name not in dataframes:
+                return None
+            file_info = next(
+                (info for info in self.file_info_cache.get(thread_id, [])
+                 if name == info.get("name") or name.startswith(f"{info.get('name')} [Sheet: ")),
+                {"name": name}
+            )
+            thread_profiles.update(self._profile_dataframes(file_info, {name: dataframes[name]}))
+        return thread_profiles.get(name)
+    
+    def profile_report(self, thread_id, names, sample_rows=3):
+        """Readable profile summaries for a thread's dataframes, without rescanning them."""
+        reports = []
+        for name in names:
+            profile = self.get_profile(thread_id, name)
+            if profile:
+                reports.append(dataframe_profiler.format_report(name, profile, sample_rows))
+        return "\n\n".join(reports)
+    
+    def _open_workbook(self, file_path, sha256=None):
+        """
+        Get the workbook handle for a stored upload, reading its sheet list on first use.
+
+        Args:
+            file_path (str): Path of the stored upload
+            sha256 (str, optional): Upload digest used to key sheet snapshots
+
+        Returns:
+            LazyWorkbook: The workbook handle
+        """
+        with self.workbooks_lock:
+            workbook = self.workbooks.get(file_path)
+            if workbook is not None:
+                self.workbooks.move_to_end(file_path)
+                return workbook
+
+        workbook = LazyWorkbook(file_path, sha256)
+        closed = []
+        with self.workbooks_lock:
+            workbook = self.workbooks.setdefault(file_path, workbook)
+            self.workbooks.move_to_end(file_path)
+            while len(self.workbooks) > EXCEL_OPEN_WORKBOOKS_MAX:
+                closed.append(self.workbooks.popitem(last=False)[1])
+        for old_workbook in closed:
+            old_workbook.close()
+        return workbook
+
+    def _load_workbook_sheet(self, workbook, sheet):
+        df, from_snapshot = workbook.load_sheet(sheet)
+        with self.workbooks_lock:
+            self.workbook_stats["sheets_from_snapshot" if from_snapshot else "sheets_parsed"] += 1
+        return df
+
+    def get_unloaded_sheets(self, thread_id):
+        """
+        Sheets of a thread's lazily loaded workbooks that have not been parsed yet.
+
+        Args:
+            thread_id (str): Thread ID
+
+        Returns:
+            list: Dataframe keys ("name [Sheet: X]") that load_sheet can materialize
+        """
+        loaded = self.dataframes_cache[thread_id] if thread_id in self.dataframes_cache else {}
+        unloaded = []
+        for info in self.file_info_cache.get(thread_id, []):
+            if info.get("type") != "excel" or not info.get("path"):
+                continue
+            try:
+                workbook = self._open_workbook(info["path"], info.get("sha256"))
+            except Exception as e:
+                logging.warning(f"Could not open workbook '{info.get('name')}': {e}")
+                continue
+            if not workbook.lazy:
+                continue
+            for sheet in workbook.sheet_names:
+                key = f"{info.get('name')} [Sheet: {sheet}]"
+                if key not in loaded:
+                    unloaded.append(key)
+        return unloaded
+
+    def materialize_sheet(self, thread_id, name):
+        """
+        Load a not-yet-parsed workbook sheet into a thread's dataframes.
+        Bound into the agent's Python tool as load_sheet(name).
+
+        Args:
+            thread_id (str): Thread ID
+            name (str): Dataframe key ("file.xlsx [Sheet: X]") or bare sheet name
+
+        Returns:
+            DataFrame: The sheet's dataframe
+        """
+        dataframes = self.dataframes_cache[thread_id] if thread_id in self.dataframes_cache else {}
+        if name in dataframes:
+            return dataframes[name]
+
+        for info in self.file_info_cache.get(thread_id, []):
+            if info.get("type") != "excel" or not info.get("path"):
+                continue
+            workbook = self._open_workbook(info["path"], info.get("sha256"))
+            for sheet in workbook.sheet_names:
+                key = f"{info.get('name')} [Sheet: {sheet}]"
+                if name not in (key, sheet):
+                    continue
+                if key in dataframes:
+                    return dataframes[key]
+                df = self._load_workbook_sheet(workbook, sheet)
+                self.dataframes_cache[thread_id][key] = df
+                self.profiles.setdefault(thread_id, {}).update(self._profile_dataframes(info, {key: df}))
+                with self.workbooks_lock:
+                    self.workbook_stats["sheets_materialized"] += 1
+                logging.info(f"Materialized sheet '{key}' for thread {thread_id}")
+                return df
+
+        raise KeyError(f"No sheet named '{name}'. Sheets not loaded yet: {self.get_unloaded_sheets(thread_id)}")
+
+    def materialize_mentioned_sheets(self, thread_id, query):
+        """
+        Load the unparsed sheets a query names, so the fast path and the agent see them.
+
+        Args:
+            thread_id (str): Thread ID
+            query (str): The user's query
+
+        Returns:
+            list: Keys of the sheets that were loaded
+        """
+        query_lower = query.lower()
+        loaded = []
+        for key in self.get_unloaded_sheets(thread_id):
+            sheet = key.rsplit(" [Sheet: ", 1)[1][:-1]
+            # Worker processes cannot call back for sheets, so they get every sheet up front
+            if PANDAS_AGENT_ISOLATION in ("process", "sandbox") or sheet.lower() in query_lower:
+                try:
+                    self.materialize_sheet(thread_id, key)
+                    loaded.append(key)
+                except Exception as e:
+                    logging.warning(f"Could not load sheet '{key}': {e}")
+        return loaded
+
+    def get_workbook_stats(self):
+        with self.workbooks_lock:
+            return {**self.workbook_stats, "open_workbooks": len(self.workbooks)}
+
+    def _load_snapshots(self, file_info):
         """
-        More thorough search for a file in the /tmp directory.
+        Load previously parsed dataframes for an upload from its Parquet snapshots.
         
         Args:
-            filename (str): Original filename to search for
+            file_info (dict): File information including the upload's sha256
             
         Returns:
-            str or None: Path if found, None otherwise
+            dict or None: Dataframes keyed by name, or None if no usable snapshot exists
         """
-        try:
-            # Try direct match first (pandas_agent_timestamp_filename)
-            direct_matches = []
-            prefix_matches = []
-            partial_matches = []
-            safe_copy_matches = []
-            
-            # Clean filename for pattern matching
-            clean_filename = re.sub(r'[^a-zA-Z0-9.]', '_', filename)
-            filename_lower = filename.lower()
-            filename_parts = re.split(r'[_\s.-]', filename_lower)
-            filename_parts = [p for p in filename_parts if len(p) > 2]  # Filter out very short parts
-            
-            for tmp_file in os.listdir('/tmp'):
-                tmp_path = os.path.join('/tmp', tmp_file)
-                if not os.path.isfile(tmp_path):
-                    continue
-                    
-                tmp_lower = tmp_file.lower()
-                
-                # Direct pandas agent match
-                if tmp_lower.startswith('pandas_agent_') and filename_lower in tmp_lower:
-                    direct_matches.append(tmp_path)
-                    
-                # Safe copy match
-                elif tmp_lower.startswith('safe_') and clean_filename.lower() in tmp_lower:
-                    safe_copy_matches.append(tmp_path)
-                    
-                # Prefix match (any prefix + exact filename)
-                elif tmp_lower.endswith(filename_lower):
-                    prefix_matches.append(tmp_path)
-                    
-                # Partial match (filename parts)
-                elif any(part in tmp_lower for part in filename_parts):
-                    # Calculate match score: how many parts match
-                    match_score = sum(1 for part in filename_parts if part in tmp_lower)
-                    if match_score >= len(filename_parts) // 2:  # At least half the parts match
-                        partial_matches.append((tmp_path, match_score))
-            
-            # Return best match in priority order
-            if direct_matches:
-                # Multiple matches - take newest
-                return max(direct_matches, key=os.path.getctime)
-            elif safe_copy_matches:
-                return max(safe_copy_matches, key=os.path.getctime)
-            elif prefix_matches:
-                return max(prefix_matches, key=os.path.getctime)
-            elif partial_matches:
-                # Sort by match score (descending) and then by creation time (newest first)
-                partial_matches.sort(key=lambda x: (-x[1], -os.path.getctime(x[0])))
-                return partial_matches[0][0]
-                
+        sha256 = file_info.get("sha256")
+        if not sha256 or not PYARROW_AVAILABLE:
             return None
+        
+        snapshots = file_registry.get_snapshots(sha256)
+        if not snapshots:
+            return None
+        
+        file_name = file_info.get("name", "unnamed_file")
+        try:
+            dfs_dict = {}
+            for sheet, path in snapshots:
+                key = f"{file_name} [Sheet: {sheet}]" if sheet else file_name
+                dfs_dict[key] = pd.read_parquet(path, engine="pyarrow")
+            logging.info(f"Loaded '{file_name}' from {len(snapshots)} Parquet snapshot(s)")
+            return dfs_dict
         except Exception as e:
-            logging.error(f"Error locating file in /tmp: {e}")
+            logging.warning(f"Could not read snapshots for '{file_name}', parsing the original file: {e}")
             return None
-
-    def load_dataframe_from_file(self, file_info):
+    
+    def _store_snapshots(self, file_info, dfs_dict):
+        """
+        Persist parsed dataframes as Parquet so other workers and restarts skip parsing.
+        
+        Args:
+            file_info (dict): File information including the upload's sha256
+            dfs_dict (dict): Dataframes keyed by name, as returned by the parser
+            
+        Returns:
+            dict: The same dataframes, for chaining into the loader's return value
+        """
+        sha256 = file_info.get("sha256")
+        if not sha256 or not PYARROW_AVAILABLE:
+            return dfs_dict
+        
+        file_name = file_info.get("name", "unnamed_file")
+        snapshot_dir = os.path.join(PANDAS_SNAPSHOT_DIR, "uploads", sha256)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        
+        snapshots = []
+        try:
+            for position, (key, df) in enumerate(dfs_dict.items()):
+                sheet = self._sheet_name(file_name, key)
+                path = os.path.join(snapshot_dir, f"{position}.parquet")
+                staging_path = f"{path}.{uuid.uuid4().hex}.part"
+                # Parquet requires string column names
+                frame = df if all(isinstance(c, str) for c in df.columns) else df.rename(columns=str)
+                frame.to_parquet(staging_path, engine="pyarrow")
+                os.replace(staging_path, path)
+                snapshots.append((sheet, path))
+            file_registry.save_snapshots(sha256, snapshots)
+            logging.info(f"Stored {len(snapshots)} Parquet snapshot(s) for '{file_name}'")
+        except Exception as e:
+            logging.warning(f"Could not snapshot '{file_name}': {e}")
+        
+        return dfs_dict
+    
+    def load_dataframe_from_file(self, file_info, thread_id=None):
         """
         Load dataframe(s) from file information with robust error handling.
-        Enhanced with better file discovery and safe copy management.
+        Enhanced with better file discovery; stored uploads are read in place.
         
         Args:
             file_info (dict): Dictionary containing file metadata
+            thread_id (str, optional): Thread used to resolve a missing path via the registry
             
         Returns:
             tuple: (dict of dataframes, error message)
@@ -4551,8 +7601,8 @@ class PandasAgentManager:
         
         # Verify original file path
         if not file_path or not os.path.exists(file_path):
-            # Try to find the file using our enhanced search method
-            located_path = self._locate_file_in_tmp(file_name)
+            # Try to resolve the file through the upload registry
+            located_path = self._locate_file(thread_id, file_name)
             
             if located_path:
                 logging.info(f"Using alternative path for {file_name}: {located_path}")
@@ -4561,7 +7611,7 @@ class PandasAgentManager:
                 file_info["path"] = file_path
             else:
                 # Still couldn't find the file - create a detailed error
-                error_msg = f"File '{file_name}' could not be found. Original path '{file_path}' does not exist and no matches found in /tmp."
+                error_msg = f"File '{file_name}' could not be found. Original path '{file_path}' does not exist and it is not registered for this session."
                 logging.error(error_msg)
                 return None, error_msg
         
@@ -4572,111 +7622,129 @@ class PandasAgentManager:
                 first_bytes = f_check.read(20)
             logging.info(f"File '{file_name}' exists, size: {file_size} bytes, first bytes: {first_bytes}")
             
-            # Make a copy of the file with a simplified name to avoid path issues
-            # Use a timestamp to ensure uniqueness and help track file age
-            timestamp = int(time.time())
-            simple_name = re.sub(r'[^a-zA-Z0-9.]', '_', file_name)  # Replace problematic chars with underscore
-            safe_path = f"/tmp/safe_{timestamp}_{simple_name}"
+            # Read the stored blob in place; it is read-only and shared, so no copy is needed
+            upload_store.touch(file_path)
             
-            with open(file_path, 'rb') as src, open(safe_path, 'wb') as dst:
-                dst.write(src.read())
-            
-            logging.info(f"Created safe copy of file at: {safe_path}")
+            workbook = None
+            if file_type == "excel":
+                try:
+                    # Only the sheet list is read here; sheets are parsed below or on demand
+                    workbook = self._open_workbook(file_path, file_info.get("sha256"))
+                    logging.info(f"Excel file contains {len(workbook.sheet_names)} sheets: {workbook.sheet_names}")
+                except Exception as e:
+                    return None, f"Error accessing Excel file: {str(e)}"
             
-            # Update file_path to use the safe copy
-            file_path = safe_path
-            file_info["path"] = safe_path
+            # Reuse dataframes already parsed from this upload by any worker
+            # (lazy workbooks snapshot sheet by sheet, so they are read through the workbook)
+            snapshot_dfs = None if workbook and workbook.lazy else self._load_snapshots(file_info)
+            if snapshot_dfs:
+                return snapshot_dfs, None
             
             # Rest of the existing file loading code 
             if file_type == "csv":
-                # Try with different encodings and delimiters for robustness
-                encodings = ['utf-8', 'latin-1', 'iso-8859-1']
-                delimiters = [',', ';', '\t', '|']
+                # Files too large for memory are queried out of core instead of parsed into pandas
+                if file_size >= PANDAS_OUT_OF_CORE_THRESHOLD_MB * 1024 * 1024:
+                    if DUCKDB_AVAILABLE:
+                        try:
+                            table = OutOfCoreTable(file_name, out_of_core_engine.ingest_csv(file_path, file_info.get("sha256")))
+                            logging.info(f"'{file_name}' ({file_size / (1024 * 1024):.0f} MB) opened out of core. Shape: {table.shape}")
+                            return {file_name: table}, None
+                        except Exception as e:
+                            return None, f"Failed to prepare '{file_name}' for out-of-core analysis: {str(e)}"
+                    logging.warning(f"duckdb is not installed; loading {file_size / (1024 * 1024):.0f} MB file '{file_name}' into memory")
+                
+                # Detect encoding and delimiter from a sample, then parse the file once
+                encoding, delimiter = sniff_csv_format(file_path)
+                logging.info(f"Sniffed CSV format for '{file_name}': encoding {encoding}, delimiter '{delimiter}'")
                 
                 df = None
                 error_msgs = []
-                successful_encoding = None
-                successful_delimiter = None
-                
-                # Try each encoding
-                for encoding in encodings:
-                    if df is not None:
+                parse_attempts = []
+                if PYARROW_AVAILABLE:
+                    parse_attempts.append(("pyarrow", encoding))
+                parse_attempts.append(("c", encoding))
+                if encoding not in ('latin-1', 'iso-8859-1'):
+                    # latin-1 decodes any byte sequence, so it is the last resort
+                    parse_attempts.append(("c", 'latin-1'))
+                
+                for engine, attempt_encoding in parse_attempts:
+                    try:
+                        read_kwargs = {"encoding": attempt_encoding, "sep": delimiter, "engine": engine, "dtype_backend": "numpy_nullable"}
+                        if engine == "c":
+                            read_kwargs["low_memory"] = False
+                        df = pd.read_csv(file_path, **read_kwargs)
+                        encoding = attempt_encoding
+                        logging.info(f"Loaded CSV with {engine} engine, encoding {attempt_encoding} and delimiter '{delimiter}'")
                         break
-                    
-                    for delimiter in delimiters:
-                        try:
-                            # Use the safe path directly
-                            df = pd.read_csv(safe_path, encoding=encoding, sep=delimiter, low_memory=False)
-                            
-                            if len(df.columns) > 1:  # Successfully parsed with >1 column
-                                logging.info(f"Successfully loaded CSV with encoding {encoding} and delimiter '{delimiter}'")
-                                successful_encoding = encoding
-                                successful_delimiter = delimiter
-                                break
-                        except Exception as e:
-                            error_msgs.append(f"Failed with {encoding}/{delimiter}: {str(e)}")
-                            continue
+                    except Exception as e:
+                        error_msgs.append(f"Failed with {engine}/{attempt_encoding}: {str(e)}")
                 
                 if df is None:
                     detailed_error = " | ".join(error_msgs[:5])
-                    return None, f"Failed to load CSV file with any encoding/delimiter combination. Errors: {detailed_error}"
+                    return None, f"Failed to load CSV file. Errors: {detailed_error}"
                 
                 # Clean up column names
-                df.columns = df.columns.str.strip()
+                df.columns = df.columns.astype(str).str.strip()
                 
-                # Replace NaN values with None for better handling
-                df = df.replace({np.nan: None})
+                # Keep compact native dtypes (nullable numbers, dates, categoricals)
+                df = optimize_dataframe_dtypes(df)
                 
                 # Log dataframe info for debugging
-                logging.info(f"CSV loaded successfully. Shape: {df.shape}, Columns: {list(df.columns)}")
-                logging.info(f"Used encoding: {successful_encoding}, delimiter: '{successful_delimiter}'")
+                logging.info(f"CSV loaded successfully. Shape: {df.shape}, Columns: {list(df.columns)}, "
+                             f"Memory: {df.memory_usage(deep=True).sum() / (1024 * 1024):.1f} MB")
+                logging.info(f"Used encoding: {encoding}, delimiter: '{delimiter}'")
                 
                 # Return with original filename as key
-                return {file_name: df}, None
+                return self._store_snapshots(file_info, {file_name: df}), None
                 
             elif file_type == "excel":
-                # Excel loading code remains the same, but use safe_path
-                result_dfs = {}
-                
-                try:
-                    xls = pd.ExcelFile(safe_path)
-                    sheet_names = xls.sheet_names
-                    logging.info(f"Excel file contains {len(sheet_names)} sheets: {sheet_names}")
-                except Exception as e:
-                    return None, f"Error accessing Excel file: {str(e)}"
+                sheet_names = workbook.sheet_names
                 
-                if len(sheet_names) == 1:
-                    # Single sheet - load directly with the filename as key
+                if workbook.lazy:
+                    # Large workbook - materialize the first sheet now; the others are parsed
+                    # when a query names them or the agent calls load_sheet()
                     try:
-                        df = pd.read_excel(safe_path, engine='openpyxl')
-                        df.columns = df.columns.str.strip()
-                        df = df.replace({np.nan: None})
-                        result_dfs[file_name] = df
-                        
-                        # Log dataframe info for debugging
-                        logging.info(f"Excel sheet loaded successfully. Shape: {df.shape}, Columns: {list(df.columns)}")
+                        df = self._load_workbook_sheet(workbook, sheet_names[0])
                     except Exception as e:
                         return None, f"Error reading Excel sheet: {str(e)}"
-                else:
-                    # Multiple sheets - load each sheet with a compound key
-                    for sheet in sheet_names:
+                    with self.workbooks_lock:
+                        self.workbook_stats["lazy_workbooks"] += 1
+                    logging.info(f"Loaded sheet '{sheet_names[0]}' of '{file_name}'; deferred {len(sheet_names) - 1} other sheet(s) until used")
+                    return {f"{file_name} [Sheet: {sheet_names[0]}]": df}, None
+                
+                result_dfs = {}
+                try:
+                    if len(sheet_names) == 1:
+                        # Single sheet - load directly with the filename as key
                         try:
-                            df = pd.read_excel(safe_path, sheet_name=sheet, engine='openpyxl')
-                            df.columns = df.columns.str.strip()
-                            df = df.replace({np.nan: None})
-                            
-                            # Create a key that includes the sheet name
-                            sheet_key = f"{file_name} [Sheet: {sheet}]"
-                            result_dfs[sheet_key] = df
+                            df = workbook.parse(sheet_names[0])
+                            result_dfs[file_name] = df
                             
                             # Log dataframe info for debugging
-                            logging.info(f"Excel sheet '{sheet}' loaded successfully. Shape: {df.shape}, Columns: {list(df.columns)}")
+                            logging.info(f"Excel sheet loaded successfully. Shape: {df.shape}, Columns: {list(df.columns)}")
                         except Exception as e:
-                            logging.error(f"Error reading sheet '{sheet}' in {file_name}: {str(e)}")
-                            # Continue with other sheets even if one fails
+                            return None, f"Error reading Excel sheet: {str(e)}"
+                    else:
+                        # Multiple sheets - load each sheet with a compound key
+                        for sheet in sheet_names:
+                            try:
+                                df = workbook.parse(sheet)
+                                
+                                # Create a key that includes the sheet name
+                                sheet_key = f"{file_name} [Sheet: {sheet}]"
+                                result_dfs[sheet_key] = df
+                                
+                                # Log dataframe info for debugging
+                                logging.info(f"Excel sheet '{sheet}' loaded successfully. Shape: {df.shape}, Columns: {list(df.columns)}")
+                            except Exception as e:
+                                logging.error(f"Error reading sheet '{sheet}' in {file_name}: {str(e)}")
+                                # Continue with other sheets even if one fails
+                finally:
+                    # Every sheet is parsed; later loads come from the snapshots
+                    workbook.close()
                 
                 if result_dfs:
-                    return result_dfs, None
+                    return self._store_snapshots(file_info, result_dfs), None
                 else:
                     return None, "Failed to load any sheets from Excel file"
             else:
@@ -4689,6 +7757,8 @@ class PandasAgentManager:
     def get_or_create_agent(self, thread_id):
         """
         Get or create a pandas agent for a thread with clear dataframe reference instructions.
+        The agent is built once per thread; when the thread's files change, its Python
+        tool is rebound to the current dataframes in place instead of rebuilding.
         
         Args:
             thread_id (str): Thread ID
@@ -4699,195 +7769,633 @@ class PandasAgentManager:
         # Initialize thread storage if needed
         self.initialize_thread(thread_id)
         
+        # Check if we have any dataframes
+        dataframes = self.dataframes_cache[thread_id]
+        if not dataframes:
+            return None, None, ["No dataframes available for analysis"]
+        
+        binding_key = tuple((name, id(df)) for name, df in dataframes.items())
+        agent = self.agents_cache.get(thread_id)
+        
+        if agent is not None and self.agent_bindings.get(thread_id) != binding_key:
+            if self._bind_dataframes(agent, dataframes):
+                logging.info(f"Rebound pandas agent for thread {thread_id} to dataframes: {list(dataframes.keys())}")
+            else:
+                agent = None
+        
+        if agent is None:
+            logging.info(f"Creating pandas agent for thread {thread_id} with dataframes: {list(dataframes.keys())}")
+            agent, errors = self._build_agent(dataframes)
+            if not agent:
+                return None, dataframes, errors
+            self.agents_cache[thread_id] = agent
+            logging.info(f"Successfully created pandas agent for thread {thread_id}")
+        
+        # Let the agent parse deferred workbook sheets itself via load_sheet(name)
+        repl_tool = self._repl_tool(agent)
+        if repl_tool is not None:
+            repl_tool.locals["load_sheet"] = lambda name: self.materialize_sheet(thread_id, name)
+        
+        self.agent_bindings[thread_id] = binding_key
+        return agent, dataframes, []
+    
+    @staticmethod
+    def _repl_tool(agent):
+        """The Python REPL tool of an agent built by _build_agent, or None."""
+        return next(
+            (tool for tool in getattr(agent, "tools", []) if isinstance(getattr(tool, "locals", None), dict)),
+            None
+        )
+    
+    @staticmethod
+    def _use_sandbox_tool(agent):
+        """
+        Replace an agent's in-process Python REPL tool with one that runs code in a sandbox worker.
+        
+        The replacement keeps the REPL tool's name and input schema, so the tool calls the LLM
+        is bound to resolve to it. It runs code in the SandboxSession that _run_in_sandbox opens
+        for the current analysis and refuses to run anything outside of one.
+        
+        Returns:
+            bool: True if the agent had a REPL tool to replace
+        """
+        repl_tool = PandasAgentManager._repl_tool(agent)
+        if repl_tool is None:
+            return False
+        from langchain_core.tools import BaseTool
+        
+        class SandboxPythonTool(BaseTool):
+            runs_in_sandbox: bool = True
+            
+            def _run(self, query: str, run_manager=None) -> str:
+                session = current_sandbox_session.get()
+                if session is None:
+                    return "Error: Python code can only run in a sandbox session"
+                return session.run(query)
+        
+        sandbox_tool = SandboxPythonTool(
+            name=repl_tool.name,
+            description=repl_tool.description,
+            args_schema=repl_tool.args_schema
+        )
+        agent.tools = [sandbox_tool if tool is repl_tool else tool for tool in agent.tools]
+        return True
+    
+    def _bind_dataframes(self, agent, dfs, clear_locals=False):
+        """
+        Point an agent's Python REPL tool at a new set of dataframes.
+        
+        The frames are exposed as 'df' (first frame), 'dfs' (list) and df1..dfN, matching
+        the names used by create_pandas_dataframe_agent and the analysis queries.
+        
+        Args:
+            agent: Agent executor built by _build_agent
+            dfs (Dict[str, pd.DataFrame]): Dataframes keyed by file name
+            clear_locals (bool): Also drop variables left by earlier queries
+                (used when an agent is shared between threads)
+            
+        Returns:
+            bool: True if the agent was rebound, False if it has no REPL tool to rebind
+        """
+        start_time = time.perf_counter()
+        repl_tool = self._repl_tool(agent)
+        if repl_tool is None:
+            # Sandbox agents have no in-process namespace; each run publishes the current frames
+            return any(getattr(tool, "runs_in_sandbox", False) for tool in getattr(agent, "tools", []))
+        
+        frames = list(dfs.values())
+        repl_locals = repl_tool.locals
+        if clear_locals:
+            repl_locals.clear()
+        for name in [n for n in repl_locals if n in ("df", "dfs") or re.fullmatch(r"df\d+", n)]:
+            del repl_locals[name]
+        repl_locals["df"] = frames[0]
+        repl_locals["dfs"] = frames
+        for i, frame in enumerate(frames, start=1):
+            repl_locals[f"df{i}"] = frame
+        
+        elapsed = time.perf_counter() - start_time
+        with self.agent_stats_lock:
+            self.agent_stats["rebinds"] += 1
+            self.agent_stats["last_rebind_seconds"] = elapsed
+        return True
+    
+    def _build_agent(self, dfs):
+        """
+        Build a pandas agent and bind it to a set of dataframes.
+        
+        The prompt does not describe individual dataframes (the analysis query does),
+        so the same agent can later be rebound with _bind_dataframes.
+        
+        Args:
+            dfs (Dict[str, pd.DataFrame]): Dataframes keyed by file name
+            
+        Returns:
+            tuple: (agent, errors)
+        """
         # Import required modules
         try:
             # Try langchain.agents first (more stable)
             try:
                 from langchain.agents import create_pandas_dataframe_agent
-                from langchain.agents import AgentType
                 agent_module = "langchain.agents"
             except ImportError:
                 # Fall back to experimental if needed
                 from langchain_experimental.agents import create_pandas_dataframe_agent
-                from langchain.agents import AgentType
                 agent_module = "langchain_experimental.agents"
                 
-            import pandas as pd
             logging.info(f"Using {agent_module} module for pandas agent creation")
         except ImportError as e:
-            return None, None, [f"Required libraries not available: {str(e)}"]
+            return None, [f"Required libraries not available: {str(e)}"]
         
         # Initialize the LLM
         try:
             llm = self.get_llm()
         except Exception as e:
-            return None, None, [f"Failed to initialize LLM: {str(e)}"]
-        
-        # Check if we have any dataframes
-        if not self.dataframes_cache[thread_id]:
-            return None, None, ["No dataframes available for analysis"]
+            return None, [f"Failed to initialize LLM: {str(e)}"]
+                
+        start_time = time.perf_counter()
+        # create_pandas_dataframe_agent only accepts pandas frames; out-of-core tables are
+        # represented by their first rows and bound in full by _bind_dataframes below
+        frames = [df.head(5) if isinstance(df, OutOfCoreTable) else df for df in dfs.values()]
         
-        # Create or update the agent if needed
-        if thread_id not in self.agents_cache or self.agents_cache[thread_id] is None:
-            try:
-                # Get all dataframes and file names
-                dfs = self.dataframes_cache[thread_id]
-                
-                # Log the dataframes we're dealing with
-                df_names = list(dfs.keys())
-                logging.info(f"Creating pandas agent for thread {thread_id} with dataframes: {df_names}")
-                
-                # IMPORTANT: Create a prefix that explains how to access dataframes
-                if len(dfs) == 1:
-                    # Single dataframe case
-                    df_name = list(dfs.keys())[0]
-                    df = dfs[df_name]
-                    
-                    # Create agent with clear instructions
-                    prefix = f"""You are working with a pandas dataframe.
-    The dataframe is available as 'df' and represents the file: '{df_name}'
-    Shape: {df.shape}
-    Columns: {list(df.columns)}
-    
-    Important: The dataframe is ALREADY LOADED as 'df'. DO NOT try to read the file from disk.
-    """
-                    
-                    self.agents_cache[thread_id] = create_pandas_dataframe_agent(
-                        llm,
-                        df,
-                        prefix=prefix,
-                        verbose=True,
-                        agent_type="tool-calling",
-                        handle_parsing_errors=True,
-                        allow_dangerous_code=True,
-                        max_iterations=30,
-                        max_execution_time=120
-                    )
-                    
-                else:
-                    # Multiple dataframes case
-                    df_list = list(dfs.values())
-                    
-                    # Create a mapping explanation
-                    df_mapping = []
-                    for i, (name, df) in enumerate(dfs.items()):
-                        df_mapping.append(f"  dfs[{i}]: '{name}' - Shape: {df.shape}, Columns: {list(df.columns)[:5]}...")
-                    
-                    mapping_text = "\n".join(df_mapping)
-                    
-                    # Create prefix with clear instructions
-                    prefix = f"""You are working with multiple pandas dataframes in a list called 'dfs'.
-    
-    Available dataframes:
-    {mapping_text}
-    
-    To access a specific dataframe:
-    - Use dfs[0] for the first file, dfs[1] for the second, etc.
-    - The dataframes are ALREADY LOADED. DO NOT try to read files from disk.
-    
-    Example: To analyze the first dataframe, use: dfs[0].describe()
+        # The agent trace is collected through callbacks, so verbose stdout output is off
+        try:
+            # IMPORTANT: Create a prefix that explains how to access dataframes
+            prefix = """You are working with pandas dataframes that are ALREADY LOADED in the Python session.
+    - 'df' is the first dataframe.
+    - 'dfs' is a list of all loaded dataframes: use dfs[0] for the first file, dfs[1] for the second, etc.
+      They are also available as df1, df2, ...
+    - Each question lists the available dataframes with their shapes and columns.
+    
+    Important: DO NOT try to read files from disk.
     """
                     
-                    self.agents_cache[thread_id] = create_pandas_dataframe_agent(
-                        llm,
-                        df_list,
-                        prefix=prefix,
-                        verbose=True,
-                        agent_type="tool-calling",
-                        handle_parsing_errors=True,
-                        allow_dangerous_code=True,
-                        max_iterations=30,
-                        max_execution_time=120
-                    )
-                    
-                logging.info(f"Successfully created pandas agent for thread {thread_id}")
+            agent = create_pandas_dataframe_agent(
+                llm,
+                frames,
+                prefix=prefix,
+                include_df_in_prompt=False,
+                verbose=False,
+                agent_type="tool-calling",
+                handle_parsing_errors=True,
+                allow_dangerous_code=True,
+                max_iterations=30,
+                max_execution_time=120
+            )
                 
-            except Exception as e:
-                # If the prefix parameter is not supported, try without it
-                try:
-                    logging.warning(f"Creating agent without prefix parameter")
-                    
-                    if len(dfs) == 1:
-                        df = list(dfs.values())[0]
-                        self.agents_cache[thread_id] = create_pandas_dataframe_agent(
-                            llm,
-                            df,
-                            verbose=True,
-                            agent_type="tool-calling",
-                            handle_parsing_errors=True,
-                            allow_dangerous_code=True,
-                            max_iterations=30,
-                            max_execution_time=120
-                        )
-                    else:
-                        df_list = list(dfs.values())
-                        self.agents_cache[thread_id] = create_pandas_dataframe_agent(
-                            llm,
-                            df_list,
-                            verbose=True,
-                            agent_type="tool-calling",
-                            handle_parsing_errors=True,
-                            allow_dangerous_code=True,
-                            max_iterations=30,
-                            max_execution_time=120
-                        )
+        except Exception as e:
+            # If the prefix parameter is not supported, try without it
+            try:
+                logging.warning(f"Creating agent without prefix parameter")
+                
+                agent = create_pandas_dataframe_agent(
+                    llm,
+                    frames[0] if len(frames) == 1 else frames,
+                    verbose=False,
+                    agent_type="tool-calling",
+                    handle_parsing_errors=True,
+                    allow_dangerous_code=True,
+                    max_iterations=30,
+                    max_execution_time=120
+                )
                         
-                    logging.info(f"Successfully created pandas agent without prefix")
-                    
-                except Exception as e2:
-                    error_msg = f"Failed to create pandas agent: {str(e2)}"
-                    logging.error(f"{error_msg}\n{traceback.format_exc()}")
-                    return None, self.dataframes_cache[thread_id], [error_msg]
+                logging.info(f"Successfully created pandas agent without prefix")
+                    
+            except Exception as e2:
+                error_msg = f"Failed to create pandas agent: {str(e2)}"
+                logging.error(f"{error_msg}\n{traceback.format_exc()}")
+                return None, [error_msg]
+    
+        self._bind_dataframes(agent, dfs)
+        if PANDAS_AGENT_ISOLATION == "sandbox" and not self._use_sandbox_tool(agent):
+            return None, ["Failed to create pandas agent: it has no Python tool to sandbox"]
+        
+        elapsed = time.perf_counter() - start_time
+        with self.agent_stats_lock:
+            self.agent_stats["builds"] += 1
+            self.agent_stats["build_seconds_total"] += elapsed
+            self.agent_stats["last_build_seconds"] = elapsed
+        logging.info(f"Built pandas agent over {len(frames)} dataframe(s) in {elapsed:.3f}s")
+        return agent, []
+    
+    def get_dataframes_fingerprint(self, thread_id, dataframes):
+        """
+        Content fingerprint of a thread's dataframes, recomputed only when add_file or
+        remove_oldest_file has changed the set of dataframe objects.
         
-        return self.agents_cache[thread_id], self.dataframes_cache[thread_id], []
+        Args:
+            thread_id (str): Thread ID
+            dataframes (Dict[str, pd.DataFrame]): The thread's current dataframes
+            
+        Returns:
+            str or None: Fingerprint, or None if it cannot be computed
+        """
+        binding_key = tuple((name, id(df)) for name, df in dataframes.items())
+        cached = self.fingerprints.get(thread_id)
+        if cached and cached[0] == binding_key:
+            return cached[1]
+        fingerprint = PandasResultCache.fingerprint(dataframes)
+        self.fingerprints[thread_id] = (binding_key, fingerprint)
+        return fingerprint
+    
+    def get_agent_stats(self):
+        """Agent build and rebind counters for monitoring."""
+        with self.agent_stats_lock:
+            stats = dict(self.agent_stats)
+        stats["cached_agents"] = sum(1 for agent in self.agents_cache.values() if agent is not None)
+        return stats
     
     def check_file_availability(self, thread_id, query):
         """
-        Check if a file mentioned in the query is available in the dataframes cache.
-        If not, identify which file is missing to inform the user.
+        Check if a file mentioned in the query is available in the dataframes cache.
+        If not, identify which file is missing to inform the user.
+        
+        Args:
+            thread_id (str): Thread ID
+            query (str): The query string to check
+            
+        Returns:
+            tuple: (bool, missing_file_name)
+        """
+        if thread_id not in self.dataframes_cache:
+            return False, None
+            
+        # Get all dataframe names for this thread
+        available_files = set(self.dataframes_cache[thread_id].keys())
+        
+        # Get all file information for this thread (for historical checks)
+        all_files_ever_uploaded = set()
+        
+        # First add files that are currently in the cache
+        for file_info in self.file_info_cache.get(thread_id, []):
+            file_name = file_info.get("name", "")
+            if file_name:
+                all_files_ever_uploaded.add(file_name.lower())
+        
+        # Look for any file name in the query
+        query_lower = query.lower()
+        
+        # First check active files
+        for file_name in available_files:
+            base_name = file_name.split(" [Sheet:")[0].lower()  # Handle Excel sheet names
+            if base_name in query_lower:
+                # Found a match in active files
+                return True, None
+                
+        # Check if any file is mentioned but not available (may have been removed by FIFO)
+        for file_name in all_files_ever_uploaded:
+            if file_name in query_lower and not any(file_name in af.lower() for af in available_files):
+                # Found a match in previously uploaded files, but not currently available
+                return False, file_name
+                
+        # No file mentioned or all mentioned files are available
+        return True, None
+    
+    def _build_agent_handler(self, trace, report=None, step_callback=None):
+        """
+        Build a LangChain callback handler that records the agent trace and reports progress.
+        Replaces capturing the agent's verbose stdout, which is shared by all requests.
+        
+        Args:
+            trace (List[str]): List the handler appends actions, observations and errors to
+            report (Callable, optional): Progress reporter taking (status, progress, message)
+            step_callback (Callable, optional): Called with (kind, text) for each generated code
+                step ("code") and tool output ("observation") as they happen, and with the
+                final answer's tokens ("token") once the agent finishes without calling a tool
+            
+        Returns:
+            BaseCallbackHandler or None if LangChain callbacks are unavailable
+        """
+        try:
+            from langchain_core.callbacks import BaseCallbackHandler
+        except ImportError:
+            return None
+        
+        def emit(kind, text):
+            if step_callback and text:
+                try:
+                    step_callback(kind, text)
+                except Exception as e:
+                    logging.warning(f"Step callback failed: {e}")
+        
+        class AgentTraceHandler(BaseCallbackHandler):
+            def __init__(self):
+                super().__init__()
+                self.iterations = 0
+                # Tokens of the current LLM call; they are the answer only if no tool call follows
+                self.answer_tokens = []
+            
+            def on_llm_start(self, serialized, prompts, **kwargs):
+                self.answer_tokens = []
+            
+            def on_chat_model_start(self, serialized, messages, **kwargs):
+                self.answer_tokens = []
+            
+            def on_llm_new_token(self, token, **kwargs):
+                if token:
+                    self.answer_tokens.append(token)
+            
+            def on_agent_action(self, action, **kwargs):
+                # Text the LLM wrote before calling a tool is reasoning, not the answer
+                self.answer_tokens = []
+                trace.append(f"Action: {action.tool}\nAction Input: {action.tool_input}")
+                tool_input = action.tool_input
+                if isinstance(tool_input, dict):
+                    tool_input = tool_input.get("query", json.dumps(tool_input))
+                emit("code", str(tool_input))
+            
+            def on_tool_start(self, serialized, input_str, **kwargs):
+                self.iterations += 1
+                if report:
+                    tool_name = (serialized or {}).get("name", "tool")
+                    report("executing", min(40 + 5 * self.iterations, 85), f"Step {self.iterations}: running {tool_name}")
+        
+            def on_tool_end(self, output, **kwargs):
+                trace.append(f"Observation: {output}")
+                emit("observation", str(output))
+            
+            def on_tool_error(self, error, **kwargs):
+                trace.append(f"Tool error: {type(error).__name__}: {error}")
+            
+            def on_agent_finish(self, finish, **kwargs):
+                trace.append(f"Final Answer: {finish.return_values.get('output', '')}")
+                for token in self.answer_tokens:
+                    emit("token", token)
+                self.answer_tokens = []
+        
+        return AgentTraceHandler()
+    
+    def _snapshot_dataframes(self, thread_id, dataframes):
+        """
+        Write Parquet snapshots of a thread's dataframes for worker processes.
+        Snapshots are reused while the dataframe object is unchanged.
+        
+        Args:
+            thread_id (str): Thread ID
+            dataframes (Dict[str, pd.DataFrame]): Dataframes keyed by name
+            
+        Returns:
+            Dict[str, str]: Snapshot path per dataframe name, or None if snapshots can't be written
+        """
+        if not PYARROW_AVAILABLE:
+            logging.warning("pyarrow is not installed; cannot snapshot dataframes for worker processes")
+            return None
+        if any(isinstance(df, OutOfCoreTable) for df in dataframes.values()):
+            # Out-of-core tables are already bounded by the DuckDB memory limit
+            logging.info(f"Thread {thread_id} has out-of-core tables; running the agent in-process")
+            return None
+        
+        thread_dir = os.path.join(PANDAS_SNAPSHOT_DIR, hashlib.sha1(thread_id.encode()).hexdigest()[:16])
+        os.makedirs(thread_dir, exist_ok=True)
+        cache = self.snapshot_cache.setdefault(thread_id, {})
+        paths = {}
+        
+        for name, df in dataframes.items():
+            cached = cache.get(name)
+            if cached and cached[0] is df and os.path.exists(cached[1]):
+                paths[name] = cached[1]
+                continue
+            
+            path = os.path.join(thread_dir, f"{uuid.uuid4().hex}.parquet")
+            try:
+                # Parquet requires string column names
+                frame = df if all(isinstance(c, str) for c in df.columns) else df.rename(columns=str)
+                frame.to_parquet(path, engine="pyarrow")
+            except Exception as e:
+                logging.warning(f"Could not snapshot dataframe '{name}' for thread {thread_id}: {e}")
+                if os.path.exists(path):
+                    os.remove(path)
+                return None
+            
+            if cached and os.path.exists(cached[1]):
+                os.remove(cached[1])
+            cache[name] = (df, path)
+            paths[name] = path
+        
+        # Drop snapshots of dataframes that are no longer loaded
+        for name in [n for n in cache if n not in dataframes]:
+            stale_path = cache.pop(name)[1]
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        
+        return paths
+    
+    def _get_process_pool(self):
+        """Create the worker process pool on first use."""
+        with self.process_pool_lock:
+            if self.process_pool is None:
+                # spawn avoids forking a process that holds running threads and event loops
+                self.process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=PANDAS_AGENT_MAX_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logging.info(f"Started pandas agent process pool with {PANDAS_AGENT_MAX_WORKERS} workers")
+            return self.process_pool
+    
+    def _reset_process_pool(self):
+        with self.process_pool_lock:
+            if self.process_pool is not None:
+                self.process_pool.shutdown(wait=False, cancel_futures=True)
+                self.process_pool = None
+    
+    def _run_in_process(self, thread_id, dataframes, enhanced_query, trace):
+        """
+        Run the agent for a query in a worker process.
+        
+        Args:
+            thread_id (str): Thread ID
+            dataframes (Dict[str, pd.DataFrame]): Dataframes to analyze
+            enhanced_query (str): Query for the agent
+            trace (List[str]): Receives the worker's agent trace
+            
+        Returns:
+            str: The agent's answer
+        """
+        snapshot_paths = self._snapshot_dataframes(thread_id, dataframes)
+        if snapshot_paths is None:
+            # Fall back to running in this process
+            logging.warning(f"Running pandas agent in-process for thread {thread_id}")
+            agent, _, agent_errors = self.get_or_create_agent(thread_id)
+            if not agent:
+                raise Exception(f"Failed to create pandas agent: {'; '.join(agent_errors)}")
+            agent_handler = self._build_agent_handler(trace)
+            return self._run_agent(agent, enhanced_query, [agent_handler] if agent_handler else None)
+        
+        future = self._get_process_pool().submit(run_pandas_agent_job, snapshot_paths, enhanced_query)
+        try:
+            result = future.result(timeout=PANDAS_AGENT_PROCESS_TIMEOUT)
+        except concurrent.futures.process.BrokenProcessPool:
+            self._reset_process_pool()
+            raise Exception("Pandas agent worker process crashed")
+        except concurrent.futures.TimeoutError:
+            raise Exception(f"Pandas agent worker did not finish within {PANDAS_AGENT_PROCESS_TIMEOUT}s")
+        
+        trace.extend(result["trace"])
+        if result["error"]:
+            logging.error(f"Pandas agent worker error: {result['error']}\n{result.get('traceback', '')}")
+            raise Exception(result["error"])
+        return result["output"]
+    
+    def _run_in_sandbox(self, thread_id, agent, dataframes, enhanced_query, trace, report=None, step_callback=None):
+        """
+        Run the agent in this process with its Python tool executing in a sandbox worker.
         
         Args:
             thread_id (str): Thread ID
-            query (str): The query string to check
+            agent: The thread's agent
+            dataframes (Dict[str, pd.DataFrame]): Dataframes to analyze
+            enhanced_query (str): Query for the agent
+            trace (List[str]): Receives the agent trace
+            report (Callable, optional): Progress reporter
+            step_callback (Callable, optional): Receives the agent's intermediate steps
             
         Returns:
-            tuple: (bool, missing_file_name)
+            str: The agent's answer
         """
-        if thread_id not in self.dataframes_cache:
-            return False, None
-            
-        # Get all dataframe names for this thread
-        available_files = set(self.dataframes_cache[thread_id].keys())
+        agent_handler = self._build_agent_handler(trace, report, step_callback)
+        callbacks = [agent_handler] if agent_handler else None
+        
+        if self._repl_tool(agent) is not None:
+            raise Exception("Pandas agent was not built for sandbox execution")
+        frames = sandbox_executor.publish(thread_id, dataframes)
+        if frames is None:
+            raise Exception("The dataframes could not be shared with the sandbox workers")
+        
+        # The agent's SandboxPythonTool runs code in this session for the duration of the run
+        session = sandbox_executor.open_session(frames)
+        token = current_sandbox_session.set(session)
+        try:
+            return self._run_agent(agent, enhanced_query, callbacks)
+        finally:
+            current_sandbox_session.reset(token)
+            session.close()
+    
+    def shutdown(self):
+        """Stop worker processes and close open workbooks."""
+        self._reset_process_pool()
+        with self.workbooks_lock:
+            workbooks = list(self.workbooks.values())
+            self.workbooks.clear()
+        for workbook in workbooks:
+            workbook.close()
+    
+    @staticmethod
+    def _run_agent(agent, enhanced_query, callbacks=None):
+        """
+        Run the agent on a query, falling back from run() to invoke().
         
-        # Get all file information for this thread (for historical checks)
-        all_files_ever_uploaded = set()
+        Returns:
+            str: The agent's answer
+        """
+        # First try using run method (per documentation)
+        try:
+            logging.info(f"Executing agent with run method: {enhanced_query}")
+            agent_output = agent.run(enhanced_query, callbacks=callbacks)
+            logging.info(f"Agent completed successfully with run() method: {agent_output[:100]}...")
+        except Exception as run_error:
+            # Fall back to invoke if run fails
+            logging.warning(f"Agent run() method failed: {str(run_error)}, trying invoke() method")
+            try:
+                agent_result = agent.invoke({"input": enhanced_query}, config={"callbacks": callbacks})
+                agent_output = agent_result.get("output", "")
+                logging.info(f"Agent completed successfully with invoke() method: {agent_output[:100]}...")
+            except Exception as invoke_error:
+                raise Exception(f"Agent run() failed: {str(run_error)}; invoke() also failed: {str(invoke_error)}")
+        return agent_output
+    
+    async def start_analysis(self, thread_id, query, files, progress_callback=None, step_callback=None):
+        """
+        Submit analyze() to the pandas job pool once no other analysis of this thread is running.
         
-        # First add files that are currently in the cache
-        for file_info in self.file_info_cache.get(thread_id, []):
-            file_name = file_info.get("name", "")
-            if file_name:
-                all_files_ever_uploaded.add(file_name.lower())
+        Analyses of one thread share its agent, REPL namespace and file caches, so they run
+        one at a time. The turn is held until the pool job itself finishes, not just until
+        the caller stops waiting, so a timed-out analysis still blocks the next one.
         
-        # Look for any file name in the query
-        query_lower = query.lower()
+        Args:
+            thread_id (str): Thread ID
+            query (str): Analysis query
+            files (List[Dict]): List of file information
+            progress_callback (Callable, optional): Passed through to analyze()
+            step_callback (Callable, optional): Passed through to analyze()
         
-        # First check active files
-        for file_name in available_files:
-            base_name = file_name.split(" [Sheet:")[0].lower()  # Handle Excel sheet names
-            if base_name in query_lower:
-                # Found a match in active files
-                return True, None
-                
-        # Check if any file is mentioned but not available (may have been removed by FIFO)
-        for file_name in all_files_ever_uploaded:
-            if file_name in query_lower and not any(file_name in af.lower() for af in available_files):
-                # Found a match in previously uploaded files, but not currently available
-                return False, file_name
-                
-        # No file mentioned or all mentioned files are available
-        return True, None
+        Returns:
+            asyncio.Task: Resolves to analyze()'s (result, error, removed_files), or raises
+                PandasJobsBusyError if the job pool is full
+        """
+        entry = self.analysis_locks.setdefault(thread_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        
+        def leave():
+            entry[1] -= 1
+            if entry[1] == 0 and self.analysis_locks.get(thread_id) is entry:
+                del self.analysis_locks[thread_id]
+        
+        def release(finished):
+            entry[0].release()
+            leave()
+        
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            leave()
+            raise
+        
+        job = asyncio.ensure_future(pandas_job_pool.run(
+            self.analyze,
+            thread_id=thread_id,
+            query=query,
+            files=files,
+            progress_callback=progress_callback,
+            step_callback=step_callback
+        ))
+        job.add_done_callback(release)
+        return job
+    
+    async def analyze_stream(self, thread_id, query, files, progress_callback=None):
+        """
+        Run analyze() on the pandas job pool and yield the agent's steps as they happen.
+        
+        Args:
+            thread_id (str): Thread ID
+            query (str): Analysis query
+            files (List[Dict]): List of file information
+            progress_callback (Callable, optional): Passed through to analyze()
+        
+        Yields:
+            dict: {"type": "code" | "observation" | "token", "text": str} while the agent runs,
+                then a final {"type": "result", "result", "error", "removed_files"}
+        
+        Raises:
+            PandasJobsBusyError: If the job pool is full
+        """
+        loop = asyncio.get_running_loop()
+        steps = asyncio.Queue()
+        
+        def on_step(kind, text):
+            # Called from the job pool thread
+            loop.call_soon_threadsafe(steps.put_nowait, {"type": kind, "text": text})
+        
+        job = await self.start_analysis(thread_id, query, files, progress_callback=progress_callback, step_callback=on_step)
+        try:
+            while not job.done():
+                next_step = asyncio.ensure_future(steps.get())
+                await asyncio.wait({next_step, job}, return_when=asyncio.FIRST_COMPLETED)
+                if next_step.done():
+                    yield next_step.result()
+                else:
+                    next_step.cancel()
+            
+            while not steps.empty():
+                yield steps.get_nowait()
+            result, error, removed_files = job.result()
+            yield {"type": "result", "result": result, "error": error, "removed_files": removed_files}
+        finally:
+            # A disconnected client must not leave the job's result unobserved
+            if not job.done():
+                job.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
     
-    def analyze(self, thread_id, query, files):
+    def analyze(self, thread_id, query, files, progress_callback=None, step_callback=None):
         """
         Analyze data with pandas agent.
         
@@ -4895,10 +8403,21 @@ class PandasAgentManager:
             thread_id (str): Thread ID
             query (str): Analysis query
             files (List[Dict]): List of file information
+            progress_callback (Callable, optional): Called with (status, progress, message)
+                as files load, the agent is built, each tool iteration runs and results are formatted
+            step_callback (Callable, optional): Called with (kind, text) for the agent's
+                intermediate steps; see _build_agent_handler
             
         Returns:
             tuple: (result, error, removed_files)
         """
+        def report(status, progress, message):
+            if progress_callback:
+                try:
+                    progress_callback(status, progress, message)
+                except Exception as e:
+                    logging.warning(f"Progress callback failed: {e}")
+        
         # Initialize thread if needed
         self.initialize_thread(thread_id)
         
@@ -4907,20 +8426,50 @@ class PandasAgentManager:
         
         # Load all files first
         if files:
-            for file_info in files:
+            report("loading", 10, f"Loading {len(files)} file(s)")
+            for index, file_info in enumerate(files, start=1):
                 _, _, removed_file = self.add_file(thread_id, file_info)
                 if removed_file:
                     removed_files.append(removed_file)
+                report("loading", 10 + 20 * index / len(files), f"Loaded {file_info.get('name', 'file')}")
         
         # Check if a file is mentioned but not available
         file_available, missing_file = self.check_file_availability(thread_id, query)
         if not file_available and missing_file:
             return None, f"The file '{missing_file}' is not currently available. Please re-upload the file as it may have been removed due to the 3-file limit per conversation.", removed_files
         
+        # Parse deferred workbook sheets the query names before anything looks at the data
+        loaded_sheets = self.materialize_mentioned_sheets(thread_id, query)
+        if loaded_sheets:
+            report("loading", 32, f"Loaded sheet(s): {', '.join(loaded_sheets)}")
+        
+        # Answer common questions (counts, schema, aggregates, top-N, ...) directly with pandas
+        out_of_core = {name: df for name, df in (self.dataframes_cache.get(thread_id) or {}).items() if isinstance(df, OutOfCoreTable)}
+        if PANDAS_FAST_PATH_ENABLED and not out_of_core:
+            fast_answer = pandas_query_planner.answer(query, self.dataframes_cache.get(thread_id) or {})
+            if fast_answer is not None:
+                report("formatting", 90, "Answered directly from the data")
+                return fast_answer, None, removed_files
+        
+        # Reuse an earlier agent answer for the same question about the same data
+        current_dataframes = self.dataframes_cache.get(thread_id) or {}
+        fingerprint = self.get_dataframes_fingerprint(thread_id, current_dataframes) if current_dataframes else None
+        cached_answer, query_embedding = pandas_result_cache.get(fingerprint, query)
+        if cached_answer is not None:
+            report("formatting", 90, "Reusing a previous answer for this data")
+            return cached_answer, None, removed_files
+        agent_start_time = time.perf_counter()
+        
         # Get or create the agent
-        agent, dataframes, agent_errors = self.get_or_create_agent(thread_id)
+        report("building_agent", 35, "Preparing analysis agent")
+        if PANDAS_AGENT_ISOLATION == "process":
+            # The agent is built inside the worker process from dataframe snapshots
+            dataframes = self.dataframes_cache.get(thread_id)
+            agent, agent_errors = None, []
+        else:
+            agent, dataframes, agent_errors = self.get_or_create_agent(thread_id)
         
-        if not agent:
+        if not agent and PANDAS_AGENT_ISOLATION != "process":
             error_msg = f"Failed to create pandas agent: {'; '.join(agent_errors)}"
             return None, error_msg, removed_files
         
@@ -4934,6 +8483,9 @@ class PandasAgentManager:
             if base_name.lower() in query.lower():
                 mentioned_files.append(df_name)
                 
+        # Profiles computed at registration describe the columns without rescanning the data
+        profiles = {name: self.get_profile(thread_id, name) for name in dataframes.keys()}
+                
         # Process the query - ENHANCED FOR BETTER CLARITY
         if len(dataframes) == 1:
             # Single dataframe case
@@ -4947,16 +8499,24 @@ class PandasAgentManager:
     Dataframe info:
     - Shape: {df.shape}
     - Columns: {list(df.columns)}
+    - Column profile:
+{dataframe_profiler.prompt_summary(profiles[df_name]) if profiles.get(df_name) else "      (not available)"}
     
     Analyze this dataframe to answer: {query}
     """
         else:
-            # Multiple dataframes case
+            # Multiple dataframes case; the agent prompt is generic, so describe each frame here
+            df_mapping = "\n".join(
+                f"    - dfs[{i}] (df{i + 1}): '{name}' - Shape: {frame.shape}, Columns:\n"
+                + (dataframe_profiler.prompt_summary(profiles[name]) if profiles.get(name) else f"      {list(frame.columns)}")
+                for i, (name, frame) in enumerate(dataframes.items())
+            )
             enhanced_query = f"""
     The dataframes are ALREADY LOADED. DO NOT try to load any files from disk.
     Use the dataframes that are already available to you.
     
-    Available dataframes: {', '.join(f"'{name}'" for name in dataframes.keys())}
+    Available dataframes:
+{df_mapping}
     
     Analyze these dataframes to answer: {query}
     """
@@ -4968,54 +8528,60 @@ class PandasAgentManager:
     The dataframe for '{mentioned_file}' is ALREADY LOADED. DO NOT try to load the file from disk.
     Use the dataframe that is already available to you.
     
-    Available dataframes: {', '.join(f"'{name}'" for name in dataframes.keys())}
+    Available dataframes:
+{df_mapping}
     
     Analyze this dataframe to answer: {query}
+    """
+        
+        # Tables too large for memory are queried with SQL rather than pandas
+        if out_of_core:
+            variables = {name: ("df" if len(dataframes) == 1 else f"df{i + 1}") for i, name in enumerate(dataframes)}
+            table_list = "\n".join(
+                f"    - {variables[name]}: '{name}' - {table.shape[0]} rows, columns and types: {table.dtypes}"
+                for name, table in out_of_core.items() if name in variables
+            )
+            example_variable = next((variables[name] for name in out_of_core if name in variables), "df")
+            enhanced_query += f"""
+    These tables are too large for memory and are NOT pandas DataFrames:
+{table_list}
+    Query them with SQL, naming the table 'df' inside the query, e.g.
+    {example_variable}.sql("SELECT col, SUM(x) AS total FROM df GROUP BY col ORDER BY total DESC LIMIT 10").
+    sql() returns a pandas DataFrame; aggregate, filter or LIMIT so results stay small. head(n), sample(n),
+    columns, dtypes and shape are also available. Never convert a whole table to pandas.
+    """
+        
+        # Sheets of large workbooks that are still unparsed; the agent loads them on request
+        unloaded_sheets = self.get_unloaded_sheets(thread_id)
+        if unloaded_sheets and PANDAS_AGENT_ISOLATION not in ("process", "sandbox"):
+            sheet_list = "\n".join(f"    - '{key}'" for key in unloaded_sheets)
+            enhanced_query += f"""
+    These workbook sheets are available but not loaded yet. If one is needed, load it with
+    load_sheet('<name>'), which returns its dataframe (e.g. sales = load_sheet('{unloaded_sheets[0]}')):
+{sheet_list}
     """
                 
         logging.info(f"Final query to process: {enhanced_query}")
         
         try:
-            # Invoke the agent with the query
-            import sys
-            from io import StringIO
-            
-            # Capture stdout to get verbose output for debugging
-            original_stdout = sys.stdout
-            captured_output = StringIO()
-            sys.stdout = captured_output
+            # Agent trace (actions, observations, errors) for debugging and fallbacks
+            trace = []
             
             try:
-                # Prepare dataframe details for error cases
-                df_details = []
-                for name, df in dataframes.items():
-                    df_details.append(f"DataFrame '{name}': {df.shape[0]} rows, {df.columns.shape[0]} columns")
-                    df_details.append(f"Columns: {', '.join(df.columns.tolist())}")
-                    # Add first few rows for debugging
-                    try:
-                        df_details.append(f"First 3 rows sample:\n{df.head(3)}")
-                    except:
-                        pass
-                
-                # First try using run method (per documentation)
-                try:
-                    logging.info(f"Executing agent with run method: {enhanced_query}")
-                    agent_output = agent.run(enhanced_query)
-                    logging.info(f"Agent completed successfully with run() method: {agent_output[:100]}...")
-                except Exception as run_error:
-                    # Fall back to invoke if run fails
-                    logging.warning(f"Agent run() method failed: {str(run_error)}, trying invoke() method")
-                    try:
-                        agent_result = agent.invoke({"input": enhanced_query})
-                        agent_output = agent_result.get("output", "")
-                        logging.info(f"Agent completed successfully with invoke() method: {agent_output[:100]}...")
-                    except Exception as invoke_error:
-                        # Try one last approach - if we see a file not found error
-                        raise Exception(f"Agent run() failed: {str(run_error)}; invoke() also failed: {str(invoke_error)}")
+                report("executing", 40, "Running analysis")
+                if PANDAS_AGENT_ISOLATION == "process":
+                    agent_output = self._run_in_process(thread_id, dataframes, enhanced_query, trace)
+                elif PANDAS_AGENT_ISOLATION == "sandbox":
+                    agent_output = self._run_in_sandbox(thread_id, agent, dataframes, enhanced_query, trace, report, step_callback)
+                else:
+                    agent_handler = self._build_agent_handler(trace, report, step_callback)
+                    agent_output = self._run_agent(agent, enhanced_query, [agent_handler] if agent_handler else None)
+                pandas_query_planner.record_agent_run(time.perf_counter() - agent_start_time)
                 
-                # Get the captured verbose output
-                verbose_output = captured_output.getvalue()
-                logging.info(f"Agent verbose output:\n{verbose_output}")
+                # Get the captured agent trace
+                verbose_output = "\n".join(trace)
+                logging.info(f"Agent trace:\n{verbose_output}")
+                report("formatting", 90, "Formatting results")
                 
                 # Check if output seems empty or error-like
                 if not agent_output or "I don't have access to" in agent_output or "not find" in agent_output.lower():
@@ -5026,39 +8592,16 @@ class PandasAgentManager:
                         "No such file" in verbose_output or
                         "NameError" in verbose_output or
                         "not defined" in verbose_output):
-                        # Generate a direct summary from the dataframes
-                        summary = []
-                        for name, df in dataframes.items():
-                            summary.append(f"## Summary of {name}")
-                            summary.append(f"* Shape: {df.shape[0]} rows, {df.shape[1]} columns")
-                            summary.append(f"* Columns: {', '.join(df.columns.tolist())}")
-                            
-                            # Add basic statistics for numeric columns
-                            try:
-                                num_cols = df.select_dtypes(include=['number']).columns
-                                if len(num_cols) > 0:
-                                    summary.append("\n### Basic Statistics for Numeric Columns:")
-                                    summary.append(df[num_cols].describe().to_string())
-                            except Exception as stats_err:
-                                summary.append(f"Error calculating statistics: {str(stats_err)}")
-                            
-                            # Add sample data
-                            try:
-                                summary.append("\n### Sample Data (First 5 rows):")
-                                summary.append(df.head(5).to_string())
-                            except Exception as sample_err:
-                                summary.append(f"Error showing sample: {str(sample_err)}")
-                                
-                            summary.append("\n")
-                            
-                        return "\n".join(summary), None, removed_files
+                        # Generate a direct summary from the precomputed profiles
+                        return self.profile_report(thread_id, dataframes.keys(), sample_rows=5), None, removed_files
                     else:
                         # Provide detailed dataframe information as fallback
-                        fallback_output = "I analyzed your data and found:\n\n" + "\n".join(df_details[:10])
+                        fallback_output = "I analyzed your data and found:\n\n" + self.profile_report(thread_id, dataframes.keys())
                         logging.info(f"Providing fallback output with basic dataframe info")
                         return fallback_output, None, removed_files
                 
                 # Final response - successful case
+                pandas_result_cache.put(fingerprint, query, agent_output, query_embedding)
                 return agent_output, None, removed_files
                 
             except Exception as e:
@@ -5066,8 +8609,8 @@ class PandasAgentManager:
                 tb = traceback.format_exc()
                 logging.error(f"Agent execution error: {error_detail}\n{tb}")
                 
-                # Get verbose output for debugging
-                verbose_output = captured_output.getvalue()
+                # Get agent trace for debugging
+                verbose_output = "\n".join(trace)
                 logging.info(f"Agent debugging output before error:\n{verbose_output}")
                 
                 # Check if there was a file not found error or variable name issue
@@ -5076,32 +8619,8 @@ class PandasAgentManager:
                     "FileNotFoundError" in error_detail or
                     "NameError" in error_detail or
                     "not defined" in error_detail):
-                    # Generate a direct summary from the dataframes
-                    summary = []
-                    for name, df in dataframes.items():
-                        summary.append(f"## Summary of {name}")
-                        summary.append(f"* Shape: {df.shape[0]} rows, {df.shape[1]} columns")
-                        summary.append(f"* Columns: {', '.join(df.columns.tolist())}")
-                        
-                        # Add basic statistics for numeric columns
-                        try:
-                            num_cols = df.select_dtypes(include=['number']).columns
-                            if len(num_cols) > 0:
-                                summary.append("\n### Basic Statistics for Numeric Columns:")
-                                summary.append(df[num_cols].describe().to_string())
-                        except Exception as stats_err:
-                            summary.append(f"Error calculating statistics: {str(stats_err)}")
-                        
-                        # Add sample data
-                        try:
-                            summary.append("\n### Sample Data (First 5 rows):")
-                            summary.append(df.head(5).to_string())
-                        except Exception as sample_err:
-                            summary.append(f"Error showing sample: {str(sample_err)}")
-                            
-                        summary.append("\n")
-                        
-                    return "\n".join(summary), None, removed_files
+                    # Generate a direct summary from the precomputed profiles
+                    return self.profile_report(thread_id, dataframes.keys(), sample_rows=5), None, removed_files
                 else:
                     # Re-raise other errors
                     raise e
@@ -5126,16 +8645,446 @@ class PandasAgentManager:
                 pass
                 
             return None, error_msg, removed_files
+def run_pandas_agent_job(snapshot_paths, enhanced_query):
+    """
+    Worker process entry point: load dataframe snapshots, run the agent and
+    return its answer with the agent trace.
+    
+    Args:
+        snapshot_paths (Dict[str, str]): Parquet snapshot path per dataframe name
+        enhanced_query (str): Query for the agent
+        
+    Returns:
+        dict: {"output", "trace", "error", "traceback"}
+    """
+    trace = []
+    try:
+        manager = PandasAgentManager.get_instance()
+        
+        # Loaded frames are cached per snapshot set; snapshot paths change whenever the data does
+        frames_key = tuple(snapshot_paths.items())
+        dataframes = manager.worker_frames.get(frames_key)
+        if dataframes is None:
+            dataframes = {name: pd.read_parquet(path, memory_map=True) for name, path in snapshot_paths.items()}
+            manager.worker_frames[frames_key] = dataframes
+            while len(manager.worker_frames) > 4:
+                manager.worker_frames.popitem(last=False)
+        else:
+            manager.worker_frames.move_to_end(frames_key)
+        
+        # One agent per worker process, rebound to each job's dataframes; jobs come from
+        # different threads, so nothing from a previous job may stay in the REPL namespace
+        agent = manager.worker_agent
+        if agent is None or not manager._bind_dataframes(agent, dataframes, clear_locals=True):
+            agent, agent_errors = manager._build_agent(dataframes)
+            if not agent:
+                return {"output": None, "trace": trace, "error": f"Failed to create pandas agent: {'; '.join(agent_errors)}"}
+            manager.worker_agent = agent
+        
+        agent_handler = manager._build_agent_handler(trace)
+        output = manager._run_agent(agent, enhanced_query, [agent_handler] if agent_handler else None)
+        return {"output": output, "trace": trace, "error": None}
+    except Exception as e:
+        return {"output": None, "trace": trace, "error": str(e), "traceback": traceback.format_exc()}
             
-        finally:
-            # Restore stdout
-            sys.stdout = original_stdout
-async def validate_resources(client: AzureOpenAI, thread_id: Optional[str], assistant_id: Optional[str]) -> Dict[str, bool]:
+def execute_agent_code(code, namespace):
+    """
+    Execute agent-generated Python the way LangChain's Python REPL tool does: run every
+    statement, and return the value of a trailing expression or else the printed output.
+
+    Args:
+        code (str): Code from the agent, optionally wrapped in a markdown fence
+        namespace (dict): Globals shared by the executions of one analysis
+
+    Returns:
+        str: Tool output for the agent
+    """
+    import ast
+    import contextlib
+
+    code = re.sub(r"^(\s|`)*(?i:python)?\s*", "", code)
+    code = re.sub(r"(\s|`)*$", "", code)
+    tree = ast.parse(code)
+    if not tree.body:
+        return ""
+
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        exec(compile(ast.Module(body=tree.body[:-1], type_ignores=[]), "<agent>", "exec"), namespace)
+        last = tree.body[-1]
+        if isinstance(last, ast.Expr):
+            result = eval(compile(ast.Expression(body=last.value), "<agent>", "eval"), namespace)
+        else:
+            exec(compile(ast.Module(body=[last], type_ignores=[]), "<agent>", "exec"), namespace)
+            result = None
+    return str(result) if result is not None else stdout.getvalue()
+
+def run_sandbox_worker(conn, cpu_seconds, address_space_bytes):
+    """
+    Sandbox worker process entry point: execute agent code against read-only shared
+    dataframes, one request at a time, under CPU-time and address-space limits.
+
+    Args:
+        conn: Pipe to the parent; receives {"op": "load" | "exec", ...} requests
+        cpu_seconds (int): CPU time allowed per code execution (exceeding it raises SIGXCPU)
+        address_space_bytes (int): Address-space limit for the worker (allocations beyond it raise MemoryError)
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None and address_space_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (address_space_bytes, address_space_bytes))
+
+    # Frames are memory-mapped once per published file and reused by later analyses
+    frames_cache = OrderedDict()
+    namespace = {}
+
+    def load_frame(name, kind, path):
+        key = (kind, path)
+        if key not in frames_cache:
+            if kind == "out_of_core":
+                frames_cache[key] = OutOfCoreTable(name, path)
+            else:
+                import pyarrow.feather as feather
+                frames_cache[key] = feather.read_table(path, memory_map=True).to_pandas()
+            while len(frames_cache) > 8:
+                frames_cache.popitem(last=False)
+        frames_cache.move_to_end(key)
+        return frames_cache[key]
+
+    conn.send({"ready": True})
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        try:
+            if message["op"] == "load":
+                # A new analysis starts from a clean namespace
+                frames = [load_frame(name, kind, path) for name, (kind, path) in message["frames"].items()]
+                namespace = {"pd": pd, "np": np, "df": frames[0], "dfs": frames}
+                for i, frame in enumerate(frames, start=1):
+                    namespace[f"df{i}"] = frame
+                conn.send({"ok": True})
+            elif message["op"] == "exec":
+                if resource is not None and cpu_seconds:
+                    # RLIMIT_CPU counts the whole process, so move the limit past the time already used
+                    usage = resource.getrusage(resource.RUSAGE_SELF)
+                    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                    soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+                    if hard != resource.RLIM_INFINITY:
+                        soft = min(soft, hard)
+                    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+                conn.send({"ok": True, "output": execute_agent_code(message["code"], namespace)})
+        except MemoryError:
+            namespace = {}
+            conn.send({"ok": False, "output": "MemoryError: the code ran out of memory", "recycle": True})
+        except Exception as e:
+            conn.send({"ok": False, "output": f"{type(e).__name__}: {e}"})
+
+class SandboxSession:
+    """One analysis run's lease on a sandbox worker."""
+    def __init__(self, executor, frames):
+        self.executor = executor
+        self.frames = frames
+        self.worker = None
+
+    def run(self, code: str) -> str:
+        return self.executor.execute(self, code)
+
+    def close(self):
+        if self.worker is not None:
+            self.executor._release(self.worker)
+            self.worker = None
+
+# Sandbox session of the analysis running in the current thread, read by the agent's SandboxPythonTool
+current_sandbox_session: contextvars.ContextVar = contextvars.ContextVar("current_sandbox_session", default=None)
+
+class SandboxedCodeExecutor:
+    """
+    Pool of pre-started worker processes that execute pandas-agent generated code.
+
+    The agent's LLM loop stays in the API process; only its Python tool runs in a
+    worker. Each execution gets a CPU-time limit (RLIMIT_CPU) and wall-time and
+    resident-memory watchdogs in the parent, on top of an address-space limit for the
+    worker. A worker that exceeds a budget is killed and replaced, so one session's
+    runaway query cannot slow down the others. Dataframes are published once per
+    version as uncompressed Arrow files on tmpfs and memory-mapped by the workers.
+    """
+    def __init__(self, size: int = PANDAS_SANDBOX_WORKERS, cpu_seconds: int = PANDAS_SANDBOX_CPU_SECONDS,
+                 wall_seconds: int = PANDAS_SANDBOX_WALL_SECONDS, memory_mb: int = PANDAS_SANDBOX_MEMORY_MB,
+                 shm_dir: str = PANDAS_SANDBOX_SHM_DIR):
+        self.size = size
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.shm_dir = shm_dir
+        self.context = multiprocessing.get_context("spawn")
+        self.idle = []
+        self.condition = threading.Condition()
+        self.started = False
+        self.published = {}  # thread_id -> {name: (df, path)}
+        self.published_lock = threading.Lock()
+        self.stats = {"executions": 0, "errors": 0, "cpu_limit_kills": 0, "wall_limit_kills": 0,
+                      "memory_limit_kills": 0, "crashes": 0, "workers_started": 0, "frames_published": 0}
+
+    def start(self):
+        """Start the workers ahead of the first query; they need several seconds to import the app."""
+        with self.condition:
+            if self.started:
+                return
+            self.started = True
+        for _ in range(self.size):
+            self._release(self._spawn())
+        logging.info(f"Started {self.size} sandbox workers (CPU {self.cpu_seconds}s, wall {self.wall_seconds}s, "
+                     f"memory {self.memory_bytes // (1024 * 1024)} MB per execution)")
+
+    def shutdown(self):
+        with self.condition:
+            workers, self.idle = self.idle, []
+            self.started = False
+        for worker in workers:
+            self._retire(worker)
+        with self.published_lock:
+            thread_ids = list(self.published)
+        for thread_id in thread_ids:
+            self.release_thread(thread_id)
+
+    def _spawn(self):
+        parent_conn, child_conn = self.context.Pipe()
+        # The address-space limit is a backstop; numpy and thread stacks reserve far more
+        # virtual memory than they touch, so the resident-memory watchdog enforces the budget
+        process = self.context.Process(
+            target=run_sandbox_worker,
+            args=(child_conn, self.cpu_seconds, self.memory_bytes * 4),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        with self.condition:
+            self.stats["workers_started"] += 1
+        return {"process": process, "conn": parent_conn, "ready": False}
+
+    def _retire(self, worker):
+        process = worker["process"]
+        if process.is_alive():
+            process.kill()
+        process.join(timeout=5)
+        worker["conn"].close()
+
+    def _release(self, worker):
+        with self.condition:
+            self.idle.append(worker)
+            self.condition.notify()
+
+    def _replace(self, worker):
+        """Kill a worker that broke its budget and put a fresh one in the pool."""
+        self._retire(worker)
+        self._release(self._spawn())
+
+    def _acquire(self):
+        self.start()
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.idle, timeout=self.wall_seconds):
+                raise Exception("No sandbox worker became available")
+            worker = self.idle.pop()
+
+        if not worker["ready"]:
+            try:
+                worker["ready"] = bool(worker["conn"].poll(SANDBOX_START_TIMEOUT) and worker["conn"].recv().get("ready"))
+            except (EOFError, OSError):
+                worker["ready"] = False
+            if not worker["ready"]:
+                self._replace(worker)
+                raise Exception("Sandbox worker failed to start")
+        return worker
+
+    @staticmethod
+    def _rss_bytes(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def _request(self, worker, message):
+        """
+        Send one request to a worker and wait for the reply, enforcing wall time and memory.
+
+        Returns:
+            Tuple of (reply or None, name of the exceeded limit or None)
+        """
+        conn, process = worker["conn"], worker["process"]
+        conn.send(message)
+        deadline = time.monotonic() + self.wall_seconds
+        while True:
+            if conn.poll(0.1):
+                try:
+                    return conn.recv(), None
+                except (EOFError, OSError):
+                    break
+            if not process.is_alive():
+                break
+            if time.monotonic() > deadline:
+                return None, "wall"
+            if self._rss_bytes(process.pid) > self.memory_bytes:
+                return None, "memory"
+
+        process.join(timeout=1)
+        sigxcpu = getattr(signal, "SIGXCPU", None)
+        return None, "cpu" if sigxcpu and process.exitcode == -sigxcpu else "crash"
+
+    def open_session(self, frames) -> SandboxSession:
+        return SandboxSession(self, frames)
+
+    def execute(self, session: SandboxSession, code: str) -> str:
+        """
+        Execute code for a session, leasing and loading a worker on first use.
+
+        Returns:
+            str: The code's output, or an explanation for the agent if a limit was hit
+        """
+        if session.worker is None:
+            session.worker = self._acquire()
+            reply, limit = self._request(session.worker, {"op": "load", "frames": session.frames})
+            if limit or not reply.get("ok"):
+                self._replace(session.worker)
+                session.worker = None
+                return f"Error: the dataframes could not be loaded in the sandbox ({limit or reply.get('output')})"
+
+        reply, limit = self._request(session.worker, {"op": "exec", "code": code})
+        with self.condition:
+            self.stats["executions"] += 1
+            if limit:
+                self.stats["crashes" if limit == "crash" else f"{limit}_limit_kills"] += 1
+            elif not reply.get("ok"):
+                self.stats["errors"] += 1
+
+        if limit or reply.get("recycle"):
+            self._replace(session.worker)
+            session.worker = None
+        if not limit:
+            return reply["output"]
+
+        logging.warning(f"Sandbox worker killed: {limit} limit exceeded")
+        explanation = {
+            "cpu": f"the code used more than {self.cpu_seconds}s of CPU time",
+            "wall": f"the code ran for more than {self.wall_seconds}s",
+            "memory": f"the code used more than {self.memory_bytes // (1024 * 1024)} MB of memory",
+            "crash": "the worker process crashed",
+        }[limit]
+        return (f"Execution stopped: {explanation}. Variables created by earlier steps are gone; the dataframes "
+                f"are still available as df/dfs. Use a cheaper approach (filter or aggregate before merging, "
+                f"avoid row-wise apply, work on a sample).")
+
+    def publish(self, thread_id: str, dataframes) -> Optional[Dict[str, Tuple[str, str]]]:
+        """
+        Share a thread's dataframes with the workers; files are rewritten only when a dataframe changes.
+
+        Returns:
+            Dict of name -> (kind, path), or None if a dataframe cannot be written as Arrow
+        """
+        if not PYARROW_AVAILABLE:
+            logging.warning("pyarrow is not installed; cannot share dataframes with sandbox workers")
+            return None
+        import pyarrow.feather as feather
+
+        os.makedirs(self.shm_dir, exist_ok=True)
+        with self.published_lock:
+            cache = self.published.setdefault(thread_id, {})
+            frames = {}
+            for name, df in dataframes.items():
+                if isinstance(df, OutOfCoreTable):
+                    frames[name] = ("out_of_core", df.chunk_glob)
+                    continue
+                cached = cache.get(name)
+                if cached and cached[0] is df and os.path.exists(cached[1]):
+                    frames[name] = ("arrow", cached[1])
+                    continue
+
+                path = os.path.join(self.shm_dir, f"{uuid.uuid4().hex}.arrow")
+                try:
+                    # Uncompressed so the workers can memory-map the columns
+                    frame = df if all(isinstance(c, str) for c in df.columns) else df.rename(columns=str)
+                    feather.write_feather(frame, path, compression="uncompressed")
+                except Exception as e:
+                    logging.warning(f"Could not share dataframe '{name}' with sandbox workers: {e}")
+                    if os.path.exists(path):
+                        os.remove(path)
+                    return None
+
+                if cached and os.path.exists(cached[1]):
+                    os.remove(cached[1])
+                cache[name] = (df, path)
+                frames[name] = ("arrow", path)
+                with self.condition:
+                    self.stats["frames_published"] += 1
+
+            for name in [n for n in cache if n not in dataframes]:
+                stale_path = cache.pop(name)[1]
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+        return frames
+
+    def release_thread(self, thread_id: str):
+        """Remove a thread's shared dataframe files."""
+        with self.published_lock:
+            cache = self.published.pop(thread_id, {})
+        for _, path in cache.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {**self.stats, "enabled": PANDAS_AGENT_ISOLATION == "sandbox", "workers": self.size,
+                    "idle": len(self.idle), "threads_published": len(self.published)}
+
+# Global sandbox executor for agent-generated code
+sandbox_executor = SandboxedCodeExecutor()
+
+async def profile_upload_in_background(file_info: Dict[str, Any]):
+    """
+    Parse, snapshot and profile an uploaded CSV/Excel file off the request path,
+    so the first query about it starts from Parquet and a ready profile.
+    
+    Args:
+        file_info (Dict[str, Any]): File information including path and sha256
+    """
+    # Never take capacity from analyses that users are waiting on
+    pool_stats = pandas_job_pool.get_stats()
+    if pool_stats["running"] + pool_stats["queued"] >= pool_stats["max_workers"]:
+        logging.info(f"Skipping upload profiling for '{file_info.get('name')}'; it will be profiled on first use")
+        return
+    try:
+        manager = PandasAgentManager.get_instance()
+        await pandas_job_pool.run(manager.profile_upload, dict(file_info))
+    except PandasJobsBusyError:
+        logging.info(f"Skipping upload profiling for '{file_info.get('name')}'; pandas jobs are busy")
+    except Exception as e:
+        logging.error(f"Error profiling upload '{file_info.get('name')}': {e}")
+
+# Running upload profiling tasks; the event loop only keeps weak references to tasks
+upload_profiling_tasks = set()
+
+def schedule_upload_profiling(file_info: Dict[str, Any]) -> asyncio.Task:
+    """Start profile_upload_in_background and keep a reference to it until it finishes."""
+    task = asyncio.create_task(profile_upload_in_background(file_info))
+    upload_profiling_tasks.add(task)
+    task.add_done_callback(upload_profiling_tasks.discard)
+    return task
+
+async def validate_resources(client: AsyncAzureOpenAI, thread_id: Optional[str], assistant_id: Optional[str]) -> Dict[str, bool]:
     """
     Validates that the given thread_id and assistant_id exist and are accessible.
     
     Args:
-        client (AzureOpenAI): The Azure OpenAI client instance
+        client (AsyncAzureOpenAI): The shared async Azure OpenAI client
         thread_id (Optional[str]): The thread ID to validate, or None
         assistant_id (Optional[str]): The assistant ID to validate, or None
         
@@ -5151,7 +9100,7 @@ async def validate_resources(client: AzureOpenAI, thread_id: Optional[str], assi
     if thread_id:
         try:
             # Attempt to retrieve thread
-            thread = client.beta.threads.retrieve(thread_id=thread_id)
+            thread = await client.beta.threads.retrieve(thread_id=thread_id)
             result["thread_valid"] = True
             logging.info(f"Thread validation: {thread_id} is valid")
         except Exception as e:
@@ -5162,7 +9111,7 @@ async def validate_resources(client: AzureOpenAI, thread_id: Optional[str], assi
     if assistant_id:
         try:
             # Attempt to retrieve assistant
-            assistant = client.beta.assistants.retrieve(assistant_id=assistant_id)
+            assistant = await client.beta.assistants.retrieve(assistant_id=assistant_id)
             result["assistant_valid"] = True
             logging.info(f"Assistant validation: {assistant_id} is valid")
         except Exception as e:
@@ -5170,13 +9119,13 @@ async def validate_resources(client: AzureOpenAI, thread_id: Optional[str], assi
             logging.warning(f"Assistant validation: {assistant_id} is invalid - {str(e)}")
     
     return result
-async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str, files: List[Dict[str, Any]]) -> str:
+async def pandas_agent(client: AsyncAzureOpenAI, thread_id: Optional[str], query: str, files: List[Dict[str, Any]]) -> str:
     """
     Enhanced pandas_agent that uses LangChain to analyze CSV and Excel files.
     Uses a class-based implementation to maintain isolation between threads.
     
     Args:
-        client (AzureOpenAI): The Azure OpenAI client instance
+        client (AsyncAzureOpenAI): The shared async Azure OpenAI client
         thread_id (Optional[str]): The thread ID to add the response to
         query (str): The query or question about the data
         files (List[Dict[str, Any]]): List of file information dictionaries
@@ -5186,19 +9135,7 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
     """
     # Create a unique operation ID for tracking
     operation_id = f"pandas_agent_{int(time.time())}_{os.urandom(2).hex()}"
-    update_operation_status(operation_id, "started", 0, "Starting data analysis")
-    
-    # Flag for background thread to stop
-    stop_background_updates = threading.Event()
-    
-    # Background thread for progress updates
-    def send_progress_updates():
-        progress = 50
-        while progress < 85 and not stop_background_updates.is_set():
-            time.sleep(1.5)  # Update every 1.5 seconds
-            progress += 2
-            update_operation_status(operation_id, "executing", min(progress, 85), 
-                                   "Analysis in progress...")
+    update_operation_status(operation_id, "started", 0, "Starting data analysis", session=thread_id)
     
     try:
         # Verify thread_id is provided
@@ -5249,43 +9186,12 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
                 logging.warning(f"PANDAS AGENT DEBUG - File does not exist: '{file_name}' at path: {file_path}")
                 invalid_files.append((file_name, f"Path not found: {file_path}"))
                 
-                # Enhanced path correction: Look for files with similar names in /tmp
-                possible_paths = [
-                    path for path in os.listdir('/tmp') 
-                    if file_name.lower() in path.lower() and os.path.isfile(os.path.join('/tmp', path))
-                ]
-                
-                if possible_paths:
-                    logging.info(f"PANDAS AGENT DEBUG - Found possible alternatives for '{file_name}':")
-                    for alt_path in possible_paths:
-                        full_path = os.path.join('/tmp', alt_path)
-                        alt_size = os.path.getsize(full_path)
-                        logging.info(f"  - Alternative: {full_path} (size: {alt_size} bytes)")
-                    
-                    # Use the first alternative found
-                    corrected_path = os.path.join('/tmp', possible_paths[0])
-                    logging.info(f"PANDAS AGENT DEBUG - Using alternative path for {file_name}: {corrected_path}")
-                    file["path"] = corrected_path
+                # Path correction: resolve the file through the session's upload registry
+                entry = file_registry.lookup(thread_id, file_name)
+                if entry:
+                    logging.info(f"PANDAS AGENT DEBUG - Using registered path for {file_name}: {entry['path']}")
+                    file["path"] = entry["path"]
                     valid_files.append(file)
-                else:
-                    # Try a more aggressive search for similarly named files
-                    all_tmp_files = os.listdir('/tmp')
-                    csv_files = [f for f in all_tmp_files if f.endswith('.csv') or f.endswith('.xlsx') or f.endswith('.xls')]
-                    
-                    logging.info(f"PANDAS AGENT DEBUG - Available files in /tmp directory:")
-                    for tmp_file in csv_files[:10]:  # Show first 10 to avoid log flooding
-                        logging.info(f"  - {tmp_file}")
-                    
-                    # Check if filename parts match (for handling timestamp prefixes)
-                    name_parts = re.split(r'[_\s]', file_name.lower())
-                    for tmp_file in csv_files:
-                        match_score = sum(1 for part in name_parts if part in tmp_file.lower())
-                        if match_score >= 2:  # If at least 2 parts match
-                            corrected_path = os.path.join('/tmp', tmp_file)
-                            logging.info(f"PANDAS AGENT DEBUG - Found partial match for '{file_name}': {corrected_path}")
-                            file["path"] = corrected_path
-                            valid_files.append(file)
-                            break
         
         # Replace original files list with validated files
         files = valid_files
@@ -5305,27 +9211,19 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
         manager = PandasAgentManager.get_instance()
         
         # Process the query
-        update_operation_status(operation_id, "analyzing", 50, f"Analyzing data with query: {query}")
+        update_operation_status(operation_id, "analyzing", 25, f"Analyzing data with query: {query}")
         
-        # Start progress update in background
-        update_thread = None
+        # Run the analysis in the job pool; progress is reported through the shared ticker
         try:
-            update_thread = threading.Thread(target=send_progress_updates)
-            update_thread.daemon = True
-            update_thread.start()
-        except Exception as e:
-            # Don't fail if we can't spawn thread
-            logging.warning(f"Could not start progress update thread: {str(e)}")
-        
-        # Run the analysis using the PandasAgentManager
-        result, error, removed_files = manager.analyze(thread_id, query, files)
-        
-        # Stop the background updates
-        stop_background_updates.set()
-        
-        # Wait for the update thread to terminate (with timeout)
-        if update_thread and update_thread.is_alive():
-            update_thread.join(timeout=1.0)
+            job = await manager.start_analysis(
+                thread_id, query, files,
+                progress_callback=progress_ticker.callback_for(operation_id)
+            )
+            # Shielded so a cancelled caller leaves the job (and the thread's turn) to finish
+            result, error, removed_files = await asyncio.shield(job)
+        except PandasJobsBusyError as busy_e:
+            update_operation_status(operation_id, "error", 100, str(busy_e))
+            return f"Data analysis is busy right now. Please try again in {busy_e.retry_after} seconds."
         
         # Prepare the response
         update_operation_status(operation_id, "formatting", 90, "Formatting response")
@@ -5337,24 +9235,14 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
             if "access" in error.lower() or "find" in error.lower() or "read" in error.lower():
                 # Try to get basic dataframe info as a fallback
                 try:
-                    df_info = []
-                    dfs = manager.dataframes_cache.get(thread_id, {})
-                    
-                    if dfs:
-                        for df_name, df in dfs.items():
-                            df_info.append(f"- {df_name}: {df.shape[0]} rows, {len(df.columns)} columns")
-                            df_info.append(f"  Columns: {', '.join(df.columns[:10].tolist())}")
-                            
-                            # Add sample data (first 3 rows) if we can
-                            try:
-                                sample = df.head(3).to_string()
-                                df_info.append(f"  Sample data:\n{sample}")
-                            except:
-                                pass
+                    # Profiles were computed when the files were registered; no dataframe scan needed
+                    profile_names = list(manager.profiles.get(thread_id, {}).keys())
                             
+                    if profile_names:
+                        df_info = manager.profile_report(thread_id, profile_names)
                         fallback_response = (
                             f"I encountered an issue while analyzing your data files but can provide "
-                            f"basic information about them:\n\n{chr(10).join(df_info)}\n\n"
+                            f"basic information about them:\n\n{df_info}\n\n"
                             f"Error details: {error}"
                         )
                         
@@ -5375,17 +9263,15 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
                 for name, err in invalid_files:
                     debug_info += f"- File '{name}': {err}\n"
                 
-                # Add info about files in /tmp
+                # Add info about files registered for this session
                 try:
-                    tmp_files = [f for f in os.listdir('/tmp') if f.endswith('.csv') or f.endswith('.xlsx')]
-                    if tmp_files:
-                        debug_info += f"\nAvailable files in /tmp:\n"
-                        for i, tmp_file in enumerate(tmp_files[:10]):  # Show first 10
-                            tmp_path = os.path.join('/tmp', tmp_file)
-                            tmp_size = os.path.getsize(tmp_path)
-                            debug_info += f"- {tmp_file} (size: {tmp_size} bytes)\n"
-                except Exception as tmp_err:
-                    debug_info += f"\nError listing /tmp: {str(tmp_err)}\n"
+                    registered_files = file_registry.list_session(thread_id)
+                    if registered_files:
+                        debug_info += f"\nFiles registered for this session:\n"
+                        for entry in registered_files[:10]:  # Show first 10
+                            debug_info += f"- {entry['name']} (size: {entry['size']} bytes)\n"
+                except Exception as registry_err:
+                    debug_info += f"\nError reading file registry: {str(registry_err)}\n"
             
             # Standard error response with debugging info
             final_response = f"Error analyzing data: {error}{debug_info}"
@@ -5406,12 +9292,12 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
         if thread_id:
             update_operation_status(operation_id, "responding", 95, "Adding response to thread")
             try:
-                # Wait for any active runs to complete (using sync version since pandas_agent is sync)
-                run_ready = sync_wait_for_run_completion(client, thread_id)
+                # Wait for any active runs to complete
+                run_ready = await wait_for_run_completion(client, thread_id)
                 if not run_ready:
                     logging.warning(f"Could not add pandas_agent response to thread {thread_id} - run still active after timeout")
                 else:
-                    client.beta.threads.messages.create(
+                    await client.beta.threads.messages.create(
                         thread_id=thread_id,
                         role="user",
                         content=f"[PANDAS AGENT RESPONSE]: {final_response}",
@@ -5431,9 +9317,6 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
         return final_response
     
     except Exception as e:
-        # Stop the background updates
-        stop_background_updates.set()
-        
         error_details = traceback.format_exc()
         logging.error(f"Critical error in pandas_agent: {str(e)}\n{error_details}")
         
@@ -5462,15 +9345,12 @@ async def pandas_agent(client: AzureOpenAI, thread_id: Optional[str], query: str
                 else:
                     debug_info.append(f"- File '{file_name}' does not exist at path: {file_path}")
                     
-                    # Look for similar files
-                    possible_paths = [
-                        path for path in os.listdir('/tmp') 
-                        if path.endswith(('.csv', '.xlsx', '.xls')) and os.path.isfile(os.path.join('/tmp', path))
-                    ]
-                    if possible_paths:
-                        debug_info.append(f"  - Found possible CSV/Excel files in /tmp directory:")
-                        for i, path in enumerate(possible_paths[:5]):  # Show first 5
-                            debug_info.append(f"    {i+1}. {path}")
+                    # List what is registered for this session instead
+                    registered_files = file_registry.list_session(thread_id)
+                    if registered_files:
+                        debug_info.append(f"  - Files registered for this session:")
+                        for i, entry in enumerate(registered_files[:5]):  # Show first 5
+                            debug_info.append(f"    {i+1}. {entry['name']}")
         except Exception as debug_err:
             debug_info.append(f"Error during debugging: {str(debug_err)}")
         
@@ -5489,7 +9369,7 @@ Operation ID: {operation_id}"""
                 
         return error_response
         
-async def image_analysis(client: AzureOpenAI, image_data: bytes, filename: str, prompt: Optional[str] = None) -> str:
+async def image_analysis(client: AsyncAzureOpenAI, image_data: bytes, filename: str, prompt: Optional[str] = None) -> str:
     """Analyzes an image using Azure OpenAI vision capabilities and returns the analysis text."""
     try:
         ext = os.path.splitext(filename)[1].lower()
@@ -5508,7 +9388,7 @@ async def image_analysis(client: AzureOpenAI, image_data: bytes, filename: str,
         combined_prompt = f"{default_prompt} {prompt}" if prompt else default_prompt
 
         # Use the existing client instead of creating a new one
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4.1-mini",  # Ensure this model supports vision
             messages=[{
                 "role": "user",
@@ -5528,14 +9408,14 @@ async def image_analysis(client: AzureOpenAI, image_data: bytes, filename: str,
         return f"Error analyzing image '{filename}': {str(e)}"
 
 # Helper function to update user persona context
-async def update_context(client: AzureOpenAI, thread_id: str, context: str):
+async def update_context(client: AsyncAzureOpenAI, thread_id: str, context: str):
     """Updates the user persona context in a thread by adding/replacing a special message."""
     if not context:
         return
 
     try:
         # Get existing messages to check for previous context
-        messages = client.beta.threads.messages.list(
+        messages = await client.beta.threads.messages.list(
             thread_id=thread_id,
             order="desc",
             limit=20  # Check recent messages is usually sufficient
@@ -5551,7 +9431,7 @@ async def update_context(client: AzureOpenAI, thread_id: str, context: str):
         # If found, delete previous context message to replace it
         if previous_context_message_id:
             try:
-                client.beta.threads.messages.delete(
+                await client.beta.threads.messages.delete(
                     thread_id=thread_id,
                     message_id=previous_context_message_id
                 )
@@ -5561,7 +9441,7 @@ async def update_context(client: AzureOpenAI, thread_id: str, context: str):
             # Continue even if delete fails to add the new context
 
         # Add new context message
-        client.beta.threads.messages.create(
+        await client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=f"USER PERSONA CONTEXT: {context}",
@@ -5574,7 +9454,7 @@ async def update_context(client: AzureOpenAI, thread_id: str, context: str):
         # Continue the flow even if context update fails
 
 # Function to add file awareness to the assistant
-async def add_file_awareness(client: AzureOpenAI, thread_id: str, file_info: Dict[str, Any]):
+async def add_file_awareness(client: AsyncAzureOpenAI, thread_id: str, file_info: Dict[str, Any]):
     """Adds file awareness to the assistant by sending a message about the file."""
     if not file_info:
         return
@@ -5615,7 +9495,7 @@ async def add_file_awareness(client: AzureOpenAI, thread_id: str, file_info: Dic
         run_ready = await wait_for_run_completion(client, thread_id)
         if run_ready:
             # Send the message to the thread
-            client.beta.threads.messages.create(
+            await client.beta.threads.messages.create(
                 thread_id=thread_id,
                 role="user",  # Sending as user so assistant 'sees' it as input/instruction
                 content=awareness_message,
@@ -5627,14 +9507,11 @@ async def add_file_awareness(client: AzureOpenAI, thread_id: str, file_info: Dic
     except Exception as e:
         logging.error(f"Error adding file awareness for '{file_name}' to thread {thread_id}: {e}")
         # Continue the flow even if adding awareness fails
-def update_operation_status(operation_id: str, status: str, progress: float, message: str):
+def update_operation_status(operation_id: str, status: str, progress: float, message: str, session: Optional[str] = None):
     """Update the status of a long-running operation."""
-    operation_statuses[operation_id] = {
-        "status": status,
-        "progress": progress,
-        "message": message,
-        "updated_at": time.time()
-    }
+    if status in TERMINAL_OPERATION_STATUSES:
+        progress_ticker.finish(operation_id)
+    operation_status_store.update(operation_id, status, progress, message, session=session)
     logging.info(f"Operation {operation_id}: {status} - {progress:.0f}% - {message}")
 
 
@@ -5647,7 +9524,8 @@ Creates thread and vector store for context.""",
           tags=["Chat Operations"])
 async def initiate_chat(
     file: Optional[UploadFile] = File(default=None, description="Initial file to process"),  # Changed File(None) to File(default=None)
-    context: Optional[str] = Form(default=None, description="User context or persona")
+    context: Optional[str] = Form(default=None, description="User context or persona"),
+    client: AsyncAzureOpenAI = Depends(get_async_azure_client)
 ):
     """
     Create a new chat session with persistent context.
@@ -5656,15 +9534,14 @@ async def initiate_chat(
     - file (optional): Initial file to process
     - context (optional): User context or persona
     """
-    client = create_client()
     logging.info("Initiating new chat session...")
 
     # Create a vector store up front
     try:
-        vector_store = client.vector_stores.create(name=f"chat_init_store_{int(time.time())}")
+        vector_store = await client.vector_stores.create(name=f"chat_init_store_{int(time.time())}")
         logging.info(f"Vector store created: {vector_store.id}")
     except Exception as e:
-        vector_store = client.beta.vector_stores.create(name=f"chat_init_store_{int(time.time())}")
+        vector_store = await client.beta.vector_stores.create(name=f"chat_init_store_{int(time.time())}")
         logging.error(f"Creating vector store with beta: {e}")
     # Include file_search and add pandas_agent as a function tool
     assistant_tools = [
@@ -5706,7 +9583,7 @@ async def initiate_chat(
     
     # Create the assistant
     try:
-        assistant = client.beta.assistants.create(
+        assistant = await client.beta.assistants.create(
             name=f"pm_copilot_{int(time.time())}",
             model="gpt-4.1-mini",  # Ensure this model is deployed
             instructions=system_prompt,
@@ -5718,7 +9595,7 @@ async def initiate_chat(
         logging.error(f"An error occurred while creating the assistant: {e}")
         # Attempt to clean up vector store if assistant creation fails
         try:
-            client.vector_stores.delete(vector_store_id=vector_store.id)
+            await client.vector_stores.delete(vector_store_id=vector_store.id)
             logging.info(f"Cleaned up vector store {vector_store.id} after assistant creation failure.")
         except Exception as cleanup_e:
             logging.error(f"Failed to cleanup vector store {vector_store.id} after error: {cleanup_e}")
@@ -5726,18 +9603,18 @@ async def initiate_chat(
 
     # Create a thread
     try:
-        thread = client.beta.threads.create()
+        thread = await client.beta.threads.create()
         logging.info(f"Thread created: {thread.id}")
     except Exception as e:
         logging.error(f"An error occurred while creating the thread: {e}")
         # Attempt cleanup
         try:
-            client.beta.assistants.delete(assistant_id=assistant.id)
+            await client.beta.assistants.delete(assistant_id=assistant.id)
             logging.info(f"Cleaned up assistant {assistant.id} after thread creation failure.")
         except Exception as cleanup_e:
             logging.error(f"Failed to cleanup assistant {assistant.id} after error: {cleanup_e}")
         try:
-            client.vector_stores.delete(vector_store_id=vector_store.id)
+            await client.vector_stores.delete(vector_store_id=vector_store.id)
             logging.info(f"Cleaned up vector store {vector_store.id} after thread creation failure.")
         except Exception as cleanup_e:
             logging.error(f"Failed to cleanup vector store {vector_store.id} after error: {cleanup_e}")
@@ -5751,12 +9628,11 @@ async def initiate_chat(
     # If a file is provided, upload and process it
     if file:
         filename = file.filename
-        file_content = await file.read()
-        file_path = os.path.join('/tmp/', filename)  # Use /tmp or a configurable temp dir
 
         try:
-            with open(file_path, 'wb') as f:
-                f.write(file_content)
+            # Stream the upload into the shared store; consumers read the blob in place
+            stored_upload = await upload_store.save_upload(file, filename)
+            file_path = stored_upload["path"]
 
             # Determine file type
             file_ext = os.path.splitext(filename)[1].lower()
@@ -5770,33 +9646,32 @@ async def initiate_chat(
             file_info = {"name": filename}
 
             if is_csv or is_excel:
+                file_registry.register(thread.id, stored_upload, "csv" if is_csv else "excel")
+                
                 # Instead of using code_interpreter, we'll track CSV/Excel files for the pandas_agent
                 session_csv_excel_files.append({
                     "name": filename,
                     "path": file_path,
-                    "type": "csv" if is_csv else "excel"
+                    "type": "csv" if is_csv else "excel",
+                    "sha256": stored_upload["sha256"]
                 })
+                schedule_upload_profiling(session_csv_excel_files[-1])
                 
                 file_info.update({
                     "type": "csv" if is_csv else "excel",
                     "processing_method": "pandas_agent"
                 })
                 
-                # Keep a copy of the file for the pandas agent to use
-                # (In a real implementation, you might store this in a database or cloud storage)
-                permanent_path = os.path.join('/tmp/', f"pandas_agent_{int(time.time())}_{filename}")
-                with open(permanent_path, 'wb') as f:
-                    with open(file_path, 'rb') as src:
-                        f.write(src.read())
-                
                 # Add file awareness message
                 await add_file_awareness(client, thread.id, file_info)
                 logging.info(f"Added '{filename}' for pandas_agent processing")
 
             elif is_image:
                 # Analyze image and add analysis text to the thread
+                with open(file_path, "rb") as image_file:
+                    file_content = image_file.read()
                 analysis_text = await image_analysis(client, file_content, filename, None)
-                client.beta.threads.messages.create(
+                await client.beta.threads.messages.create(
                     thread_id=thread.id,
                     role="user",  # Add analysis as user message for context
                     content=f"Analysis result for uploaded image '{filename}':\n{analysis_text}"
@@ -5811,9 +9686,9 @@ async def initiate_chat(
             elif is_document or not (is_csv or is_excel or is_image):
                 # Upload to vector store
                 with open(file_path, "rb") as file_stream:
-                    file_batch =client.vector_stores.file_batches.upload_and_poll(
+                    file_batch = await client.vector_stores.file_batches.upload_and_poll(
                         vector_store_id=vector_store.id,
-                        files=[file_stream]
+                        files=[(filename, file_stream)]
                     )
                 file_info.update({
                     "type": file_ext[1:] if file_ext else "document",
@@ -5828,13 +9703,6 @@ async def initiate_chat(
         except Exception as e:
             logging.error(f"Error processing uploaded file '{filename}': {e}")
             # Don't raise HTTPException here, allow response with IDs but log error
-        finally:
-            # Clean up temporary file
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError as e:
-                    logging.error(f"Error removing temporary file {file_path}: {e}")
 
     # Store csv/excel files info in a metadata message if there are any
     if session_csv_excel_files:
@@ -5844,7 +9712,7 @@ async def initiate_chat(
             if run_ready:
                 # Create a special message to store file paths for the pandas agent
                 pandas_files_info = json.dumps(session_csv_excel_files)
-                client.beta.threads.messages.create(
+                await client.beta.threads.messages.create(
                     thread_id=thread.id,
                     role="user",
                     content="PANDAS_AGENT_FILES_INFO (DO NOT DISPLAY TO USER)",
@@ -5874,7 +9742,8 @@ async def initiate_chat(
           description="Create a new chat session using an existing assistant and vector store.",
           tags=["Chat Operations"])
 async def co_pilot(
-    request: Request
+    request: Request,
+    client: AsyncAzureOpenAI = Depends(get_async_azure_client)
 ):
     """
     Use existing assistant for new chat session.
@@ -5884,7 +9753,6 @@ async def co_pilot(
     - vector_store (required): Existing vector store ID
     - context (optional): Session context
     """
-    client = create_client()
 
     # Parse the form data
     try:
@@ -5903,7 +9771,7 @@ async def co_pilot(
     try:
         # Retrieve the assistant to verify it exists
         try:
-            assistant_obj = client.beta.assistants.retrieve(assistant_id=assistant_id)
+            assistant_obj = await client.beta.assistants.retrieve(assistant_id=assistant_id)
             logging.info(f"Using existing assistant: {assistant_id}")
         except Exception as e:
             logging.error(f"Error retrieving assistant {assistant_id}: {e}")
@@ -5912,7 +9780,7 @@ async def co_pilot(
         # Verify the vector store exists
         try:
             # Just try to retrieve it to verify it exists
-            client.vector_stores.retrieve(vector_store_id=vector_store_id)
+            await client.vector_stores.retrieve(vector_store_id=vector_store_id)
             logging.info(f"Using existing vector store: {vector_store_id}")
         except Exception as e:
             logging.error(f"Error retrieving vector store {vector_store_id}: {e}")
@@ -5964,7 +9832,7 @@ async def co_pilot(
         }
 
         # Update the assistant with tools and vector store
-        client.beta.assistants.update(
+        await client.beta.assistants.update(
             assistant_id=assistant_id,
             tools=current_tools,
             tool_resources=tool_resources
@@ -5972,7 +9840,7 @@ async def co_pilot(
         logging.info(f"Updated assistant {assistant_id} with tools and vector store {vector_store_id}")
 
         # Create a new thread
-        thread = client.beta.threads.create()
+        thread = await client.beta.threads.create()
         thread_id = thread.id
         logging.info(f"Created new thread: {thread_id} for assistant {assistant_id}")
 
@@ -6006,7 +9874,8 @@ async def co_pilot(
 async def upload_file(
     request: Request,
     file: UploadFile = File(..., description="File to upload"),  # Changed from Form(...) to File(...)
-    assistant: str = Form(..., description="Assistant ID to attach file to")
+    assistant: str = Form(..., description="Assistant ID to attach file to"),
+    client: AsyncAzureOpenAI = Depends(get_async_azure_client)
 ):
     """
     Upload and process files for AI analysis.
@@ -6016,7 +9885,6 @@ async def upload_file(
     - context (optional): File context description
     - prompt (optional): Specific prompt for image analysis
     """
-    client = create_client()
 
     # Read optional params from form data
     try:
@@ -6030,14 +9898,12 @@ async def upload_file(
         context, thread_id, image_prompt = None, None, None
 
     filename = file.filename
-    file_path = f"/tmp/{filename}"
     uploaded_file_details = {}  # To return info about the uploaded file
 
     try:
-        # Save the uploaded file locally and get the data
-        file_content = await file.read()
-        with open(file_path, "wb") as temp_file:
-            temp_file.write(file_content)
+        # Stream the upload into the shared store; consumers read the blob in place
+        stored_upload = await upload_store.save_upload(file, filename)
+        file_path = stored_upload["path"]
 
         # Determine file type
         file_ext = os.path.splitext(filename)[1].lower()
@@ -6048,7 +9914,7 @@ async def upload_file(
         is_document = file_ext in ['.pdf', '.doc', '.docx', '.txt', '.md', '.html', '.json']
 
         # Retrieve the assistant
-        assistant_obj = client.beta.assistants.retrieve(assistant_id=assistant)
+        assistant_obj = await client.beta.assistants.retrieve(assistant_id=assistant)
         
         # Get current vector store IDs first
         vector_store_ids = []
@@ -6059,24 +9925,22 @@ async def upload_file(
         
         # Handle CSV/Excel (pandas_agent) files
         if is_csv or is_excel:
-            # Store the file for pandas_agent
-            permanent_path = os.path.join('/tmp/', f"pandas_agent_{int(time.time())}_{filename}")
-            with open(permanent_path, 'wb') as f:
-                with open(file_path, 'rb') as src:
-                    f.write(src.read())
+            file_registry.register(thread_id, stored_upload, "csv" if is_csv else "excel")
             
             # Prepare file info
             file_info = {
                 "name": filename,
-                "path": permanent_path,
-                "type": "csv" if is_csv else "excel"
+                "path": file_path,
+                "type": "csv" if is_csv else "excel",
+                "sha256": stored_upload["sha256"]
             }
+            schedule_upload_profiling(file_info)
             
             # If thread_id provided, add file to pandas_agent files for the thread
             if thread_id:
                 try:
                     # Try to retrieve existing pandas files info from thread
-                    messages = client.beta.threads.messages.list(
+                    messages = await client.beta.threads.messages.list(
                         thread_id=thread_id,
                         order="desc",
                         limit=50  # Check recent messages
@@ -6101,7 +9965,7 @@ async def upload_file(
                     if pandas_files_message_id:
                         # Delete the old message (can't update metadata directly)
                         try:
-                            client.beta.threads.messages.delete(
+                            await client.beta.threads.messages.delete(
                                 thread_id=thread_id,
                                 message_id=pandas_files_message_id
                             )
@@ -6112,7 +9976,7 @@ async def upload_file(
                     run_ready = await wait_for_run_completion(client, thread_id)
                     if run_ready:
                         # Create a new message with updated files
-                        client.beta.threads.messages.create(
+                        await client.beta.threads.messages.create(
                             thread_id=thread_id,
                             role="user",
                             content="PANDAS_AGENT_FILES_INFO (DO NOT DISPLAY TO USER)",
@@ -6121,7 +9985,7 @@ async def upload_file(
                                 "files": json.dumps(pandas_files)
                             }
                         )
-                        client.beta.threads.messages.create(
+                        await client.beta.threads.messages.create(
                             thread_id=thread_id,
                             role="user",
                             content=f"IMPORTANT INSTRUCTION: For ANY query about the file '{filename}', including requests to explain, summarize, or analyze the file, or any mention of the filename, you MUST use the pandas_agent tool. Never try to answer questions about this file from memory.",
@@ -6190,7 +10054,7 @@ async def upload_file(
             try:
                 # First, update with only the required tools
                 logging.info(f"Updating assistant {assistant} with fresh tools list with pandas_agent and possibly file_search")
-                client.beta.assistants.update(
+                await client.beta.assistants.update(
                     assistant_id=assistant,
                     tools=required_tools,
                     tool_resources={"file_search": {"vector_store_ids": vector_store_ids}} if vector_store_ids else None
@@ -6200,7 +10064,7 @@ async def upload_file(
                 # If that fails, try more cautiously
                 try:
                     # Fetch fresh assistant info
-                    assistant_obj = client.beta.assistants.retrieve(assistant_id=assistant)
+                    assistant_obj = await client.beta.assistants.retrieve(assistant_id=assistant)
                     
                     # Build a fresh tools list with more care
                     current_tools = []
@@ -6255,7 +10119,7 @@ async def upload_file(
                     
                     # Perform the update with the carefully constructed tools list
                     logging.info(f"Attempting more careful update with {len(current_tools)} tools (pandas_agent: {has_pandas_agent})")
-                    client.beta.assistants.update(
+                    await client.beta.assistants.update(
                         assistant_id=assistant,
                         tools=current_tools,
                         tool_resources={"file_search": {"vector_store_ids": vector_store_ids}} if vector_store_ids else None
@@ -6269,16 +10133,16 @@ async def upload_file(
             # Ensure a vector store is linked or create one
             if not vector_store_ids:
                 logging.info(f"No vector store linked to assistant {assistant}. Creating and linking a new one.")
-                vector_store =client.vector_stores.create(name=f"Assistant_{assistant}_Store")
+                vector_store = await client.vector_stores.create(name=f"Assistant_{assistant}_Store")
                 vector_store_ids = [vector_store.id]
 
             vector_store_id_to_use = vector_store_ids[0]  # Use the first linked store
 
             # Upload to vector store
             with open(file_path, "rb") as file_stream:
-                file_batch =client.vector_stores.file_batches.upload_and_poll(
+                file_batch = await client.vector_stores.file_batches.upload_and_poll(
                     vector_store_id=vector_store_id_to_use,
-                    files=[file_stream]
+                    files=[(filename, file_stream)]
                 )
             uploaded_file_details = {
                 "message": "File successfully uploaded to vector store.",
@@ -6312,7 +10176,7 @@ async def upload_file(
                     current_tools.append({"type": "file_search"})
                     
                     # Update the assistant
-                    client.beta.assistants.update(
+                    await client.beta.assistants.update(
                         assistant_id=assistant,
                         tools=current_tools,
                         tool_resources={"file_search": {"vector_store_ids": vector_store_ids}}
@@ -6320,7 +10184,7 @@ async def upload_file(
                     logging.info(f"Added file_search tool to assistant {assistant}")
                 else:
                     # Just update the vector store IDs if needed
-                    client.beta.assistants.update(
+                    await client.beta.assistants.update(
                         assistant_id=assistant,
                         tool_resources={"file_search": {"vector_store_ids": vector_store_ids}}
                     )
@@ -6331,8 +10195,10 @@ async def upload_file(
 
         # Handle image files
         elif is_image and thread_id:
+            with open(file_path, "rb") as image_file:
+                file_content = image_file.read()
             analysis_text = await image_analysis(client, file_content, filename, image_prompt)
-            client.beta.threads.messages.create(
+            await client.beta.threads.messages.create(
                 thread_id=thread_id,
                 role="user",
                 content=f"Analysis result for uploaded image '{filename}':\n{analysis_text}"
@@ -6370,59 +10236,139 @@ async def upload_file(
     except Exception as e:
         logging.error(f"Error uploading file '{filename}' for assistant {assistant}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to upload or process file: {str(e)}")
-    finally:
-        # Clean up temporary file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError as e:
-                logging.error(f"Error removing temporary file {file_path}: {e}")
-def sync_trim_thread(client: AzureOpenAI, thread_id: str, keep_messages: int = 30):
-    """
-    Synchronous version of trim_thread for use in sync contexts.
-    Returns True if trimming was performed, False otherwise.
+
+# Tool calls of one requires_action event run concurrently, each under its tool's timeout
+TOOL_CALL_MAX_CONCURRENCY = int(os.getenv("TOOL_CALL_MAX_CONCURRENCY", "4"))
+TOOL_CALL_TIMEOUT_SECONDS = int(os.getenv("TOOL_CALL_TIMEOUT_SECONDS", "300"))
+TOOL_CALL_TIMEOUTS = {
+    name: int(os.getenv(f"TOOL_CALL_TIMEOUT_{name.upper()}", str(TOOL_CALL_TIMEOUT_SECONDS)))
+    for name in ("pandas_agent", "generate_content", "extract_data")
+}
+TOOL_ERROR_LABELS = {
+    "pandas_agent": "Error analyzing data",
+    "generate_content": "Error generating content",
+    "extract_data": "Error extracting data",
+}
+
+async def dispatch_tool_calls(tool_calls, handlers, emit=None, max_concurrency=TOOL_CALL_MAX_CONCURRENCY):
     """
-    try:
-        # Get all messages
-        all_messages = []
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id,
-            order="desc",
-            limit=100
-        )
-        all_messages.extend(messages.data)
-        
-        # Skip if thread is small
-        if len(all_messages) <= keep_messages:
-            return False
+    Run the tool calls of one requires_action event concurrently.
+    
+    At most max_concurrency calls run at once and each gets its tool's timeout, so the
+    turn takes as long as the slowest tool instead of the sum of all of them. Failures
+    and timeouts become error outputs so the run can still continue. Pandas analyses of
+    the same thread still run one at a time (PandasAgentManager.start_analysis).
+    
+    Args:
+        tool_calls: Tool calls from required_action.submit_tool_outputs
+        handlers (Dict[str, Callable]): Async handler per tool name, called as
+            handler(tool_call, args, emit) and returning the tool output string
+        emit (Callable, optional): Receives text to show the user while the tools run
+        max_concurrency (int): Maximum number of tool calls running at once
         
-        # Delete old messages (keep the most recent ones)
-        messages_to_delete = all_messages[keep_messages:]
-        deleted_count = 0
+    Returns:
+        List[Dict]: {"tool_call_id", "output"} per tool call, in the order of tool_calls
         
-        for msg in messages_to_delete:
-            try:
-                # Skip system messages
-                if hasattr(msg, 'metadata') and msg.metadata:
-                    msg_type = msg.metadata.get('type', '')
-                    if msg_type in ['user_persona_context', 'file_awareness', 'pandas_agent_files', 'pandas_agent_instruction']:
-                        continue
-                        
-                client.beta.threads.messages.delete(
-                    thread_id=thread_id,
-                    message_id=msg.id
-                )
-                deleted_count += 1
-                logging.info(f"Deleted old message {msg.id} from thread {thread_id}")
+    Raises:
+        PandasJobsBusyError: If a handler was rejected by the full pandas job pool
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Text from a call is passed on live only while every call before it has finished;
+    # later calls buffer theirs, so concurrent calls never interleave in the output
+    pending_text = [[] for _ in tool_calls]
+    finished = [False] * len(tool_calls)
+    current = 0
+    
+    def emitter(index):
+        def emit_text(text):
+            if index == current:
+                emit(text)
+            else:
+                pending_text[index].append(text)
+        return emit_text if emit else None
+    
+    def advance(index):
+        nonlocal current
+        finished[index] = True
+        while current < len(tool_calls) and finished[current]:
+            current += 1
+            if emit and current < len(tool_calls):
+                for text in pending_text[current]:
+                    emit(text)
+                pending_text[current] = []
+    
+    async def run_tool_call(index, tool_call):
+        try:
+            return await call_tool(tool_call, emitter(index))
+        finally:
+            advance(index)
+    
+    async def call_tool(tool_call, emit):
+        name = tool_call.function.name
+        label = TOOL_ERROR_LABELS.get(name, f"Error running {name}")
+        handler = handlers.get(name)
+        if handler is None:
+            logging.warning(f"No handler for tool call '{name}'")
+            return {"tool_call_id": tool_call.id, "output": f"{label}: unsupported tool"}
+        
+        timeout = TOOL_CALL_TIMEOUTS.get(name, TOOL_CALL_TIMEOUT_SECONDS)
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                args = json.loads(tool_call.function.arguments)
+                logging.info(f"{name} tool call with args: {args}")
+                output = await asyncio.wait_for(handler(tool_call, args, emit), timeout=timeout)
+            except PandasJobsBusyError:
+                raise
+            except asyncio.TimeoutError:
+                logging.error(f"{name} tool call did not finish within {timeout}s")
+                output = f"{label}: the tool did not finish within {timeout} seconds"
+                if emit:
+                    emit(f"\n[Error: {name} timed out]\n")
             except Exception as e:
-                logging.warning(f"Could not delete message {msg.id}: {e}")
+                logging.error(f"Error executing {name}: {e}\n{traceback.format_exc()}")
+                output = f"{label}: {str(e)}"
+                if emit:
+                    emit(f"\n[Error: {str(e)}]\n")
+            logging.info(f"{name} tool call finished in {time.perf_counter() - start_time:.1f}s")
+        return {"tool_call_id": tool_call.id, "output": output}
+    
+    tasks = [asyncio.ensure_future(run_tool_call(index, tool_call)) for index, tool_call in enumerate(tool_calls)]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def stream_tool_calls(tool_calls, handlers, max_concurrency=TOOL_CALL_MAX_CONCURRENCY):
+    """
+    Run tool calls with dispatch_tool_calls, yielding the text they emit as it happens.
+    
+    Yields:
+        dict: {"type": "content", "text": str} while the tools run, then
+            {"type": "outputs", "outputs": [...]} with dispatch_tool_calls' result
+    """
+    emitted = asyncio.Queue()
+    dispatch = asyncio.ensure_future(
+        dispatch_tool_calls(tool_calls, handlers, emit=emitted.put_nowait, max_concurrency=max_concurrency)
+    )
+    try:
+        while not dispatch.done():
+            next_text = asyncio.ensure_future(emitted.get())
+            await asyncio.wait({next_text, dispatch}, return_when=asyncio.FIRST_COMPLETED)
+            if next_text.done():
+                yield {"type": "content", "text": next_text.result()}
+            else:
+                next_text.cancel()
         
-        logging.info(f"Trimmed thread {thread_id}: deleted {deleted_count} messages")
-        return deleted_count > 0
-                
-    except Exception as e:
-        logging.error(f"Error trimming thread {thread_id}: {e}")
-        return False
+        while not emitted.empty():
+            yield {"type": "content", "text": emitted.get_nowait()}
+        yield {"type": "outputs", "outputs": dispatch.result()}
+    finally:
+        if not dispatch.done():
+            dispatch.cancel()
+
 async def process_conversation(
     session: Optional[str] = None,
     prompt: Optional[str] = None,
@@ -6439,10 +10385,10 @@ async def process_conversation(
     When context is provided, it bypasses thread-based conversation and uses
     completions API directly with intelligent context processing.
     """
-    client = create_client()
+    async_client = get_async_azure_client()
     # Log the operation mode
     
-    thread_lock = None
+    thread_lease = None
     response_started = False
     
     # Helper function for completions API fallback
@@ -6983,7 +10929,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                 try:
                     logging.info(f"Attempting to retrieve vector stores for assistant {assistant}")
                     # Retrieve assistant details
-                    assistant_obj = client.beta.assistants.retrieve(assistant_id=assistant)
+                    assistant_obj = await async_client.beta.assistants.retrieve(assistant_id=assistant)
                     
                     # Get vector store IDs from assistant
                     vector_store_ids = []
@@ -6999,7 +10945,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                         for vs_id in vector_store_ids[:2]:  # Limit to first 2 vector stores
                             try:
                                 logging.info(f"Searching vector store {vs_id} with query: {prompt[:100]}...")
-                                results = client.vector_stores.search(
+                                results = await async_client.vector_stores.search(
                                     vector_store_id=vs_id,
                                     query=prompt,
                                     max_num_results=3
@@ -7051,7 +10997,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
             
             # Make completions API call - NO TOOLS NEEDED since file search is done manually
             logging.info("Making completions API call...")
-            completion = client.chat.completions.create(
+            completion = await async_client.chat.completions.create(
                 model="gpt-4.1-mini",
                 messages=messages,
                 temperature=0.8,
@@ -7062,9 +11008,9 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
             
             # Handle streaming vs non-streaming responses
             if stream_output:
-                def fallback_stream():
+                async def fallback_stream():
                     try:
-                        for chunk in completion:
+                        async for chunk in completion:
                             # Validate chunk structure before accessing
                             logging.debug(f"Chunk structure: {chunk}") 
                             if hasattr(chunk, 'choices') and chunk.choices and len(chunk.choices) > 0:
@@ -7138,7 +11084,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
             logging.error(f"Fallback to completions API failed: {fallback_e}")
             # Last resort response
             if stream_output:
-                def error_stream():
+                async def error_stream():
                     error_chunk = {
                         "id": "chatcmpl-error",
                         "object": "chat.completion.chunk",
@@ -7164,9 +11110,112 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                     content={"response": "I apologize, but I'm experiencing technical difficulties. Please try again in a moment."},
                     status_code=503
                 )
+    # Tool handlers shared by the streaming and non-streaming flows; dispatch_tool_calls runs them concurrently
+    streamed_answers = set()  # Tool call IDs whose answer the client already received token by token
+    
+    def tool_request():
+        """Mock request object for the generate_content and extract_data handlers."""
+        # Check if we're on Azure
+        host = os.environ.get('WEBSITE_HOSTNAME', 'localhost:8080')
+        base_url = f"https://{host}" if 'azurewebsites.net' in host else f"http://{host}"
+        return type('Request', (), {
+            'base_url': base_url,
+            'headers': {'host': host}
+        })()
+    
+    async def run_pandas_agent_tool(tool_call, args, emit=None):
+        query = args.get("query", "")
+        filename = args.get("filename", None)
+        
+        # Get pandas files for this thread from the local session manifest
+        pandas_files = file_registry.manifest(session, filename)
+        
+        # Generate operation ID for status tracking
+        pandas_agent_operation_id = f"pandas_agent_{int(time.time())}_{os.urandom(2).hex()}"
+        update_operation_status(pandas_agent_operation_id, "analyzing", 10, f"Analyzing data with query: {query}", session=session)
+        
+        # Execute the pandas_agent, forwarding its steps to the client as they happen
+        manager = PandasAgentManager.get_instance()
+        result, error, removed_files = None, None, []
+        streamed_answer = ""
+        token_buffer = []
+        try:
+            async for step in manager.analyze_stream(
+                thread_id=session,
+                query=query,
+                files=pandas_files,
+                progress_callback=progress_ticker.callback_for(pandas_agent_operation_id)
+            ):
+                if step["type"] == "result":
+                    result, error, removed_files = step["result"], step["error"], step["removed_files"]
+                    step_text = ''.join(token_buffer)
+                elif not emit:
+                    continue
+                elif step["type"] == "token":
+                    token_buffer.append(step["text"])
+                    streamed_answer += step["text"]
+                    if len(token_buffer) < 3:
+                        continue
+                    step_text = ''.join(token_buffer)
+                elif step["type"] == "code":
+                    step_text = ''.join(token_buffer) + f"\n```python\n{step['text']}\n```\n"
+                else:
+                    observation = step["text"]
+                    if len(observation) > 2000:
+                        observation = observation[:2000] + "..."
+                    step_text = ''.join(token_buffer) + f"\n```\n{observation}\n```\n"
+                token_buffer = []
+                if emit and step_text:
+                    emit(step_text)
+        except PandasJobsBusyError as busy_e:
+            update_operation_status(pandas_agent_operation_id, "error", 100, str(busy_e))
+            raise
+        
+        if error:
+            update_operation_status(pandas_agent_operation_id, "error", 100, f"Error: {error}")
+        else:
+            update_operation_status(pandas_agent_operation_id, "completed", 100, "Analysis completed successfully")
+        
+        # Form the analysis result
+        analysis_result = result if result else ""
+        if error:
+            analysis_result = f"Error analyzing data: {error}"
+        if removed_files:
+            removed_files_str = ", ".join(f"'{f}'" for f in removed_files)
+            analysis_result += f"\n\nNote: The following file(s) were removed due to the 3-file limit: {removed_files_str}"
+        
+        if emit:
+            emit("\n[Data analysis complete]\n")
+            # Fallback answers (profiles, cached or fast-path results) were not streamed, so they stay in the results
+            answer_streamed = bool(streamed_answer.strip()) and streamed_answer.strip() == (result or "").strip()
+            if answer_streamed and not error and not removed_files:
+                streamed_answers.add(tool_call.id)
+        return analysis_result
+    
+    async def run_generate_content_tool(tool_call, args, emit=None):
+        return await handle_generate_content(args, session, async_client, tool_request())
+    
+    async def run_extract_data_tool(tool_call, args, emit=None):
+        return await handle_extract_data(args, session, async_client, tool_request())
+    
+    tool_handlers = {
+        "pandas_agent": run_pandas_agent_tool,
+        "generate_content": run_generate_content_tool,
+        "extract_data": run_extract_data_tool,
+    }
+    
+    async def run_pandas_agent_tool_streaming(tool_call, args, emit=None):
+        # A stream has already started, so a full job pool becomes a tool error instead of a 429
+        try:
+            return await run_pandas_agent_tool(tool_call, args, emit)
+        except PandasJobsBusyError as busy_e:
+            return f"Error analyzing data: {busy_e}. Please try again in {busy_e.retry_after} seconds."
+    
+    streaming_tool_handlers = {**tool_handlers, "pandas_agent": run_pandas_agent_tool_streaming}
+    
     ######################### START OF def stream_response() #####################################
 
-    def stream_response():
+    async def stream_response():
         """Modified to be compatible with Bubble's streaming API while maintaining all features"""
         
         buffer = []
@@ -7176,10 +11225,11 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         tool_outputs_submitted = False
         wait_for_final_response = False
         latest_message_id = None
+        run_tracker.attach(session)
         try:
             # Get the most recent message ID before starting the run
             try:
-                pre_run_messages = client.beta.threads.messages.list(
+                pre_run_messages = await async_client.beta.threads.messages.list(
                     thread_id=session,
                     order="desc",
                     limit=1
@@ -7193,7 +11243,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
             
             
             # Create run and stream the response
-            with client.beta.threads.runs.stream(
+            async with async_client.beta.threads.runs.stream(
                 thread_id=session,
                 assistant_id=assistant,
                 truncation_strategy={
@@ -7201,7 +11251,8 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                     "last_messages": 10
                 }
             ) as stream:
-                for event in stream:
+                async for event in stream:
+                    run_tracker.observe_event(session, event)
                     # Store run ID for potential use
                     if hasattr(event, 'data') and hasattr(event.data, 'id'):
                         run_id = event.data.id
@@ -7376,219 +11427,32 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                 }
                                 yield f"data: {json.dumps(activity_chunk)}\n\n"
                             
-                            for tool_call in tool_calls:
-                                if tool_call.function.name == "pandas_agent":
-                                    try:
-                                        # Extract arguments
-                                        args = json.loads(tool_call.function.arguments)
-                                        query = args.get("query", "")
-                                        filename = args.get("filename", None)
-                                        
-                                        # Get pandas files for this thread
-                                        pandas_files = []
-                                        retry_count = 0
-                                        max_retries = 3
-                                        
-                                        while retry_count < max_retries:
-                                            try:
-                                                messages = client.beta.threads.messages.list(
-                                                    thread_id=session,
-                                                    order="desc",
-                                                    limit=50
-                                                )
-                                                
-                                                for msg in messages.data:
-                                                    if hasattr(msg, 'metadata') and msg.metadata and msg.metadata.get('type') == 'pandas_agent_files':
-                                                        try:
-                                                            pandas_files = json.loads(msg.metadata.get('files', '[]'))
-                                                        except Exception as parse_e:
-                                                            logging.error(f"Error parsing pandas files metadata: {parse_e}")
-                                                        break
-                                                break  # Success, exit retry loop
-                                            except Exception as list_e:
-                                                retry_count += 1
-                                                logging.error(f"Error retrieving pandas files (attempt {retry_count}): {list_e}")
-                                                time.sleep(1)
-                                        
-                                        # Filter by filename if specified
-                                        if filename:
-                                            pandas_files = [f for f in pandas_files if f.get("name") == filename]
-                                        
-                                        # Generate operation ID for status tracking
-                                        pandas_agent_operation_id = f"pandas_agent_{int(time.time())}_{os.urandom(2).hex()}"
-                                        
-                                        # Execute the pandas_agent
-                                        manager = PandasAgentManager.get_instance()
-                                        result, error, removed_files = manager.analyze(
-                                            thread_id=session,
-                                            query=query,
-                                            files=pandas_files
-                                        )
-                                        
-                                        # Form the analysis result
-                                        analysis_result = result if result else ""
-                                        if error:
-                                            analysis_result = f"Error analyzing data: {error}"
-                                        if removed_files:
-                                            removed_files_str = ", ".join(f"'{f}'" for f in removed_files)
-                                            analysis_result += f"\n\nNote: The following file(s) were removed due to the 3-file limit: {removed_files_str}"
-                                        
-                                        # Stream data completion status
-                                        complete_text = "\n[Data analysis complete]\n"
-                                        complete_chunk = {
-                                            "id": f"chatcmpl-{run_id or 'stream'}",
-                                            "object": "chat.completion.chunk",
-                                            "created": int(time.time()),
-                                            "model": "gpt-4.1-mini",
-                                            "choices": [{
-                                                "index": 0,
-                                                "delta": {
-                                                    "content": complete_text
-                                                },
-                                                "finish_reason": None
-                                            }]
-                                        }
-                                        yield f"data: {json.dumps(complete_chunk)}\n\n"
-                                        
-                                        # Add to tool outputs
-                                        tool_outputs.append({
-                                            "tool_call_id": tool_call.id,
-                                            "output": analysis_result
-                                        })
-                                        
-                                        # Save for potential fallback
-                                        tool_call_results.append(analysis_result)
-                                        
-                                    except Exception as e:
-                                        error_details = traceback.format_exc()
-                                        logging.error(f"Error executing pandas_agent: {e}\n{error_details}")
-                                        error_msg = f"Error analyzing data: {str(e)}"
-                                        
-                                        # Add error to tool outputs
-                                        tool_outputs.append({
-                                            "tool_call_id": tool_call.id,
-                                            "output": error_msg
-                                        })
-                                        
-                                        # Stream error to user
-                                        error_text = f"\n[Error: {str(e)}]\n"
-                                        error_chunk = {
-                                            "id": f"chatcmpl-{run_id or 'stream'}",
-                                            "object": "chat.completion.chunk",
-                                            "created": int(time.time()),
-                                            "model": "gpt-4.1-mini",
-                                            "choices": [{
-                                                "index": 0,
-                                                "delta": {
-                                                    "content": error_text
-                                                },
-                                                "finish_reason": None
-                                            }]
-                                        }
-                                        yield f"data: {json.dumps(error_chunk)}\n\n"
-                                        
-                                        # Save for potential fallback
-                                        tool_call_results.append(error_msg)
-                                
-                                elif tool_call.function.name == "generate_content":
-                                    try:
-                                        # Extract arguments
-                                        args = json.loads(tool_call.function.arguments)
-                                        logging.info(f"generate_content tool call with args: {args}")
-                                        
-                                        # Create a mock request object for the handler
-                                        # Check if we're on Azure
-                                        host = os.environ.get('WEBSITE_HOSTNAME', 'localhost:8080')
-                                        base_url = f"https://{host}" if 'azurewebsites.net' in host else f"http://{host}"
-                                        mock_request = type('Request', (), {
-                                            'base_url': base_url,
-                                            'headers': {'host': host}
-                                        })()
-                                        
-                                        # Call the async handler from sync context
-                                        # Since we're in a sync generator, we need to handle this carefully
-                                        import concurrent.futures
-                                        import asyncio
-                                        
-                                        # Run in a thread pool to avoid event loop issues
-                                        with concurrent.futures.ThreadPoolExecutor() as executor:
-                                            future = executor.submit(
-                                                asyncio.run,
-                                                handle_generate_content(args, session, client, mock_request)
-                                            )
-                                            result = future.result(timeout=300)  # 5 minute timeout
-                                        
-                                        # Add to tool outputs
-                                        tool_outputs.append({
-                                            "tool_call_id": tool_call.id,
-                                            "output": result
-                                        })
-                                        
-                                        # Save for potential fallback
-                                        tool_call_results.append(result)
-                                        
-                                    except Exception as e:
-                                        error_msg = f"Error generating content: {str(e)}"
-                                        logging.error(f"Error executing generate_content: {e}\n{traceback.format_exc()}")
-                                        
-                                        # Add error to tool outputs
-                                        tool_outputs.append({
-                                            "tool_call_id": tool_call.id,
-                                            "output": error_msg
-                                        })
-                                        
-                                        # Save for potential fallback
-                                        tool_call_results.append(error_msg)
-                                
-                                elif tool_call.function.name == "extract_data":
-                                    try:
-                                        # Extract arguments
-                                        args = json.loads(tool_call.function.arguments)
-                                        logging.info(f"extract_data tool call with args: {args}")
-                                        
-                                        # Create a mock request object for the handler
-                                        # Check if we're on Azure
-                                        host = os.environ.get('WEBSITE_HOSTNAME', 'localhost:8080')
-                                        base_url = f"https://{host}" if 'azurewebsites.net' in host else f"http://{host}"
-                                        mock_request = type('Request', (), {
-                                            'base_url': base_url,
-                                            'headers': {'host': host}
-                                        })()
-                                        
-                                        # Call the async handler from sync context
-                                        # Since we're in a sync generator, we need to handle this carefully
-                                        import concurrent.futures
-                                        import asyncio
-                                        
-                                        # Run in a thread pool to avoid event loop issues
-                                        with concurrent.futures.ThreadPoolExecutor() as executor:
-                                            future = executor.submit(
-                                                asyncio.run,
-                                                handle_extract_data(args, session, client, mock_request)
-                                            )
-                                            result = future.result(timeout=300)  # 5 minute timeout
-                                        
-                                        # Add to tool outputs
-                                        tool_outputs.append({
-                                            "tool_call_id": tool_call.id,
-                                            "output": result
-                                        })
-                                        
-                                        # Save for potential fallback - FIX: save result not error_msg
-                                        tool_call_results.append(result)
-                                        
-                                    except Exception as e:
-                                        error_msg = f"Error extracting data: {str(e)}"
-                                        logging.error(f"Error executing extract_data: {e}\n{traceback.format_exc()}")
-                                        
-                                        # Add error to tool outputs
-                                        tool_outputs.append({
-                                            "tool_call_id": tool_call.id,
-                                            "output": error_msg
-                                        })
+                            # Run all tool calls concurrently, streaming what they report
+                            # (e.g. pandas agent steps) as it happens
+                            async for item in stream_tool_calls(tool_calls, streaming_tool_handlers):
+                                if item["type"] == "outputs":
+                                    tool_outputs = item["outputs"]
+                                    continue
+                                content_chunk = {
+                                    "id": f"chatcmpl-{run_id or 'stream'}",
+                                    "object": "chat.completion.chunk",
+                                    "created": int(time.time()),
+                                    "model": "gpt-4.1-mini",
+                                    "choices": [{
+                                        "index": 0,
+                                        "delta": {
+                                            "content": item["text"]
+                                        },
+                                        "finish_reason": None
+                                    }]
+                                }
+                                yield f"data: {json.dumps(content_chunk)}\n\n"
                                         
-                                        # Save for potential fallback
-                                        tool_call_results.append(error_msg)
+                            # Save for potential fallback; answers already streamed token by token are not repeated
+                            tool_call_results.extend(
+                                output["output"] for output in tool_outputs
+                                if output["tool_call_id"] not in streamed_answers
+                            )
                             
                             # Submit tool outputs
                             if tool_outputs:
@@ -7656,12 +11520,13 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                 
                                 try:
                                     # Submit tool outputs and continue streaming
-                                    with client.beta.threads.runs.submit_tool_outputs_stream(
+                                    async with async_client.beta.threads.runs.submit_tool_outputs_stream(
                                         thread_id=session,
                                         run_id=event.data.id,
                                         tool_outputs=tool_outputs
                                     ) as tool_stream:
-                                        for tool_event in tool_stream:
+                                        async for tool_event in tool_stream:
+                                            run_tracker.observe_event(session, tool_event)
                                             # Handle text deltas from the continued stream
                                             if tool_event.event == "thread.message.delta":
                                                 delta = tool_event.data.delta
@@ -7757,11 +11622,12 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                     
                                     # Try fallback approach - regular submission without streaming
                                     try:
-                                        client.beta.threads.runs.submit_tool_outputs(
+                                        await async_client.beta.threads.runs.submit_tool_outputs(
                                             thread_id=session,
                                             run_id=event.data.id,
                                             tool_outputs=tool_outputs
                                         )
+                                        run_tracker.observe(session, event.data.id, "queued")
                                         tool_outputs_submitted = True
                                         logging.info(f"Submitted tool outputs using fallback method")
                                         
@@ -7827,6 +11693,8 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
             }
             yield f"data: {json.dumps(error_chunk)}\n\n"
             yield "data: [DONE]\n\n"
+        finally:
+            run_tracker.detach(session)
     ######################### END OF def stream_response() #######################################
     
     try:
@@ -7878,9 +11746,8 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         
         # PRIORITY 4: Acquire thread lock (ONLY ONCE, ONLY WHEN NEEDED)
         try:
-            thread_lock = await thread_lock_manager.get_lock(session)
-            await asyncio.wait_for(thread_lock.acquire(), timeout=30.0)  # 30 second timeout
-            logging.info(f"Acquired thread lock for session {session}")
+            thread_lease = await thread_lock_manager.acquire(session, timeout=30.0)  # 30 second timeout
+            logging.info(f"Acquired thread lock for session {session} (fencing token {thread_lease.fencing_token})")
         except asyncio.TimeoutError:
             logging.warning(f"Timeout acquiring thread lock for session {session}")
             return await fallback_to_completions(
@@ -7898,7 +11765,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         
         # PRIORITY 5: Validate resources
         try:
-            validation = await validate_resources(client, session, assistant)
+            validation = await validate_resources(async_client, session, assistant)
             
             # If either resource is invalid, fallback to completions
             if not validation["thread_valid"] or not validation["assistant_valid"]:
@@ -7928,9 +11795,10 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         requires_action_tools = []
         try:
             # List runs to check for active ones
-            runs = client.beta.threads.runs.list(thread_id=session, limit=1)
+            runs = await async_client.beta.threads.runs.list(thread_id=session, limit=1)
             if runs.data:
                 latest_run = runs.data[0]
+                run_tracker.observe(session, latest_run.id, latest_run.status, latest_run, source="poll")
                 if latest_run.status in ["in_progress", "queued", "requires_action"]:
                     active_run = True
                     run_id = latest_run.id
@@ -7946,17 +11814,14 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         # Check and trim thread BEFORE adding new message
         if session and prompt:  # Only trim if we're about to add a message
             try:
-                messages_response = client.beta.threads.messages.list(thread_id=session, limit=100)
+                messages_response = await async_client.beta.threads.messages.list(thread_id=session, limit=100)
                 message_count = len(messages_response.data)
                 if message_count > 40:  # Trim at 48 to leave room for new message
                     logging.info(f"Thread {session} has {message_count} messages, trimming before adding new message")
                     
                     # Trim now for both streaming and non-streaming
                     try:
-                        if stream_output:
-                            trimmed = sync_trim_thread(client, session, keep_messages=30)
-                        else:
-                            trimmed = await trim_thread(client, session, keep_messages=30)
+                        trimmed = await trim_thread(async_client, session, keep_messages=30)
                         
                         if trimmed:
                             logging.info(f"Trimmed thread {session} from {message_count} messages")
@@ -7981,7 +11846,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                 try:
                     if active_run and run_id:
                         try:
-                            run_status = client.beta.threads.runs.retrieve(thread_id=session, run_id=run_id)
+                            run_status = await async_client.beta.threads.runs.retrieve(thread_id=session, run_id=run_id)
                             
                             # Check how long the run has been active
                             run_created_at = run_status.created_at
@@ -7993,39 +11858,28 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                             # Smart decision: wait for young runs, cancel old stuck runs
                             if run_status.status in ["in_progress", "queued"]:
                                 max_wait_time = 30  # Maximum 30 seconds total wait
-                                check_interval = 2  # Check every 2 seconds
-                                waited_time = 0
                                 
                                 # If run is young (< 30s), wait for it to complete
                                 if run_age_seconds < max_wait_time:
                                     logging.info(f"Run {run_id} is only {run_age_seconds}s old, waiting for completion...")
                                     
-                                    while waited_time < (max_wait_time - run_age_seconds):
-                                        time.sleep(check_interval)
-                                        waited_time += check_interval
-                                        
-                                        # Check run status
-                                        try:
-                                            check_status = client.beta.threads.runs.retrieve(thread_id=session, run_id=run_id)
-                                            
-                                            if check_status.status in ["completed", "failed", "cancelled", "expired"]:
-                                                logging.info(f"Run {run_id} completed with status: {check_status.status}")
-                                                active_run = False
-                                                break
-                                            elif check_status.status == "requires_action":
-                                                # Handle requires_action separately below
-                                                run_status = check_status
-                                                if hasattr(check_status, 'required_action'):
-                                                    requires_action_tools = check_status.required_action.submit_tool_outputs.tool_calls
-                                                break
-                                            else:
-                                                # Still in progress/queued
-                                                current_run_age = int(time.time()) - check_status.created_at
-                                                logging.info(f"Run {run_id} still {check_status.status} after {current_run_age}s total")
-                                                
-                                        except Exception as check_e:
-                                            logging.warning(f"Error checking run status: {check_e}")
-                                            break
+                                    try:
+                                        check_status = await run_tracker.wait_for_run(
+                                            async_client, session, run_id,
+                                            timeout=max_wait_time - run_age_seconds
+                                        )
+                                        if check_status.status in TERMINAL_RUN_STATUSES:
+                                            logging.info(f"Run {run_id} completed with status: {check_status.status}")
+                                            active_run = False
+                                        elif check_status.status == "requires_action":
+                                            # Handle requires_action separately below
+                                            run_status = check_status
+                                            if hasattr(check_status, 'required_action'):
+                                                requires_action_tools = check_status.required_action.submit_tool_outputs.tool_calls
+                                    except asyncio.TimeoutError:
+                                        logging.info(f"Run {run_id} still active after {int(time.time()) - run_created_at}s total")
+                                    except Exception as check_e:
+                                        logging.warning(f"Error checking run status: {check_e}")
                                     
                                     # After waiting, check if we need to cancel
                                     if active_run and run_status.status in ["in_progress", "queued"]:
@@ -8033,22 +11887,17 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                         if total_age >= max_wait_time:
                                             logging.warning(f"Run {run_id} exceeded max wait time ({total_age}s), cancelling...")
                                             try:
-                                                client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                                await async_client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                                run_tracker.observe(session, run_id, "cancelling")
                                                 logging.info(f"Cancelled stuck run {run_id}")
                                                 
                                                 # Wait for cancellation
-                                                cancel_wait = 0
-                                                while cancel_wait < 5:
-                                                    time.sleep(1)
-                                                    cancel_wait += 1
-                                                    try:
-                                                        cancel_check = client.beta.threads.runs.retrieve(thread_id=session, run_id=run_id)
-                                                        if cancel_check.status in ["cancelled", "failed", "completed", "expired"]:
-                                                            break
-                                                    except:
-                                                        break
                                                 try:
-                                                    client.beta.threads.messages.create(
+                                                    await run_tracker.wait_for_run(async_client, session, run_id, timeout=5, statuses=TERMINAL_RUN_STATUSES)
+                                                except Exception:
+                                                    pass
+                                                try:
+                                                    await async_client.beta.threads.messages.create(
                                                         thread_id=session,
                                                         role="system",
                                                         content="[Previous operation was cancelled due to timeout. Processing new request.]"
@@ -8062,9 +11911,14 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                     # Run is already old (> 30s), cancel immediately
                                     logging.warning(f"Run {run_id} is {run_age_seconds}s old (stuck), cancelling immediately...")
                                     try:
-                                        client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                        await async_client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                        run_tracker.observe(session, run_id, "cancelling")
                                         logging.info(f"Cancelled old stuck run {run_id}")
-                                        time.sleep(2)  # Brief wait for cancellation
+                                        try:
+                                            # Brief wait for cancellation
+                                            await run_tracker.wait_for_run(async_client, session, run_id, timeout=2, statuses=TERMINAL_RUN_STATUSES)
+                                        except Exception:
+                                            pass
                                     except Exception as cancel_e:
                                         logging.error(f"Failed to cancel old run {run_id}: {cancel_e}")
                                         
@@ -8074,22 +11928,30 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                     logging.warning(f"Run {run_id} stuck in requires_action for {run_age_seconds}s, cancelling directly")
                                     # Skip tool output submission and cancel directly
                                     try:
-                                        client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                        await async_client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                        run_tracker.observe(session, run_id, "cancelling")
                                         logging.info(f"Cancelled stuck requires_action run {run_id}")
-                                        time.sleep(2)  # Brief wait for cancellation
+                                        try:
+                                            # Brief wait for cancellation
+                                            await run_tracker.wait_for_run(async_client, session, run_id, timeout=2, statuses=TERMINAL_RUN_STATUSES)
+                                        except Exception:
+                                            pass
                                     except Exception as cancel_e:
                                         logging.error(f"Failed to cancel requires_action run {run_id}: {cancel_e}")
                                         # Continue anyway - the add message will handle it
                                 else:
                                     logging.info(f"Run {run_id} is in requires_action state ({run_age_seconds}s old), waiting briefly")
                                     # For young requires_action runs, wait a bit longer
-                                    time.sleep(5)
+                                    try:
+                                        await run_tracker.wait_for_run(async_client, session, run_id, timeout=5, statuses=TERMINAL_RUN_STATUSES)
+                                    except Exception:
+                                        pass
                                     
                         except Exception as run_e:
                             logging.warning(f"Error handling active run: {run_e}")
 
                     # Try to add the message
-                    client.beta.threads.messages.create(
+                    await async_client.beta.threads.messages.create(
                         thread_id=session,
                         role="user",
                         content=prompt
@@ -8100,7 +11962,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                 except Exception as e:
                     if "while a run" in str(e) and attempt < max_retries - 1:
                         logging.warning(f"Failed to add message (attempt {attempt+1}), run is active. Retrying in {retry_delay}s: {e}")
-                        time.sleep(retry_delay)
+                        await asyncio.sleep(retry_delay)
                         retry_delay *= 2  # Exponential backoff
                     else:
                         logging.error(f"Failed to add message to thread {session}: {e}")
@@ -8121,38 +11983,51 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         if not stream_output:
             # For non-streaming mode, we'll use a completely different approach
             full_response = ""
-            try:
-                # Create a run without streaming
-                run = client.beta.threads.runs.create(
+            
+            async def create_tracked_run():
+                # Never start a run unless we still own the thread
+                if not await thread_lock_manager.is_valid(thread_lease):
+                    raise RuntimeError(f"Lost thread lock for session {session}")
+                # Stream run events into the tracker so waits resolve on events instead of polling
+                run_stream = await async_client.beta.threads.runs.create(
                     thread_id=session,
                     assistant_id=assistant,
                     truncation_strategy={
                         "type": "last_messages",
                         "last_messages": 10
-                    }
+                    },
+                    stream=True
                 )
-                run_id = run.id
+                new_run_id = await run_tracker.follow_stream(session, run_stream)
+                if not new_run_id:
+                    raise RuntimeError("Run stream ended before the run was created")
+                return new_run_id
+            
+            try:
+                # Create the run and follow its events in the background
+                run_id = await create_tracked_run()
                 logging.info(f"Created run {run_id} for thread {session} (non-streaming mode)")
                 
-                # Poll for run completion
-                max_poll_attempts = 30  # 5 minute timeout with 10 second intervals
-                poll_interval = 10  # seconds
+                # Wait for run state changes (tool calls, completion)
+                max_poll_attempts = 30  # Maximum run state transitions handled
+                poll_interval = 2  # seconds, only used after an error
+                run_deadline = time.time() + 300  # 5 minute overall timeout
                 tool_outputs_submitted = False
                 tool_call_results = []
                 
                 for attempt in range(max_poll_attempts):
                     try:
-                        run_status = client.beta.threads.runs.retrieve(
-                            thread_id=session,
-                            run_id=run_id
+                        run_status = await run_tracker.wait_for_run(
+                            async_client, session, run_id,
+                            timeout=max(run_deadline - time.time(), 1)
                         )
                         
-                        logging.info(f"Run status poll {attempt+1}/{max_poll_attempts}: {run_status.status}")
+                        logging.info(f"Run status update {attempt+1}/{max_poll_attempts}: {run_status.status}")
                         
                         # Handle completed run
                         if run_status.status == "completed":
                             # Get the latest message
-                            messages = client.beta.threads.messages.list(
+                            messages = await async_client.beta.threads.messages.list(
                                 thread_id=session,
                                 order="desc",
                                 limit=1
@@ -8168,7 +12043,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                             break  # Exit the polling loop
                         
                         # Handle failed/cancelled/expired run
-                        elif run_status.status in ["failed", "cancelled", "expired"]:
+                        elif run_status.status in ["failed", "cancelled", "expired", "incomplete"]:
                             error_details = ""
                             error_code = None
                             if run_status.status == "failed" and hasattr(run_status, 'last_error') and run_status.last_error:
@@ -8179,35 +12054,19 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                 # Retry on server errors
                                 if error_code == 'server_error' and attempt < 10:  # More retries for chat endpoint
                                     logging.info(f"Retrying due to server error (attempt {attempt + 1}/10)")
-                                    time.sleep(3)  # Wait 3 seconds before retry
+                                    await asyncio.sleep(3)  # Wait 3 seconds before retry
                                     
                                     # Create a new run
                                     try:
-                                        run = client.beta.threads.runs.create(
-                                            thread_id=session,
-                                            assistant_id=assistant,
-                                            truncation_strategy={
-                                                "type": "last_messages",
-                                                "last_messages": 10
-                                            }
-                                        )
-                                        run_id = run.id
+                                        run_id = await create_tracked_run()
                                         logging.info(f"Created new run {run_id} after server error")
                                         continue  # Continue polling with new run
                                     except Exception as retry_e:
                                         logging.error(f"Failed to create retry run: {retry_e}")
                                         # Try one more time after a longer wait
-                                        time.sleep(5)
+                                        await asyncio.sleep(5)
                                         try:
-                                            run = client.beta.threads.runs.create(
-                                                thread_id=session,
-                                                assistant_id=assistant,
-                                                truncation_strategy={
-                                                    "type": "last_messages",
-                                                    "last_messages": 10
-                                                }
-                                            )
-                                            run_id = run.id
+                                            run_id = await create_tracked_run()
                                             logging.info(f"Created new run {run_id} on second retry attempt")
                                             continue
                                         except:
@@ -8215,87 +12074,24 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                             elif run_status.status == "requires_action":
                                 if run_status.required_action.type == "submit_tool_outputs":
                                     tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
-                                    tool_outputs = []
-                                    
-                                    for tool_call in tool_calls:
-                                        if tool_call.function.name == "pandas_agent":
-                                            try:
-                                                # Extract arguments
-                                                args = json.loads(tool_call.function.arguments)
-                                                query = args.get("query", "")
-                                                filename = args.get("filename", None)
-                                                
-                                                # Get pandas files for this thread
-                                                pandas_files = []
-                                                retry_count = 0
-                                                max_retries = 3
-                                                
-                                                while retry_count < max_retries:
-                                                    try:
-                                                        messages = client.beta.threads.messages.list(
-                                                            thread_id=session,
-                                                            order="desc",
-                                                            limit=50
-                                                        )
-                                                        
-                                                        for msg in messages.data:
-                                                            if hasattr(msg, 'metadata') and msg.metadata and msg.metadata.get('type') == 'pandas_agent_files':
-                                                                try:
-                                                                    pandas_files = json.loads(msg.metadata.get('files', '[]'))
-                                                                except Exception as parse_e:
-                                                                    logging.error(f"Error parsing pandas files metadata: {parse_e}")
-                                                                break
-                                                        break  # Success, exit retry loop
-                                                    except Exception as list_e:
-                                                        retry_count += 1
-                                                        logging.error(f"Error retrieving pandas files (attempt {retry_count}): {list_e}")
-                                                        time.sleep(1)
-                                                
-                                                # Filter by filename if specified
-                                                if filename:
-                                                    pandas_files = [f for f in pandas_files if f.get("name") == filename]
-                                                
-                                                # Generate operation ID for status tracking
-                                                pandas_agent_operation_id = f"pandas_agent_{int(time.time())}_{os.urandom(2).hex()}"
-                                                
-                                                # Execute the pandas_agent using manager directly
-                                                manager = PandasAgentManager.get_instance()
-                                                result, error, removed_files = manager.analyze(
-                                                    thread_id=session,
-                                                    query=query,
-                                                    files=pandas_files
-                                                )
-                                                
-                                                # Format the analysis result (same as streaming)
-                                                analysis_result = result if result else ""
-                                                if error:
-                                                    analysis_result = f"Error analyzing data: {error}"
-                                                if removed_files:
-                                                    removed_files_str = ", ".join(f"'{f}'" for f in removed_files)
-                                                    analysis_result += f"\n\nNote: The following file(s) were removed due to the 3-file limit: {removed_files_str}"
-                                                
-                                                # Add to tool outputs
-                                                tool_outputs.append({
-                                                    "tool_call_id": tool_call.id,
-                                                    "output": analysis_result
-                                                })
-                                                
-                                                # Save for potential fallback
-                                                tool_call_results.append(analysis_result)
-                                                
-                                            except Exception as e:
-                                                error_details = traceback.format_exc()
-                                                logging.error(f"Error executing pandas_agent: {e}\n{error_details}")
-                                                error_msg = f"Error analyzing data: {str(e)}"
-                                                
-                                                # Add error to tool outputs
-                                                tool_outputs.append({
-                                                    "tool_call_id": tool_call.id,
-                                                    "output": error_msg
-                                                })
+                                    try:
+                                        # Independent tool calls run concurrently, each bounded by its own timeout
+                                        tool_outputs = await dispatch_tool_calls(tool_calls, tool_handlers)
+                                    except PandasJobsBusyError as busy_e:
+                                        # Answer fast with 429 instead of queueing behind a full pool
+                                        try:
+                                            await async_client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                            run_tracker.observe(session, run_id, "cancelling")
+                                        except Exception as cancel_e:
+                                            logging.warning(f"Could not cancel run {run_id} after pandas job rejection: {cancel_e}")
+                                        return JSONResponse(
+                                            status_code=429,
+                                            content={"error": "Data analysis is busy", "detail": str(busy_e), "retry_after": busy_e.retry_after},
+                                            headers={"Retry-After": str(busy_e.retry_after)}
+                                        )
                                                 
-                                                # Save for potential fallback
-                                                tool_call_results.append(error_msg)
+                                    # Save for potential fallback
+                                    tool_call_results.extend(output["output"] for output in tool_outputs)
                             else:
                                 logging.error(f"Run ended with status: {run_status.status}")
                             
@@ -8317,165 +12113,24 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                         elif run_status.status == "requires_action":
                             if run_status.required_action.type == "submit_tool_outputs":
                                 tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
-                                tool_outputs = []
+                                try:
+                                    # Independent tool calls run concurrently, each bounded by its own timeout
+                                    tool_outputs = await dispatch_tool_calls(tool_calls, tool_handlers)
+                                except PandasJobsBusyError as busy_e:
+                                    # Answer fast with 429 instead of queueing behind a full pool
+                                    try:
+                                        await async_client.beta.threads.runs.cancel(thread_id=session, run_id=run_id)
+                                        run_tracker.observe(session, run_id, "cancelling")
+                                    except Exception as cancel_e:
+                                        logging.warning(f"Could not cancel run {run_id} after pandas job rejection: {cancel_e}")
+                                    return JSONResponse(
+                                        status_code=429,
+                                        content={"error": "Data analysis is busy", "detail": str(busy_e), "retry_after": busy_e.retry_after},
+                                        headers={"Retry-After": str(busy_e.retry_after)}
+                                    )
                                 
-                                for tool_call in tool_calls:
-                                    if tool_call.function.name == "pandas_agent":
-                                        try:
-                                            # Extract arguments
-                                            args = json.loads(tool_call.function.arguments)
-                                            query = args.get("query", "")
-                                            filename = args.get("filename", None)
-                                            
-                                            # Get pandas files for this thread
-                                            pandas_files = []
-                                            retry_count = 0
-                                            max_retries = 3
-                                            
-                                            while retry_count < max_retries:
-                                                try:
-                                                    messages = client.beta.threads.messages.list(
-                                                        thread_id=session,
-                                                        order="desc",
-                                                        limit=50
-                                                    )
-                                                    
-                                                    for msg in messages.data:
-                                                        if hasattr(msg, 'metadata') and msg.metadata and msg.metadata.get('type') == 'pandas_agent_files':
-                                                            try:
-                                                                pandas_files = json.loads(msg.metadata.get('files', '[]'))
-                                                            except Exception as parse_e:
-                                                                logging.error(f"Error parsing pandas files metadata: {parse_e}")
-                                                            break
-                                                    break  # Success, exit retry loop
-                                                except Exception as list_e:
-                                                    retry_count += 1
-                                                    logging.error(f"Error retrieving pandas files (attempt {retry_count}): {list_e}")
-                                                    time.sleep(1)
-                                            
-                                            # Filter by filename if specified
-                                            if filename:
-                                                pandas_files = [f for f in pandas_files if f.get("name") == filename]
-                                            
-                                            # Generate operation ID for status tracking
-                                            pandas_agent_operation_id = f"pandas_agent_{int(time.time())}_{os.urandom(2).hex()}"
-                                            
-                                            # Execute the pandas_agent
-                                            manager = PandasAgentManager.get_instance()
-                                            result, error, removed_files = manager.analyze(
-                                                thread_id=session,
-                                                query=query,
-                                                files=pandas_files
-                                            )
-                                            
-                                            # Format the analysis result (same as streaming)
-                                            analysis_result = result if result else ""
-                                            if error:
-                                                analysis_result = f"Error analyzing data: {error}"
-                                            if removed_files:
-                                                removed_files_str = ", ".join(f"'{f}'" for f in removed_files)
-                                                analysis_result += f"\n\nNote: The following file(s) were removed due to the 3-file limit: {removed_files_str}"
-                                           
-                                            # Add to tool outputs
-                                            tool_outputs.append({
-                                                "tool_call_id": tool_call.id,
-                                                "output": analysis_result
-                                            })
-                                            
-                                            # Save for potential fallback
-                                            tool_call_results.append(analysis_result)
-                                            
-                                        except Exception as e:
-                                            error_details = traceback.format_exc()
-                                            logging.error(f"Error executing pandas_agent: {e}\n{error_details}")
-                                            error_msg = f"Error analyzing data: {str(e)}"
-                                            
-                                            # Add error to tool outputs
-                                            tool_outputs.append({
-                                                "tool_call_id": tool_call.id,
-                                                "output": error_msg
-                                            })
-                                            
-                                            # Save for potential fallback
-                                            tool_call_results.append(error_msg)
-                                    
-                                    elif tool_call.function.name == "extract_data":
-                                        try:
-                                            # Extract arguments
-                                            args = json.loads(tool_call.function.arguments)
-                                            logging.info(f"extract_data tool call with args: {args}")
-                                            
-                                            # Create a mock request object for the handler
-                                            host = os.environ.get('WEBSITE_HOSTNAME', 'localhost:8080')
-                                            base_url = f"https://{host}" if 'azurewebsites.net' in host else f"http://{host}"
-                                            mock_request = type('Request', (), {
-                                                'base_url': base_url,
-                                                'headers': {'host': host}
-                                            })()
-                                            
-                                            # Call the handler with mock request
-                                            result = await handle_extract_data(args, session, client, mock_request)
-                                            
-                                            # Add to tool outputs
-                                            tool_outputs.append({
-                                                "tool_call_id": tool_call.id,
-                                                "output": result
-                                            })
-                                            
-                                            # Save for potential fallback
-                                            tool_call_results.append(result)
-                                            
-                                        except Exception as e:
-                                            error_msg = f"Error extracting data: {str(e)}"
-                                            logging.error(f"Error executing extract_data: {e}")
-                                            
-                                            # Add error to tool outputs
-                                            tool_outputs.append({
-                                                "tool_call_id": tool_call.id,
-                                                "output": error_msg
-                                            })
-                                            
-                                            # Save for potential fallback
-                                            tool_call_results.append(error_msg)
-                                                                        
-                                    elif tool_call.function.name == "extract_data":
-                                        try:
-                                            # Extract arguments
-                                            args = json.loads(tool_call.function.arguments)
-                                            logging.info(f"extract_data tool call with args: {args}")
-                                            
-                                            # Create a mock request object for the handler
-                                            host = os.environ.get('WEBSITE_HOSTNAME', 'localhost:8080')
-                                            base_url = f"https://{host}" if 'azurewebsites.net' in host else f"http://{host}"
-                                            mock_request = type('Request', (), {
-                                                'base_url': base_url,
-                                                'headers': {'host': host}
-                                            })()
-                                            
-                                            # Call the handler with mock request
-                                            result = await handle_extract_data(args, session, client, mock_request)
-                                            
-                                            # Add to tool outputs
-                                            tool_outputs.append({
-                                                "tool_call_id": tool_call.id,
-                                                "output": result
-                                            })
-                                            
-                                            # Save for potential fallback
-                                            tool_call_results.append(result)
-                                            
-                                        except Exception as e:
-                                            error_msg = f"Error extracting data: {str(e)}"
-                                            logging.error(f"Error executing extract_data: {e}")
-                                            
-                                            # Add error to tool outputs
-                                            tool_outputs.append({
-                                                "tool_call_id": tool_call.id,
-                                                "output": error_msg
-                                            })
-                                            
-                                            # Save for potential fallback
-                                            tool_call_results.append(error_msg)
+                                # Save for potential fallback
+                                tool_call_results.extend(output["output"] for output in tool_outputs)
                                 
                                 # Submit tool outputs
                                 if tool_outputs:
@@ -8485,36 +12140,33 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                                     
                                     while retry_count < max_retries and not submit_success:
                                         try:
-                                            client.beta.threads.runs.submit_tool_outputs(
+                                            tool_stream = await async_client.beta.threads.runs.submit_tool_outputs(
                                                 thread_id=session,
                                                 run_id=run_id,
-                                                tool_outputs=tool_outputs
+                                                tool_outputs=tool_outputs,
+                                                stream=True
                                             )
+                                            run_tracker.observe(session, run_id, "queued")
+                                            await run_tracker.follow_stream(session, tool_stream)
                                             submit_success = True
                                             tool_outputs_submitted = True
                                             logging.info(f"Successfully submitted tool outputs for run {run_id}")
                                         except Exception as submit_e:
                                             retry_count += 1
                                             logging.error(f"Error submitting tool outputs (attempt {retry_count}): {submit_e}")
-                                            time.sleep(1)
+                                            await asyncio.sleep(1)
                                     
                                     if not submit_success:
                                         # Use fallback
                                         return await fallback_to_completions(error_context= f"Failed to submit tool outputs: {submit_e}", user_context=context, files=files)
                         
-                        # Continue polling if still in progress
-                        if attempt < max_poll_attempts - 1:
-                            # Progressive backoff: start fast, slow down over time
-                            if attempt < 10:
-                                time.sleep(3)  # First 10 attempts: 3 seconds
-                            elif attempt < 20:
-                                time.sleep(5)  # Next 10 attempts: 5 seconds
-                            else:
-                                time.sleep(10)  # Remaining attempts: 10 seconds
                             
+                    except asyncio.TimeoutError:
+                        logging.error(f"Timed out waiting for run {run_id} on thread {session}")
+                        break
                     except Exception as poll_e:
                         logging.error(f"Error polling run status (attempt {attempt+1}): {poll_e}")
-                        time.sleep(poll_interval)
+                        await asyncio.sleep(poll_interval)
                         
                 # If we reach here without a full_response, but we have tool results, use those
                 if not full_response and tool_call_results:
@@ -8524,7 +12176,7 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
                 # If we still don't have a response, try one more time to get the latest message
                 if not full_response:
                     try:
-                        messages = client.beta.threads.messages.list(
+                        messages = await async_client.beta.threads.messages.list(
                             thread_id=session,
                             order="desc",
                             limit=1
@@ -8552,7 +12204,47 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
         
         # Return the streaming response for streaming mode
         try:
-            response = StreamingResponse(stream_response(), media_type="text/event-stream")
+            stream_lease = thread_lease
+            
+            async def stream_with_lease():
+                # The session stays locked until the stream finishes or the client disconnects
+                started_at = conversation_streams.started()
+                disconnected = True
+                try:
+                    if not await thread_lock_manager.is_valid(stream_lease):
+                        logging.error(f"Lost thread lock for session {session} before streaming")
+                        error_chunk = {
+                            "id": "chatcmpl-error",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": "gpt-4.1-mini",
+                            "choices": [{
+                                "index": 0,
+                                "delta": {
+                                    "content": "\n[ERROR] This conversation is busy with another request. Please try again.\n"
+                                },
+                                "finish_reason": "stop"
+                            }]
+                        }
+                        yield f"data: {json.dumps(error_chunk)}\n\n"
+                        yield "data: [DONE]\n\n"
+                        disconnected = False
+                        return
+                    first_chunk = True
+                    async for chunk in stream_response():
+                        if first_chunk:
+                            conversation_streams.first_chunk(started_at)
+                            first_chunk = False
+                        yield chunk
+                    disconnected = False
+                finally:
+                    conversation_streams.finished(disconnected)
+                    await thread_lock_manager.release(stream_lease)
+                    logging.info(f"Released thread lock for session {session} after streaming")
+            
+            response = StreamingResponse(stream_with_lease(), media_type="text/event-stream")
+            # Lock ownership now belongs to the stream
+            thread_lease = None
             response.headers["X-Accel-Buffering"] = "no"  # Disable nginx buffering
             response.headers["Cache-Control"] = "no-cache"
             response.headers["Connection"] = "keep-alive"
@@ -8575,9 +12267,9 @@ Remember: You have ONE chance to help completely. Make it extraordinary.
     
     finally:
         # Release the thread lock
-        if thread_lock and thread_lock.locked():
+        if thread_lease:
             try:
-                thread_lock.release()
+                await thread_lock_manager.release(thread_lease)
                 logging.info(f"Released thread lock for session {session}")
             except Exception as release_e:
                 logging.error(f"Error releasing thread lock: {release_e}")
@@ -8949,7 +12641,7 @@ async def chat_completion(
     Uses the same structure as extract-reviews for CSV/Excel generation.
     Returns raw text if no output_format specified.
     """
-    client = create_client()
+    client = get_async_azure_client()
     
     try:
         # Validate output format
@@ -9158,7 +12850,7 @@ Remember: Output ONLY the JSON structure with ALL {rows_to_generate} rows."""
                 if output_format in ['csv', 'excel']:
                     request_params["response_format"] = {"type": "json_object"}
                 
-                completion = client.chat.completions.create(**request_params)
+                completion = await client.chat.completions.create(**request_params)
                 response_content = completion.choices[0].message.content
                 break
                 
@@ -9801,7 +13493,7 @@ async def extract_reviews(
     Can extract data from files, generate synthetic data, or process raw text.
     Supports: PDF, DOCX, TXT, JSON, HTML, CSV, Excel files, or no file at all.
     """
-    client = create_client()
+    client = get_async_azure_client()
     
     try:
         # Validate output format
@@ -10134,7 +13826,7 @@ Remember: Output ONLY the JSON structure."""
         
         for attempt in range(max_retries):
             try:
-                completion = client.chat.completions.create(
+                completion = await client.chat.completions.create(
                     model=model,
                     messages=messages,
                     temperature=temperature if mode == "extract" else 0.7,  # Higher temp for generation
@@ -10488,7 +14180,8 @@ def create_docx_from_content(content: str, images: Optional[List[bytes]] = None)
 async def download_chat(
     request: Request,
     session: Optional[str] = Query(None, description="Session ID to export"),
-    assistant: Optional[str] = Query(None, description="Assistant ID")
+    assistant: Optional[str] = Query(None, description="Assistant ID"),
+    client: AsyncAzureOpenAI = Depends(get_async_azure_client)
 ):
     """
     Creates a DOCX file from the latest chat response and returns a download URL.
@@ -10497,11 +14190,11 @@ async def download_chat(
         request: FastAPI request object (to construct full URL)
         session: Thread ID
         assistant: Assistant ID (optional, for validation)
+        client: Shared Azure OpenAI client (injected)
         
     Returns:
         JSON response with download URL
     """
-    client = create_client()
     
     # Validate session parameter
     if not session:
@@ -10519,7 +14212,7 @@ async def download_chat(
                 logging.warning(f"Assistant {assistant} not found, but continuing with thread messages")
         
         # Get the latest messages from the thread
-        messages = client.beta.threads.messages.list(
+        messages = await client.beta.threads.messages.list(
             thread_id=session,
             order="desc",
             limit=20  # Get recent messages to find the latest assistant response
@@ -10555,8 +14248,8 @@ async def download_chat(
                 try:
                     # Retrieve the file
                     file_id = content_part.image_file.file_id
-                    file_data = client.files.retrieve(file_id)
-                    file_content = client.files.content(file_id)
+                    file_data = await client.files.retrieve(file_id)
+                    file_content = await client.files.content(file_id)
                     images.append(file_content.read())
                 except Exception as img_e:
                     logging.warning(f"Could not retrieve image file {file_id}: {img_e}")
@@ -10765,15 +14458,15 @@ async def comprehensive_health_check():
     
     # 1. Test Azure OpenAI Connection
     async def check_azure_openai():
-        client = create_client()
+        client = get_async_azure_client()
         
         # Try a minimal API call - list models or assistants with limit=1
         try:
             # Try to list assistants (minimal call)
-            assistants = client.beta.assistants.list(limit=1)
+            assistants = await client.beta.assistants.list(limit=1)
             
             # Try a simple completion to verify model access
-            test_completion = client.chat.completions.create(
+            test_completion = await client.chat.completions.create(
                 model="gpt-4.1-mini",
                 messages=[{"role": "user", "content": "Hi"}],
                 max_tokens=5,
@@ -10789,7 +14482,7 @@ async def comprehensive_health_check():
         except Exception as e:
             # Try basic completion only
             try:
-                test_completion = client.chat.completions.create(
+                test_completion = await client.chat.completions.create(
                     model="gpt-4.1-mini",
                     messages=[{"role": "user", "content": "Hi"}],
                     max_tokens=5
@@ -11125,7 +14818,7 @@ async def comprehensive_system_test(
             "logs": [] if verbose else None
         }
         
-        client = create_client()
+        client = get_async_azure_client()
         
         # Helper function to queue updates
         async def queue_update(update_type: str, data: Dict[str, Any]):
@@ -11181,13 +14874,13 @@ async def comprehensive_system_test(
             
             try:
                 # Create test assistant and thread
-                assistant = client.beta.assistants.create(
+                assistant = await client.beta.assistants.create(
                     name=f"test_long_thread_{int(time.time())}",
                     model="gpt-4.1-mini",
                     instructions="You are a test assistant. Keep responses very brief (max 20 words).",
                     tools=[]
                 )
-                thread = client.beta.threads.create()
+                thread = await client.beta.threads.create()
                 
                 await log_stream(f"Created test assistant {assistant.id} and thread {thread.id}")
                 
@@ -11195,7 +14888,7 @@ async def comprehensive_system_test(
                 for i in range(messages_per_thread):
                     try:
                         # Add user message
-                        client.beta.threads.messages.create(
+                        await client.beta.threads.messages.create(
                             thread_id=thread.id,
                             role="user",
                             content=f"Test message {i+1}. Reply with just 'Acknowledged {i+1}'."
@@ -11204,7 +14897,7 @@ async def comprehensive_system_test(
                         msg_start = time.time()
                         
                         # Create and wait for run
-                        run = client.beta.threads.runs.create(
+                        run = await client.beta.threads.runs.create(
                             thread_id=thread.id,
                             assistant_id=assistant.id
                         )
@@ -11212,7 +14905,7 @@ async def comprehensive_system_test(
                         # Wait for completion
                         while run.status in ["queued", "in_progress", "requires_action"]:
                             await asyncio.sleep(0.5)
-                            run = client.beta.threads.runs.retrieve(
+                            run = await client.beta.threads.runs.retrieve(
                                 thread_id=thread.id,
                                 run_id=run.id
                             )
@@ -11232,7 +14925,7 @@ async def comprehensive_system_test(
                         
                         # Check for thread trimming (usually around 50 messages)
                         if i > 45:
-                            messages = client.beta.threads.messages.list(thread_id=thread.id)
+                            messages = await client.beta.threads.messages.list(thread_id=thread.id)
                             current_count = len(messages.data)
                             if current_count < result["messages_created"] - 5:
                                 result["trim_triggered"] = True
@@ -11272,7 +14965,7 @@ async def comprehensive_system_test(
                 
                 # Cleanup
                 try:
-                    client.beta.assistants.delete(assistant_id=assistant.id)
+                    await client.beta.assistants.delete(assistant_id=assistant.id)
                     await log_stream(f"Cleaned up assistant {assistant.id}")
                 except:
                     pass
@@ -11324,7 +15017,7 @@ async def comprehensive_system_test(
             assistants = []
             for i in range(concurrent_users):
                 try:
-                    assistant = client.beta.assistants.create(
+                    assistant = await client.beta.assistants.create(
                         name=f"test_concurrent_{i}_{int(time.time())}",
                         model="gpt-4.1-mini",
                         instructions=f"You are test assistant {i}. Always include your number ({i}) in responses. Keep responses under 15 words.",
@@ -11358,7 +15051,7 @@ async def comprehensive_system_test(
                 }
                 
                 try:
-                    thread = client.beta.threads.create()
+                    thread = await client.beta.threads.create()
                     
                     # Send multiple messages over time
                     messages_to_send = min(5, max(1, test_duration // 10))
@@ -11438,7 +15131,7 @@ async def comprehensive_system_test(
             # Cleanup assistants
             for assistant in assistants:
                 try:
-                    client.beta.assistants.delete(assistant_id=assistant.id)
+                    await client.beta.assistants.delete(assistant_id=assistant.id)
                 except:
                     pass
             
@@ -11483,13 +15176,13 @@ async def comprehensive_system_test(
             
             try:
                 # Create shared assistant and thread
-                assistant = client.beta.assistants.create(
+                assistant = await client.beta.assistants.create(
                     name=f"test_same_thread_{int(time.time())}",
                     model="gpt-4.1-mini",
                     instructions="You are a test assistant. Number each response sequentially.",
                     tools=[]
                 )
-                thread = client.beta.threads.create()
+                thread = await client.beta.threads.create()
                 
                 await log_stream(f"Created shared assistant {assistant.id} and thread {thread.id}")
                 
@@ -11559,7 +15252,7 @@ async def comprehensive_system_test(
                 
                 # Cleanup
                 try:
-                    client.beta.assistants.delete(assistant_id=assistant.id)
+                    await client.beta.assistants.delete(assistant_id=assistant.id)
                 except:
                     pass
                 
@@ -11603,19 +15296,19 @@ async def comprehensive_system_test(
             
             try:
                 # Create test assistant and thread
-                assistant = client.beta.assistants.create(
+                assistant = await client.beta.assistants.create(
                     name=f"test_runs_{int(time.time())}",
                     model="gpt-4.1-mini",
                     instructions="You are a test assistant.",
                     tools=[]
                 )
-                thread = client.beta.threads.create()
+                thread = await client.beta.threads.create()
                 
                 # Test 1: Abandoned run handling
                 await log_stream("Testing abandoned run handling")
                 
                 # Create a run but don't wait for it
-                run1 = client.beta.threads.runs.create(
+                run1 = await client.beta.threads.runs.create(
                     thread_id=thread.id,
                     assistant_id=assistant.id
                 )
@@ -11650,7 +15343,7 @@ async def comprehensive_system_test(
                 await log_stream("Testing thread state consistency")
                 
                 # Check thread messages
-                messages = client.beta.threads.messages.list(thread_id=thread.id)
+                messages = await client.beta.threads.messages.list(thread_id=thread.id)
                 message_count = len(messages.data)
                 
                 # Verify no duplicate messages
@@ -11673,7 +15366,7 @@ async def comprehensive_system_test(
                 await log_stream("Testing cleanup")
                 
                 try:
-                    client.beta.assistants.delete(assistant_id=assistant.id)
+                    await client.beta.assistants.delete(assistant_id=assistant.id)
                     result["tests_performed"].append("cleanup_successful")
                 except Exception as e:
                     result["cleanup_success"] = False
@@ -11733,7 +15426,7 @@ async def comprehensive_system_test(
                 response_times = []
                 
                 # Create test assistant
-                assistant = client.beta.assistants.create(
+                assistant = await client.beta.assistants.create(
                     name=f"test_scaling_{int(time.time())}",
                     model="gpt-4.1-mini",
                     instructions="You are a test assistant. Keep responses under 10 words.",
@@ -11743,7 +15436,7 @@ async def comprehensive_system_test(
                 # Create multiple threads
                 threads = []
                 for i in range(3):  # Use 3 threads for scaling test
-                    thread = client.beta.threads.create()
+                    thread = await client.beta.threads.create()
                     threads.append(thread.id)
                 
                 await log_stream(f"Created {len(threads)} threads for scaling test")
@@ -11806,7 +15499,7 @@ async def comprehensive_system_test(
                 
                 # Cleanup
                 try:
-                    client.beta.assistants.delete(assistant_id=assistant.id)
+                    await client.beta.assistants.delete(assistant_id=assistant.id)
                 except:
                     pass
                 
@@ -11931,13 +15624,13 @@ async def comprehensive_system_test(
                     }
                 ]
                 
-                assistant = client.beta.assistants.create(
+                assistant = await client.beta.assistants.create(
                     name=f"test_tools_{int(time.time())}",
                     model="gpt-4.1-mini",
                     instructions="You are a test assistant with tool calling capabilities.",
                     tools=tools
                 )
-                thread = client.beta.threads.create()
+                thread = await client.beta.threads.create()
                 
                 await log_stream(f"Created test assistant {assistant.id} with tools")
                 
@@ -12078,7 +15771,7 @@ async def comprehensive_system_test(
                     # Create multiple threads for concurrent tool testing
                     concurrent_threads = []
                     for i in range(3):
-                        ct = client.beta.threads.create()
+                        ct = await client.beta.threads.create()
                         concurrent_threads.append(ct.id)
                     
                     async def test_tool_concurrently(thread_id: str, tool_type: str, prompt: str):
@@ -12139,7 +15832,7 @@ async def comprehensive_system_test(
                 
                 # Cleanup
                 try:
-                    client.beta.assistants.delete(assistant_id=assistant.id)
+                    await client.beta.assistants.delete(assistant_id=assistant.id)
                 except:
                     pass
                 
@@ -12327,8 +16020,8 @@ async def basic_health():
     Returns quickly with minimal checks.
     """
     try:
-        # Just verify the app is running and can create a client
-        client = create_client()
+        # Just verify the app is running and the shared client pool is available
+        azure_client_pool.get_async_client()
         
         return JSONResponse({
             "status": "healthy",
@@ -12344,6 +16037,143 @@ async def basic_health():
             status_code=503
         )
 
+@app.get("/metrics",
+         summary="Runtime Metrics",
+         description="Connection pool and cache counters for monitoring.",
+         tags=["System"])
+async def runtime_metrics():
+    """Return in-process runtime counters."""
+    return JSONResponse({
+        "timestamp": datetime.now().isoformat(),
+        "azure_client_pool": azure_client_pool.get_stats(),
+        "run_tracker": run_tracker.get_stats(),
+        "conversation_streams": conversation_streams.get_stats(),
+        "thread_locks": thread_lock_manager.get_stats(),
+        "operation_statuses": operation_status_store.get_stats(),
+        "pandas_jobs": pandas_job_pool.get_stats(),
+        "pandas_agents": PandasAgentManager._instance.get_agent_stats() if PandasAgentManager._instance else None,
+        "pandas_workbooks": PandasAgentManager._instance.get_workbook_stats() if PandasAgentManager._instance else None,
+        "pandas_out_of_core": out_of_core_engine.get_stats(),
+        "pandas_sandbox": sandbox_executor.get_stats(),
+        "pandas_fast_path": pandas_query_planner.get_stats(),
+        "pandas_result_cache": pandas_result_cache.get_stats(),
+        "upload_store": upload_store.get_stats(),
+        "file_registry": file_registry.get_stats(),
+        "dataframe_cache": PandasAgentManager._instance.dataframes_cache.get_stats() if PandasAgentManager._instance else None
+    })
+
+@app.get("/sessions/{session_id}/queue",
+         summary="Session Queue Status",
+         description="Lock holder, queue depth and wait-time metrics for one conversation thread.",
+         tags=["System"])
+async def session_queue_status(session_id: str = Path(..., description="Thread ID of the session")):
+    """Return queue metrics for prompts waiting on a session."""
+    return JSONResponse({
+        "timestamp": datetime.now().isoformat(),
+        **thread_lock_manager.get_queue_stats(session_id)
+    })
+
+@app.get("/sessions/{session_id}/datasets",
+         summary="Session Datasets",
+         description="CSV/Excel files registered for a conversation with their precomputed column profiles "
+                     "(dtype, nulls, distinct estimate, min/max, quartiles, top values).",
+         tags=["System"])
+async def session_datasets(session_id: str = Path(..., description="Thread ID of the session")):
+    """Return the dataset manifest and column profiles for a session."""
+    manager = PandasAgentManager._instance
+    thread_profiles = manager.profiles.get(session_id, {}) if manager else {}
+    
+    datasets = []
+    for file_info in file_registry.manifest(session_id):
+        name = file_info["name"]
+        frames = [
+            {"name": key, "profile": profile} for key, profile in thread_profiles.items()
+            if key == name or key.startswith(f"{name} [Sheet: ")
+        ]
+        if not frames:
+            frames = [
+                {"name": f"{name} [Sheet: {sheet}]" if sheet else name, "profile": profile}
+                for sheet, profile in file_registry.get_profiles(file_info["sha256"])
+            ]
+        datasets.append({
+            "name": name,
+            "type": file_info["type"],
+            "sha256": file_info["sha256"],
+            "profiled": bool(frames),
+            "dataframes": frames
+        })
+    
+    return JSONResponse({
+        "timestamp": datetime.now().isoformat(),
+        "session_id": session_id,
+        "datasets": datasets
+    })
+
+@app.get("/operations",
+         summary="List Operations",
+         description="Recent long-running operations (data analyses), newest first. Filter by session to find an operation ID.",
+         tags=["System"])
+async def list_operations(
+    session: Optional[str] = Query(None, description="Only return operations for this thread ID"),
+    limit: int = Query(50, ge=1, le=500, description="Maximum number of operations to return")
+):
+    """List recent operation statuses."""
+    return JSONResponse({
+        "timestamp": datetime.now().isoformat(),
+        "operations": operation_status_store.list(session=session, limit=limit)
+    })
+
+@app.get("/operations/{operation_id}",
+         summary="Operation Status",
+         description="Current status and progress of a long-running operation.",
+         tags=["System"])
+async def get_operation_status(operation_id: str = Path(..., description="Operation ID")):
+    """Return the latest status of one operation."""
+    entry = operation_status_store.get(operation_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail=f"Operation {operation_id} not found or expired")
+    return JSONResponse(entry)
+
+@app.get("/operations/{operation_id}/stream",
+         summary="Stream Operation Progress",
+         description="Server-Sent Events with every status update of an operation until it completes or fails.",
+         tags=["System"])
+async def stream_operation_status(
+    operation_id: str = Path(..., description="Operation ID"),
+    timeout: int = Query(600, ge=1, le=3600, description="Maximum seconds to keep the stream open")
+):
+    """Stream operation status updates as SSE."""
+    if not operation_status_store.get(operation_id):
+        raise HTTPException(status_code=404, detail=f"Operation {operation_id} not found or expired")
+    
+    async def event_stream():
+        queue = operation_status_store.subscribe(operation_id)
+        deadline = time.time() + timeout
+        try:
+            # Re-read after subscribing so no update is missed in between
+            entry = operation_status_store.get(operation_id)
+            while entry:
+                yield f"data: {json.dumps(entry)}\n\n"
+                if entry["status"] in TERMINAL_OPERATION_STATUSES:
+                    break
+                entry = None
+                while entry is None and time.time() < deadline:
+                    try:
+                        entry = await asyncio.wait_for(queue.get(), timeout=min(15, max(deadline - time.time(), 0.1)))
+                    except asyncio.TimeoutError:
+                        if not operation_status_store.get(operation_id):
+                            break
+                        # Keep-alive comment so proxies don't drop the connection
+                        yield ": keep-alive\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            operation_status_store.unsubscribe(operation_id, queue)
+    
+    response = StreamingResponse(event_stream(), media_type="text/event-stream")
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 
 from fastapi.responses import HTMLResponse
 
@@ -0,0 +1,134 @@
+"""
+Benchmark CSV upload loading: the previous encoding x delimiter retry loop with
+replace({np.nan: None}) against the single-pass sniffed load with native dtypes.
+
+Each load runs in a fresh process so peak RSS is measured per path.
+
+Usage:
+    python benchmarks/csv_load.py                      # 10 MB, 100 MB and 1 GB files
+    python benchmarks/csv_load.py --sizes 10 100 --delimiter ";"
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+REGIONS = ["north", "south", "east", "west", "central", "north-east", "south-west", "overseas"]
+STATUSES = ["active", "inactive", "pending"]
+
+
+def write_csv(path, size_mb, delimiter):
+    """Write a synthetic sales CSV of roughly size_mb megabytes."""
+    rng = random.Random(42)
+    target = size_mb * 1024 * 1024
+    start = date(2020, 1, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(delimiter.join(["id", "region", "status", "amount", "quantity", "order_date", "customer", "phone"]) + "\n")
+        row_id = 0
+        while f.tell() < target:
+            lines = []
+            for _ in range(10000):
+                row_id += 1
+                lines.append(delimiter.join([
+                    str(row_id),
+                    rng.choice(REGIONS),
+                    rng.choice(STATUSES),
+                    "" if rng.random() < 0.02 else f"{rng.uniform(1, 5000):.2f}",
+                    str(rng.randint(1, 50)),
+                    (start + timedelta(days=rng.randint(0, 1500))).isoformat(),
+                    f"Customer {rng.randint(1, 2_000_000)}",
+                    f"+1-555-{rng.randint(0, 9999999):07d}",
+                ]))
+            f.write("\n".join(lines) + "\n")
+
+
+def load_legacy(path):
+    """The loader before single-pass parsing: retry every encoding x delimiter, then object-cast NaNs."""
+    import numpy as np
+    import pandas as pd
+
+    df = None
+    for encoding in ["utf-8", "latin-1", "iso-8859-1"]:
+        if df is not None:
+            break
+        for delimiter in [",", ";", "\t", "|"]:
+            try:
+                df = pd.read_csv(path, encoding=encoding, sep=delimiter, low_memory=False)
+                if len(df.columns) > 1:
+                    break
+            except Exception:
+                continue
+    df.columns = df.columns.str.strip()
+    return df.replace({np.nan: None})
+
+
+def load_current(path):
+    """The loader used by PandasAgentManager.load_dataframe_from_file for in-memory CSVs."""
+    import pandas as pd
+    from app import PYARROW_AVAILABLE, optimize_dataframe_dtypes, sniff_csv_format
+
+    encoding, delimiter = sniff_csv_format(path)
+    engine = "pyarrow" if PYARROW_AVAILABLE else "c"
+    df = pd.read_csv(path, encoding=encoding, sep=delimiter, engine=engine, dtype_backend="numpy_nullable")
+    df.columns = df.columns.astype(str).str.strip()
+    return optimize_dataframe_dtypes(df)
+
+
+def measure(loader_name, path, results):
+    import pandas as pd  # noqa: F401  (imported before timing so both paths pay it up front)
+    if loader_name == "current":
+        import app  # noqa: F401
+    loader = {"legacy": load_legacy, "current": load_current}[loader_name]
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    df = loader(path)
+    elapsed = time.perf_counter() - start
+    results.put({
+        "seconds": elapsed,
+        "frame_mb": df.memory_usage(deep=True).sum() / (1024 * 1024),
+        "peak_rss_mb": max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss, 0) / 1024,
+        "rows": len(df),
+    })
+
+
+def run(loader_name, path):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(loader_name, path, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return None
+    return results.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1024], help="File sizes in MB")
+    parser.add_argument("--delimiter", default=",", help="Delimiter of the generated files")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Where to write the generated files")
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'path':>8} {'load s':>8} {'frame MB':>9} {'peak RSS MB':>12} {'rows':>11}")
+    os.makedirs(args.dir, exist_ok=True)
+    for size_mb in args.sizes:
+        path = os.path.join(args.dir, f"csv_load_bench_{size_mb}mb_{ord(args.delimiter)}.csv")
+        if not os.path.exists(path):
+            write_csv(path, size_mb, args.delimiter)
+        for loader_name in ("legacy", "current"):
+            stats = run(loader_name, path)
+            if stats is None:
+                print(f"{size_mb:>6}MB {loader_name:>8}   failed (out of memory?)")
+                continue
+            print(f"{size_mb:>6}MB {loader_name:>8} {stats['seconds']:>8.2f} {stats['frame_mb']:>9.1f} "
+                  f"{stats['peak_rss_mb']:>12.1f} {stats['rows']:>11,}")
+
+
+if __name__ == "__main__":
+    main()
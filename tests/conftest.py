@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+import uvicorn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class StubAzureOpenAI:
+    """
+    Minimal local stand-in for the Azure OpenAI endpoints the app calls.
+
+    Chat completions answer after `completion_delay` seconds; run streams send a
+    few message deltas spread over `stream_seconds`. Counters record how many
+    requests are in flight so tests can check real concurrency.
+    """
+    def __init__(self):
+        self.completion_delay = 2.0
+        self.stream_seconds = 2.0
+        self.in_flight = 0
+        self.open_streams = 0
+        self.peak_open_streams = 0
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        payload = json.loads(body) if body else {}
+        path = scope["path"].split("/openai", 1)[-1]
+        method = scope["method"]
+        self.requests += 1
+
+        if path.endswith("/chat/completions"):
+            self.in_flight += 1
+            try:
+                await asyncio.sleep(self.completion_delay)
+            finally:
+                self.in_flight -= 1
+            return await self._json(send, {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                "model": payload.get("model", "gpt-4.1-mini"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "stub completion"}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3},
+            })
+        parts = path.strip("/").split("/")
+        if parts[:1] == ["assistants"] and len(parts) == 2:
+            return await self._json(send, {
+                "id": parts[1], "object": "assistant", "created_at": 0, "model": "gpt-4.1-mini",
+                "name": "stub", "instructions": "", "tools": [], "metadata": {},
+                "tool_resources": {"file_search": {"vector_store_ids": []}},
+            })
+        if parts[:1] == ["threads"] and len(parts) == 2:
+            return await self._json(send, {"id": parts[1], "object": "thread", "created_at": 0, "metadata": {},
+                                           "tool_resources": {}})
+        if parts[:1] == ["threads"] and parts[2:3] == ["messages"]:
+            if method == "POST":
+                return await self._json(send, self._message(parts[1], "msg_user", payload.get("content", "")))
+            return await self._json(send, {"object": "list", "data": [], "first_id": None, "last_id": None, "has_more": False})
+        if parts[:1] == ["threads"] and parts[2:3] == ["runs"] and len(parts) == 3:
+            if method == "POST" and payload.get("stream"):
+                return await self._run_stream(send, parts[1])
+            return await self._json(send, {"object": "list", "data": [], "first_id": None, "last_id": None, "has_more": False})
+        return await self._json(send, {"error": {"message": f"stub has no route for {method} {path}"}}, status=404)
+
+    @staticmethod
+    def _message(thread_id, message_id, text):
+        return {
+            "id": message_id, "object": "thread.message", "created_at": 0, "thread_id": thread_id,
+            "role": "assistant", "status": "completed", "assistant_id": None, "run_id": None,
+            "attachments": [], "metadata": {},
+            "content": [{"type": "text", "text": {"value": text if isinstance(text, str) else "", "annotations": []}}],
+        }
+
+    @staticmethod
+    def _run(thread_id, status):
+        return {
+            "id": "run_stub", "object": "thread.run", "created_at": int(time.time()), "thread_id": thread_id,
+            "assistant_id": "asst_stub", "status": status, "model": "gpt-4.1-mini", "instructions": "",
+            "tools": [], "metadata": {}, "parallel_tool_calls": True,
+        }
+
+    async def _run_stream(self, send, thread_id):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        self.open_streams += 1
+        self.peak_open_streams = max(self.peak_open_streams, self.open_streams)
+        try:
+            await self._event(send, "thread.run.created", self._run(thread_id, "queued"))
+            await self._event(send, "thread.run.in_progress", self._run(thread_id, "in_progress"))
+            await self._event(send, "thread.message.created", self._message(thread_id, "msg_stub", ""))
+            deltas = 5
+            for i in range(deltas):
+                await asyncio.sleep(self.stream_seconds / deltas)
+                await self._event(send, "thread.message.delta", {
+                    "id": "msg_stub", "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": f"part {i} "}}]},
+                })
+            await self._event(send, "thread.run.completed", self._run(thread_id, "completed"))
+            await send({"type": "http.response.body", "body": b"event: done\ndata: [DONE]\n\n", "more_body": False})
+        finally:
+            self.open_streams -= 1
+
+    @staticmethod
+    async def _event(send, name, data):
+        chunk = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    @staticmethod
+    async def _json(send, data, status=200):
+        body = json.dumps(data).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def scripted_chat_model(turns):
+    """
+    A LangChain chat model that replays `turns` instead of calling Azure.
+
+    A string turn is an answer, streamed word by word. A dict turn is a call of the
+    pandas agent's Python tool with `code`, optionally preceded by streamed `text`.
+    """
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class ScriptedChatModel(BaseChatModel):
+        turns: list
+        position: int = 0
+
+        @property
+        def _llm_type(self):
+            return "scripted"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _next_turn(self):
+            turn = self.turns[self.position]
+            self.position += 1
+            return turn
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            turn = self._next_turn()
+            if isinstance(turn, str):
+                message = AIMessage(content=turn)
+            else:
+                message = AIMessage(content=turn.get("text", ""), tool_calls=[
+                    {"name": "python_repl_ast", "args": {"query": turn["code"]}, "id": f"call_{self.position}"}
+                ])
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            turn = self._next_turn()
+            text = turn if isinstance(turn, str) else turn.get("text", "")
+            for word in text.split():
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if not isinstance(turn, str):
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": "python_repl_ast", "args": json.dumps({"query": turn["code"]}),
+                    "id": f"call_{self.position}", "index": 0,
+                }]))
+
+    return ScriptedChatModel(turns=list(turns))
+
+
+@pytest.fixture(scope="session")
+def stub_azure():
+    """Serve StubAzureOpenAI on a local port for the whole session."""
+    stub = StubAzureOpenAI()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning", backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("stub Azure OpenAI server did not start")
+        time.sleep(0.05)
+    stub.endpoint = f"http://127.0.0.1:{port}/"
+    yield stub
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def app_module(stub_azure, monkeypatch):
+    """The app with its shared Azure clients pointed at the local stub."""
+    import app
+
+    monkeypatch.setattr(app, "AZURE_ENDPOINT", stub_azure.endpoint)
+    monkeypatch.setattr(app, "AZURE_HTTP2", False)
+    pool = app.azure_client_pool
+    monkeypatch.setattr(pool, "http2", False)
+    monkeypatch.setattr(pool, "_async_client", None)
+    monkeypatch.setattr(pool, "_sync_client", None)
+    monkeypatch.setattr(pool, "_async_http", None)
+    monkeypatch.setattr(pool, "_sync_http", None)
+    yield app
+
+
+@pytest.fixture
+def isolated_storage(tmp_path, monkeypatch):
+    """Upload store, file registry and dataframe snapshots under tmp_path."""
+    import app
+
+    store = app.UploadStore(str(tmp_path / "uploads"))
+    registry = app.FileRegistry(str(tmp_path / "file_registry.sqlite3"))
+    monkeypatch.setattr(app, "upload_store", store)
+    monkeypatch.setattr(app, "file_registry", registry)
+    monkeypatch.setattr(app, "PANDAS_SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    yield store, registry
+    registry.conn.close()
+
+
+def register_csv(app, session, name, df):
+    """Store `df` as an uploaded CSV registered to `session`; returns its manifest entry."""
+    staging_path = os.path.join(app.upload_store.staging_dir, f"{name}.part")
+    df.to_csv(staging_path, index=False)
+    with open(staging_path, "rb") as f:
+        data = f.read()
+    stored = app.upload_store._commit(staging_path, hashlib.sha256(data).hexdigest(), len(data), name)
+    app.file_registry.register(session, stored, "csv")
+    return app.file_registry.manifest(session, name)[0]
@@ -0,0 +1,119 @@
+"""
+Load test for /conversation SSE streams against the local Azure OpenAI stub.
+
+Opens STREAMS concurrent streams, each held open by the stub for STREAM_SECONDS,
+and samples while they run:
+- how many run streams are open at the stub at once,
+- how many worker threads are busy (anyio's default threadpool),
+- how long a trivial job waits for a worker thread, i.e. what any other
+  threadpool-bound request would pay,
+- how late the event loop wakes up from a short sleep.
+
+The "before" case serves the same streams the way /conversation used to: a sync
+generator over the sync client's run stream, which Starlette iterates in its
+worker threadpool, holding a thread for every wait on the next event. Run with
+-s to print the numbers.
+"""
+import asyncio
+import json
+import os
+import time
+
+import anyio
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+STREAMS = int(os.getenv("LOAD_TEST_STREAMS", "200"))
+STREAM_SECONDS = 2.0
+
+
+def threadpool_stream_app(app_module):
+    """/conversation as it was served before: every wait for a stream event blocks a worker thread."""
+    legacy = FastAPI()
+
+    @legacy.get("/conversation")
+    async def conversation(session: str, assistant: str, prompt: str = ""):
+        client = app_module.get_azure_client()
+
+        def stream_response():
+            with client.beta.threads.runs.stream(thread_id=session, assistant_id=assistant) as stream:
+                for event in stream:
+                    if event.event == "thread.message.delta":
+                        text = event.data.delta.content[0].text.value
+                        yield f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream_response(), media_type="text/event-stream")
+
+    return legacy
+
+
+async def _load(asgi_app, stub_azure):
+    """Open STREAMS concurrent /conversation streams and sample the threadpool while they run."""
+    stub_azure.peak_open_streams = 0
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    threads_in_use = []
+    threadpool_waits = []
+    loop_lags = []
+
+    async def sampler():
+        while True:
+            threads_in_use.append(limiter.borrowed_tokens)
+            start = time.perf_counter()
+            await anyio.to_thread.run_sync(lambda: None)
+            threadpool_waits.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await asyncio.sleep(0.05)
+            loop_lags.append(time.perf_counter() - start - 0.05)
+
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+        sampling = asyncio.create_task(sampler())
+        responses = await asyncio.gather(*(
+            client.get("/conversation", params={"session": f"thread_load_{i}", "assistant": "asst_stub", "prompt": "hello"})
+            for i in range(STREAMS)
+        ))
+        sampling.cancel()
+    return {
+        "responses": responses,
+        "peak_open_streams": stub_azure.peak_open_streams,
+        "max_threads_in_use": max(threads_in_use, default=0),
+        "max_threadpool_wait": max(threadpool_waits, default=0.0),
+        "max_loop_lag": max(loop_lags, default=0.0),
+    }
+
+
+def test_conversation_streams_do_not_occupy_worker_threads(app_module, stub_azure, monkeypatch):
+    stub_azure.stream_seconds = STREAM_SECONDS
+    # Plain HTTP/1.1 to the stub: give the shared pool one connection per stream
+    monkeypatch.setattr(app_module, "AZURE_POOL_MAX_CONNECTIONS", STREAMS + 50)
+
+    async def run():
+        thread_limit = anyio.to_thread.current_default_thread_limiter().total_tokens
+        before = await _load(threadpool_stream_app(app_module), stub_azure)
+        after = await _load(app_module.app, stub_azure)
+        return thread_limit, before, after
+
+    thread_limit, before, after = asyncio.run(run())
+
+    print(f"\n{STREAMS} concurrent streams of {STREAM_SECONDS:.0f}s, threadpool of {thread_limit} threads:")
+    for label, result in (("before (sync generator in threadpool)", before), ("after  (async run stream)", after)):
+        print(
+            f"  {label}: peak {result['peak_open_streams']} open streams, "
+            f"{result['max_threads_in_use']} worker threads busy, "
+            f"threadpool wait up to {result['max_threadpool_wait'] * 1000:.0f} ms, "
+            f"event loop lag up to {result['max_loop_lag'] * 1000:.0f} ms"
+        )
+
+    for result in (before, after):
+        for response in result["responses"]:
+            assert response.status_code == 200
+            assert response.text.rstrip().endswith("data: [DONE]")
+    assert "part 4" in after["responses"][0].text
+    assert before["max_threads_in_use"] == thread_limit
+    assert after["peak_open_streams"] == STREAMS
+    assert after["max_threads_in_use"] < thread_limit // 4
+    # On a single core the stub shares the CPU with the app, so the async path still
+    # sees some event loop lag; the threadpool itself no longer queues
+    assert after["max_threadpool_wait"] < before["max_threadpool_wait"] / 2
@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+
+import app
+from conftest import register_csv
+
+
+def _frame(seed, rows=10_000):
+    return pd.DataFrame({"id": range(seed, seed + rows), "amount": [float(seed)] * rows})
+
+
+def test_least_recently_used_threads_are_evicted_first():
+    evicted, reloaded = [], []
+    frames = {name: _frame(i) for i, name in enumerate("abc")}
+    size = app.DataFrameCache.measure(frames["a"])
+
+    def loader(thread_id):
+        reloaded.append(thread_id)
+        return {"data.csv": frames[thread_id]}
+
+    cache = app.DataFrameCache(max_bytes=int(size * 2.5), loader=loader, on_evict=evicted.append)
+    cache["a"] = {"data.csv": frames["a"]}
+    cache["b"] = {"data.csv": frames["b"]}
+    cache["a"]["data.csv"]  # "b" is now the least recently used
+    cache["c"] = {}
+    cache["c"]["data.csv"] = frames["c"]
+
+    assert evicted == ["b"]
+    assert "b" in cache
+    assert cache.get_stats()["threads_resident"] == 2
+    assert cache.resident_bytes() <= cache.max_bytes
+
+    # Touching the evicted thread reloads it and pushes out the new least recently used one
+    assert cache["b"]["data.csv"].equals(frames["b"])
+    assert reloaded == ["b"]
+    assert evicted == ["b", "a"]
+    stats = cache.get_stats()
+    assert (stats["evictions"], stats["reloads"], stats["misses"]) == (2, 1, 1)
+
+
+def test_evicted_thread_releases_its_agent_and_reloads_from_the_registry(isolated_storage, monkeypatch):
+    manager = app.PandasAgentManager()
+    uploads = {thread: _frame(i) for i, thread in enumerate(("thread_a", "thread_b", "thread_c"))}
+
+    def add(thread_id):
+        file_info = register_csv(app, thread_id, "sales.csv", uploads[thread_id])
+        dataframes, error, _ = manager.add_file(thread_id, file_info)
+        assert error is None
+        return file_info
+
+    add("thread_a")
+    manager.dataframes_cache.max_bytes = int(manager.dataframes_cache.resident_bytes() * 2.5)
+    add("thread_b")
+
+    # thread_b has an agent, a binding, a fingerprint and a process snapshot that keep its frame alive
+    snapshot_path = os.path.join(app.PANDAS_SNAPSHOT_DIR, "thread_b.parquet")
+    uploads["thread_b"].to_parquet(snapshot_path)
+    manager.agents_cache["thread_b"] = object()
+    manager.agent_bindings["thread_b"] = ("sales.csv",)
+    manager.fingerprints["thread_b"] = (("sales.csv",), "fingerprint")
+    manager.snapshot_cache["thread_b"] = {"sales.csv": (uploads["thread_b"], snapshot_path)}
+
+    manager.dataframes_cache["thread_a"]  # thread_b is now the least recently used
+    add("thread_c")
+
+    assert manager.dataframes_cache.evicted == {"thread_b"}
+    assert "thread_b" not in manager.agents_cache
+    assert "thread_b" not in manager.agent_bindings
+    assert "thread_b" not in manager.fingerprints
+    assert "thread_b" not in manager.snapshot_cache
+    assert not os.path.exists(snapshot_path)
+
+    # The reload reads the Parquet snapshot registered for the upload instead of parsing the CSV again
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("the CSV was parsed again")
+    monkeypatch.setattr(app, "sniff_csv_format", no_parsing)
+    reloaded = manager.dataframes_cache["thread_b"]["sales.csv"]
+    pd.testing.assert_frame_equal(reloaded, uploads["thread_b"], check_dtype=False)
+    stats = manager.dataframes_cache.get_stats()
+    assert stats["reloads"] == 1
+    assert stats["reload_failures"] == 0
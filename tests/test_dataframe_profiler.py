@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from conftest import register_csv
+
+# 1.04 / sqrt(2 ** PROFILE_HLL_PRECISION): the ~1.6% standard error stated next to the precision
+STANDARD_ERROR = 1.04 / np.sqrt(1 << app.PROFILE_HLL_PRECISION)
+
+
+@pytest.mark.parametrize("cardinality", [1, 50, 3_000, 20_000, 150_000])
+@pytest.mark.parametrize("kind", ["int", "str"])
+def test_distinct_estimates_stay_within_the_stated_error(cardinality, kind):
+    values = np.arange(cardinality)
+    # Each value repeated up to three times, shuffled, with nulls mixed in
+    repeated = np.random.default_rng(cardinality).permutation(np.concatenate([values, values[::2], values[::3]]))
+    series = pd.Series(repeated if kind == "int" else [f"id-{value}" for value in repeated])
+    series = pd.concat([series, pd.Series([None] * 100)], ignore_index=True)
+
+    estimate = app.DataFrameProfiler.estimate_distinct(series)
+
+    # Four standard errors, so the fixed hash never makes this flaky
+    assert abs(estimate - cardinality) <= max(1, 4 * STANDARD_ERROR * cardinality)
+
+
+def test_distinct_estimates_of_empty_columns_are_zero():
+    assert app.DataFrameProfiler.estimate_distinct(pd.Series([], dtype="float64")) == 0
+    assert app.DataFrameProfiler.estimate_distinct(pd.Series([None, None, np.nan])) == 0
+
+
+def test_profiles_are_persisted_and_reused_for_the_same_upload(isolated_storage, monkeypatch):
+    _, registry = isolated_storage
+    df = pd.DataFrame({
+        "customer": [f"c{i % 700}" for i in range(5_000)],
+        "amount": np.arange(5_000) / 4,
+        "region": ["north", "south", None, "west", "east"] * 1_000,
+    })
+    file_info = register_csv(app, "session_a", "sales.csv", df)
+
+    manager = app.PandasAgentManager()
+    _, error, _ = manager.add_file("thread_a", file_info)
+    assert error is None
+    profile = manager.get_profile("thread_a", "sales.csv")
+    columns = {entry["name"]: entry for entry in profile["column_profiles"]}
+    assert (profile["rows"], profile["columns"]) == (5_000, 3)
+    assert abs(columns["customer"]["distinct_estimate"] - 700) <= 4 * STANDARD_ERROR * 700
+    assert columns["region"]["null_count"] == 1_000
+    assert (columns["amount"]["min"], columns["amount"]["max"]) == (0.0, 1249.75)
+
+    # The profile is stored in the profiles table and survives reopening the registry
+    assert registry.get_profile(file_info["sha256"], "") == profile
+    reopened = app.FileRegistry(registry.db_path)
+    try:
+        assert reopened.get_profiles(file_info["sha256"]) == [("", profile)]
+    finally:
+        reopened.conn.close()
+
+    # Another thread with the same upload reads the stored profile instead of profiling again
+    def no_profiling(df):
+        raise AssertionError("the dataframe was profiled again")
+    monkeypatch.setattr(app.dataframe_profiler, "profile", no_profiling)
+    other_info = register_csv(app, "session_b", "sales.csv", df)
+    assert other_info["sha256"] == file_info["sha256"]
+    other = app.PandasAgentManager()
+    _, error, _ = other.add_file("thread_b", other_info)
+    assert error is None
+    assert other.get_profile("thread_b", "sales.csv") == profile
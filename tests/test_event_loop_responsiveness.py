@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import httpx
+
+SLOW_COMPLETIONS = 10
+COMPLETION_DELAY = 2.0
+MAX_HEALTH_LATENCY = 0.25
+
+
+async def _health_latencies_during_completions(app_module, stub_azure):
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=30) as client:
+        completions = [
+            asyncio.create_task(client.post("/completion", data={"prompt": f"slow request {i}", "max_retries": "1"}))
+            for i in range(SLOW_COMPLETIONS)
+        ]
+        deadline = time.perf_counter() + COMPLETION_DELAY
+        while stub_azure.in_flight < SLOW_COMPLETIONS and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        in_flight = stub_azure.in_flight
+
+        latencies = []
+        while stub_azure.in_flight:
+            start = time.perf_counter()
+            response = await client.get("/health")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+            await asyncio.sleep(0.05)
+
+        responses = await asyncio.gather(*completions)
+    return in_flight, latencies, responses
+
+
+def test_health_stays_fast_while_slow_completions_are_in_flight(app_module, stub_azure):
+    stub_azure.completion_delay = COMPLETION_DELAY
+
+    in_flight, latencies, responses = asyncio.run(_health_latencies_during_completions(app_module, stub_azure))
+
+    assert in_flight == SLOW_COMPLETIONS, "completions did not reach the stub concurrently"
+    assert [r.status_code for r in responses] == [200] * SLOW_COMPLETIONS
+    assert len(latencies) >= 5
+    assert max(latencies) < MAX_HEALTH_LATENCY, f"/health took {max(latencies):.3f}s while completions were in flight"
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from conftest import register_csv
+
+SALES = pd.DataFrame({
+    "id": np.arange(2_000),
+    "region": np.array(["north", "south", "east", "west"])[np.arange(2_000) % 4],
+    "amount": np.round(np.arange(2_000) * 0.37 % 250, 2),
+})
+
+
+@pytest.fixture
+def engine(isolated_storage, monkeypatch):
+    """Fresh out-of-core engine with every CSV over the (0 MB) threshold."""
+    pytest.importorskip("duckdb")
+    engine = app.OutOfCoreEngine(memory_mb=256)
+    monkeypatch.setattr(app, "out_of_core_engine", engine)
+    monkeypatch.setattr(app, "PANDAS_OUT_OF_CORE_THRESHOLD_MB", 0)
+    yield engine
+    if engine.conn is not None:
+        engine.conn.close()
+
+
+def _load(file_info):
+    dataframes, error = app.PandasAgentManager().load_dataframe_from_file(file_info)
+    assert error is None
+    return dataframes["sales.csv"]
+
+
+def test_large_csvs_are_queried_out_of_core(engine):
+    table = _load(register_csv(app, "session_a", "sales.csv", SALES))
+
+    assert isinstance(table, app.OutOfCoreTable)
+    assert table.shape == SALES.shape and len(table) == len(SALES)
+    assert table.columns == list(SALES.columns)
+    pd.testing.assert_frame_equal(table.head(3), SALES.head(3), check_dtype=False)
+    assert len(table.sample(5)) == 5
+
+    # Filters
+    filtered = table.sql("SELECT * FROM df WHERE amount > 200 AND region <> 'west' ORDER BY id")
+    expected = SALES[(SALES["amount"] > 200) & (SALES["region"] != "west")].reset_index(drop=True)
+    pd.testing.assert_frame_equal(filtered, expected, check_dtype=False)
+
+    # Grouped aggregates
+    grouped = table.sql(
+        "SELECT region, count(*) AS orders, sum(amount) AS total, avg(amount) AS average "
+        "FROM df GROUP BY region ORDER BY region"
+    )
+    expected = (
+        SALES.groupby("region")["amount"].agg(orders="count", total="sum", average="mean").reset_index()
+    )
+    pd.testing.assert_frame_equal(grouped, expected, check_dtype=False)
+
+    # Relation methods are delegated to DuckDB
+    assert table.filter("amount > 200").aggregate("max(amount)").fetchone()[0] == SALES["amount"].max()
+    assert engine.get_stats()["queries"] == 3  # sample() goes through sql() too
+
+
+def test_identical_uploads_reuse_their_parquet_chunks(engine):
+    first = _load(register_csv(app, "session_a", "sales.csv", SALES))
+    second = _load(register_csv(app, "session_b", "sales.csv", SALES))
+
+    assert second.chunk_glob == first.chunk_glob
+    stats = engine.get_stats()
+    assert (stats["tables_ingested"], stats["tables_reused"]) == (1, 1)
+    assert stats["started"] is True
+
+
+def test_loads_fall_back_to_pandas_without_duckdb(isolated_storage, monkeypatch):
+    engine = app.OutOfCoreEngine()
+    monkeypatch.setattr(app, "out_of_core_engine", engine)
+    monkeypatch.setattr(app, "PANDAS_OUT_OF_CORE_THRESHOLD_MB", 0)
+    monkeypatch.setattr(app, "DUCKDB_AVAILABLE", False)
+
+    df = _load(register_csv(app, "session_a", "sales.csv", SALES))
+
+    assert isinstance(df, pd.DataFrame)
+    pd.testing.assert_frame_equal(df, SALES, check_dtype=False, check_categorical=False)
+    stats = engine.get_stats()
+    assert (stats["available"], stats["started"], stats["tables_ingested"]) == (False, False, 0)
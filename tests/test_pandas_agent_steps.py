@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+import app
+from conftest import scripted_chat_model
+
+
+def test_only_the_final_answer_is_streamed_as_tokens(monkeypatch):
+    pytest.importorskip("langchain_experimental")
+    manager = app.PandasAgentManager.get_instance()
+    monkeypatch.setattr(app, "PANDAS_AGENT_ISOLATION", "thread")
+    monkeypatch.setattr(manager, "get_llm", lambda: scripted_chat_model([
+        {"text": "Let me add up the amount column first.", "code": "int(df['amount'].sum())"},
+        "The total amount is 6.",
+    ]))
+    agent, errors = manager._build_agent({"sales.csv": pd.DataFrame({"amount": [1, 2, 3]})})
+    assert errors == []
+
+    steps, trace = [], []
+    handler = manager._build_agent_handler(trace, step_callback=lambda kind, text: steps.append((kind, text)))
+    output = manager._run_agent(agent, "What is the total amount?", [handler])
+
+    assert output.strip() == "The total amount is 6."
+    kinds = [kind for kind, _ in steps]
+    assert kinds[:2] == ["code", "observation"]
+    assert set(kinds[2:]) == {"token"}
+    assert steps[0][1] == "int(df['amount'].sum())"
+    assert steps[1][1] == "6"
+    streamed = "".join(text for kind, text in steps if kind == "token")
+    assert streamed.strip() == "The total amount is 6."
+    assert "Let me add up" not in streamed
+
+
+def test_no_tokens_are_streamed_when_the_run_ends_without_an_answer(monkeypatch):
+    pytest.importorskip("langchain_experimental")
+    manager = app.PandasAgentManager.get_instance()
+    monkeypatch.setattr(app, "PANDAS_AGENT_ISOLATION", "thread")
+    monkeypatch.setattr(manager, "get_llm", lambda: scripted_chat_model([
+        {"text": "Checking the columns.", "code": "list(df.columns)"},
+    ]))
+    agent, _ = manager._build_agent({"sales.csv": pd.DataFrame({"amount": [1, 2, 3]})})
+    agent.max_iterations = 1
+
+    steps = []
+    handler = manager._build_agent_handler([], step_callback=lambda kind, text: steps.append((kind, text)))
+    manager._run_agent(agent, "Which columns are there?", [handler])
+
+    assert [kind for kind, _ in steps] == ["code", "observation"]
@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+import app
+
+SALES = pd.DataFrame({
+    "region": ["north", "south", "east", "west", "north", "south", "east", "west"],
+    "amount": [120.0, 80.0, 250.5, 40.0, 99.5, 310.0, None, 60.0],
+    "quantity": [1, 2, 3, 4, 5, 6, 7, 8],
+    "Unit Price": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0],
+    "order_date": pd.to_datetime([
+        "2024-01-05", "2024-02-10", "2024-03-15", "2024-04-20",
+        "2024-05-25", "2024-06-30", "2024-07-04", "2024-08-08",
+    ]),
+})
+
+
+@pytest.fixture
+def planner():
+    return app.PandasQueryPlanner()
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("How many rows are there?", "**sales.csv** has 8 rows."),
+    ("number of columns", "**sales.csv** has 5 columns."),
+    ("What is the average amount?", "Average **amount** in **sales.csv**: 137.1429"),
+    ("total amount", "Total **amount** in **sales.csv**: 960"),
+    ("max quantity", "Maximum **quantity** in **sales.csv**: 8"),
+    ("minimum amount", "Minimum **amount** in **sales.csv**: 40"),
+    ("median quantity", "Median **quantity** in **sales.csv**: 4.5"),
+    ("count of amount", "Count **amount** in **sales.csv**: 7"),
+    ("max order_date", "Maximum **order_date** in **sales.csv**: 2024-08-08 00:00:00"),
+    ("how many unique regions", "**region** has 4 distinct values in **sales.csv**."),
+    ("how many rows where amount > 100", "3 of 8 rows in **sales.csv** have **amount** > 100."),
+    ("how many rows where region is west", "2 of 8 rows in **sales.csv** have **region** is west."),
+])
+def test_supported_questions_are_answered_directly(planner, query, expected):
+    assert planner.answer(query, {"sales.csv": SALES}) == expected
+
+
+def test_grouped_aggregates_and_top_n(planner):
+    grouped = planner.answer("average amount by region", {"sales.csv": SALES})
+    assert grouped.startswith("Average **amount** by **region** in **sales.csv**:")
+    assert grouped.index("east") < grouped.index("south") < grouped.index("north") < grouped.index("west")
+
+    top = planner.answer("show the top 2 rows by amount", {"sales.csv": SALES})
+    assert top.startswith("Top 2 rows of **sales.csv** by **amount**:")
+    assert "310.0" in top and "250.5" in top and "120.0" not in top
+
+
+@pytest.mark.parametrize("query, column", [
+    ("average unit price", "Unit Price"),
+    ("sum of the unit_price column", "Unit Price"),
+    ("total Unit-Price", "Unit Price"),
+    ("total amounts", "amount"),
+    ("what is the average of the quantity field", "quantity"),
+])
+def test_column_names_match_loosely(planner, query, column):
+    answer = planner.answer(query, {"sales.csv": SALES})
+    assert answer is not None
+    assert f"**{column}**" in answer
+
+
+@pytest.mark.parametrize("query", [
+    # Compound filters
+    "how many rows where region is west and amount > 100",
+    "how many rows where region is west or east",
+    "how many rows where amount > 100, quantity < 5",
+    # Several columns, unknown or ambiguous columns, wrong types
+    "average amount and quantity",
+    "average price",
+    "average region",
+    "average amount by amount",
+    "number of orders",
+    # Questions the rules do not cover
+    "latest order_date",
+    "why did sales drop in march",
+    "compare amount across regions and explain the trend",
+])
+def test_compound_and_ambiguous_questions_fall_through(planner, query):
+    assert planner.answer(query, {"sales.csv": SALES}) is None
+
+
+def test_column_questions_must_resolve_against_one_dataframe(planner):
+    dataframes = {"sales.csv": SALES, "returns.csv": SALES[["region", "amount"]].head(3)}
+
+    assert planner.answer("total amount", dataframes) is None
+    assert planner.answer("total amount in returns.csv", dataframes) == "Total **amount** in **returns.csv**: 450.5"
+    # Frame-level questions are answered for every frame
+    assert planner.answer("how many rows", dataframes) == "**sales.csv** has 8 rows.\n\n**returns.csv** has 3 rows."
+
+
+def test_stats_count_hits_and_intents(planner):
+    planner.answer("total amount", {"sales.csv": SALES})
+    planner.answer("why did sales drop in march", {"sales.csv": SALES})
+
+    stats = planner.get_stats()
+    assert (stats["queries"], stats["hits"]) == (2, 1)
+    assert stats["intents"] == {"sum": 1}
@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+import app
+
+SALES = pd.DataFrame({"region": ["north", "south", "west"], "price": [3.0, 7.5, 12.0], "year": [2022, 2023, 2024]})
+
+
+@pytest.fixture
+def cache():
+    return app.PandasResultCache(ttl_seconds=3600, max_entries=100, similarity_threshold=0)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Can you tell me the average price in the file?", "average price"),
+    ("What is the total of sales for 2023?", "total sales 2023"),
+    ("Show me the top 5 regions by price, please", "top 5 regions by price"),
+    ("Сколько строк в файле?", "сколько строк в файле"),
+])
+def test_rewordings_share_a_key(cache, first, second):
+    assert cache.normalize_query(first) == cache.normalize_query(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("How many rows have price above 5?", "How many rows have price below 5?"),
+    ("How many rows have price above 5?", "How many rows have price above 50?"),
+    ("How many rows have price > 5?", "How many rows have price < 5?"),
+    ("What is the total of sales in 2023?", "What is the total of sales in 2024?"),
+    ("What is the average price?", "What is the average year?"),
+    ("What is the average price?", "What is the median price?"),
+    ("Rows where region is west", "Rows where region is not west"),
+    ("Count students with grade 'A'", "Count students with grade 'I'"),
+    ("Count students with grade 'A'", "Count students with grade"),
+    ("What is the price of item 5 in the file?", "What is the price of item 6 in the file?"),
+])
+def test_questions_that_differ_in_meaning_do_not_share_a_key(cache, first, second):
+    assert cache.normalize_query(first) != cache.normalize_query(second)
+
+    fingerprint = app.PandasResultCache.fingerprint({"sales.csv": SALES})
+    cache.put(fingerprint, first, "first answer")
+    assert cache.get(fingerprint, second) == (None, None)
+    assert cache.get(fingerprint, first) == ("first answer", None)
+
+
+def test_changed_dataframes_invalidate_cached_answers(cache):
+    question = "What is the average price?"
+    fingerprint = app.PandasResultCache.fingerprint({"sales.csv": SALES})
+    cache.put(fingerprint, question, "7.5")
+
+    changed_value = SALES.copy()
+    changed_value.loc[0, "price"] = 4.0
+    changed_type = SALES.astype({"year": "float64"})
+    for dataframes in (
+        {"sales.csv": changed_value},
+        {"sales.csv": changed_type},
+        {"other.csv": SALES},
+        {"sales.csv": SALES, "returns.csv": SALES.head(1)},
+    ):
+        changed = app.PandasResultCache.fingerprint(dataframes)
+        assert changed != fingerprint
+        assert cache.get(changed, question) == (None, None)
+
+    # An identical upload (e.g. from another session) still hits
+    assert app.PandasResultCache.fingerprint({"sales.csv": SALES.copy()}) == fingerprint
+    assert cache.get(fingerprint, question) == ("7.5", None)
+
+
+def test_manager_fingerprint_follows_the_bound_dataframes():
+    manager = app.PandasAgentManager()
+    first = manager.get_dataframes_fingerprint("thread_fp", {"sales.csv": SALES})
+    assert manager.get_dataframes_fingerprint("thread_fp", {"sales.csv": SALES}) == first
+
+    updated = SALES.copy()
+    updated.loc[2, "price"] = 99.0
+    assert manager.get_dataframes_fingerprint("thread_fp", {"sales.csv": updated}) != first
+
+
+def test_filler_only_questions_are_not_cached(cache):
+    fingerprint = app.PandasResultCache.fingerprint({"sales.csv": SALES})
+    cache.put(fingerprint, "What is the?", "anything")
+
+    assert cache.entries == {}
+    assert cache.get(fingerprint, "what is the") == (None, None)
+    assert cache.get_stats()["misses"] == 0
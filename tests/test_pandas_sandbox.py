@@ -0,0 +1,119 @@
+import os
+import signal
+
+import pandas as pd
+import pytest
+
+import app
+from conftest import scripted_chat_model
+
+# A worker with the app imported sits at roughly 220 MB resident and 1.7 GB virtual;
+# the address-space backstop (4x the budget) must leave room for the watchdog to trip first
+MEMORY_MB = 1024
+
+
+@pytest.fixture
+def make_executor(tmp_path):
+    executors = []
+
+    def make(**limits):
+        options = {"size": 1, "cpu_seconds": 60, "wall_seconds": 60, "memory_mb": 4096, "shm_dir": str(tmp_path)}
+        options.update(limits)
+        executor = app.SandboxedCodeExecutor(**options)
+        executors.append(executor)
+        return executor
+
+    yield make
+    for executor in executors:
+        executor.shutdown()
+
+
+def _leased_session(executor):
+    """A session whose worker has loaded a small frame; returns it with the worker process."""
+    frames = executor.publish("thread_sandbox", {"sales.csv": pd.DataFrame({"amount": [1, 2, 3]})})
+    session = executor.open_session(frames)
+    assert session.run("int(df['amount'].sum())") == "6"
+    return session, session.worker["process"]
+
+
+def _assert_killed_and_recycled(executor, session, process, output, limit, explanation):
+    assert output.startswith(f"Execution stopped: {explanation}.")
+    assert "the dataframes are still available as df/dfs" in output
+    assert not process.is_alive()
+    assert session.worker is None
+    stats = executor.get_stats()
+    assert stats[f"{limit}_limit_kills"] == 1
+    assert stats["crashes"] == 0
+    # The next step runs on a fresh worker with the frames reloaded
+    assert session.run("int(df['amount'].sum())") == "6"
+    assert session.worker["process"] is not process
+    session.close()
+
+
+def test_cpu_limit_kills_the_worker(make_executor):
+    executor = make_executor(cpu_seconds=1)
+    session, process = _leased_session(executor)
+
+    output = session.run("while True:\n    pass")
+
+    assert process.exitcode == -signal.SIGXCPU
+    _assert_killed_and_recycled(executor, session, process, output, "cpu", "the code used more than 1s of CPU time")
+
+
+def test_wall_clock_limit_kills_the_worker(make_executor):
+    executor = make_executor(wall_seconds=2)
+    session, process = _leased_session(executor)
+
+    output = session.run("import time\ntime.sleep(30)")
+
+    _assert_killed_and_recycled(executor, session, process, output, "wall", "the code ran for more than 2s")
+
+
+def test_resident_memory_watchdog_kills_the_worker(make_executor):
+    executor = make_executor(memory_mb=MEMORY_MB)
+    session, process = _leased_session(executor)
+
+    # Grow resident memory gradually so the watchdog, not the address-space limit, trips first
+    output = session.run(
+        "import time\n"
+        "blocks = []\n"
+        "while True:\n"
+        "    blocks.append(np.ones(1_000_000))\n"
+        "    time.sleep(0.01)"
+    )
+
+    _assert_killed_and_recycled(
+        executor, session, process, output, "memory", f"the code used more than {MEMORY_MB} MB of memory"
+    )
+
+
+def test_sandbox_agent_runs_its_code_in_a_worker(make_executor, monkeypatch):
+    pytest.importorskip("langchain_experimental")
+    manager = app.PandasAgentManager.get_instance()
+    monkeypatch.setattr(app, "PANDAS_AGENT_ISOLATION", "sandbox")
+    monkeypatch.setattr(app, "sandbox_executor", make_executor())
+    monkeypatch.setattr(manager, "get_llm", lambda: scripted_chat_model([
+        {"code": "import os\nos.getpid()"},
+        "The worker answered.",
+    ]))
+    dataframes = {"sales.csv": pd.DataFrame({"amount": [1, 2, 3]})}
+
+    agent, errors = manager._build_agent(dataframes)
+
+    assert errors == []
+    assert manager._repl_tool(agent) is None
+    sandbox_tool = next(tool for tool in agent.tools if getattr(tool, "runs_in_sandbox", False))
+    assert sandbox_tool.name == "python_repl_ast"
+    # Outside _run_in_sandbox there is no session, so nothing runs in this process
+    assert sandbox_tool.run({"query": "1 + 1"}).startswith("Error:")
+    # Rebinding to new dataframes keeps the sandbox agent instead of forcing a rebuild
+    assert manager._bind_dataframes(agent, {"other.csv": pd.DataFrame({"x": [1]})})
+
+    trace = []
+    output = manager._run_in_sandbox("thread_sandbox", agent, dataframes, "Which process are you?", trace)
+
+    assert output.strip() == "The worker answered."
+    observation = next(step for step in trace if step.startswith("Observation: "))
+    worker_pid = int(observation.split(": ", 1)[1])
+    assert worker_pid != os.getpid()
+    assert app.current_sandbox_session.get() is None
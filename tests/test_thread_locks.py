@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import app
+
+LEASE_SECONDS = 0.3
+
+
+@pytest.fixture(params=["local", "redis"])
+def backend(request):
+    if request.param == "local":
+        return app.LocalLockBackend()
+    fakeredis = pytest.importorskip("fakeredis")
+    return app.RedisLockBackend(fakeredis.FakeAsyncRedis())
+
+
+def _manager(backend, **options):
+    return app.ThreadLockManager(backend=backend, lease_seconds=LEASE_SECONDS, **options)
+
+
+def test_waiters_get_the_lock_in_fifo_order(backend):
+    async def run():
+        manager = _manager(backend)
+        holder = await manager.acquire("thread_fifo")
+        order = []
+
+        async def wait_turn(name):
+            lease = await manager.acquire("thread_fifo", timeout=5)
+            order.append(name)
+            await asyncio.sleep(0.01)
+            await manager.release(lease)
+
+        waiters = []
+        for name in ("first", "second", "third"):
+            waiters.append(asyncio.create_task(wait_turn(name)))
+            await asyncio.sleep(0.01)
+        assert manager.get_queue_stats("thread_fifo")["queue_depth"] == 3
+        await manager.release(holder)
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(run()) == ["first", "second", "third"]
+
+
+def test_heartbeat_renews_the_lease(backend):
+    async def run():
+        manager = _manager(backend)
+        lease = await manager.acquire("thread_heartbeat")
+        await asyncio.sleep(LEASE_SECONDS * 4)
+        held = await manager.is_valid(lease)
+        # Another process sharing the backend cannot take a renewed lease
+        stolen = await backend.try_acquire("thread_heartbeat", "other_owner", LEASE_SECONDS)
+        await manager.release(lease)
+        return held, lease.lost, stolen
+
+    held, lost, stolen = asyncio.run(run())
+    assert held
+    assert not lost
+    assert stolen is None
+
+
+def test_expired_lease_gets_a_higher_fencing_token_and_the_stale_holder_is_rejected(backend):
+    async def run():
+        stalled, other = _manager(backend), _manager(backend)
+        stale = await stalled.acquire("thread_fence")
+        # The holder stalls: its heartbeat stops and the lease runs out
+        stale.heartbeat_task.cancel()
+        await asyncio.sleep(LEASE_SECONDS * 2)
+
+        current = await other.acquire("thread_fence", timeout=2)
+        stale_renewed = await backend.renew("thread_fence", stale.owner, LEASE_SECONDS)
+        stale_released = await backend.release("thread_fence", stale.owner)
+        stale_valid = await stalled.is_valid(stale)
+        await stalled.release(stale)
+        current_valid = await other.is_valid(current)
+        await other.release(current)
+        return stale, current, stale_renewed, stale_released, stale_valid, current_valid
+
+    stale, current, stale_renewed, stale_released, stale_valid, current_valid = asyncio.run(run())
+    assert current.fencing_token > stale.fencing_token
+    assert not stale_renewed
+    assert not stale_released
+    assert not stale_valid
+    # The stale holder's release did not take the lease from the new holder
+    assert current_valid
+
+
+def test_heartbeat_marks_a_lease_lost_when_renewal_is_rejected(backend):
+    async def run():
+        manager = _manager(backend)
+        lease = await manager.acquire("thread_lost")
+        # Someone else's lease replaced ours, e.g. after a long pause on this host
+        await backend.release("thread_lost", lease.owner)
+        await backend.try_acquire("thread_lost", "other_owner", LEASE_SECONDS * 10)
+        await asyncio.wait_for(lease.heartbeat_task, timeout=LEASE_SECONDS * 3)
+        return lease.lost, manager.get_stats()["leases_lost"]
+
+    assert asyncio.run(run()) == (True, 1)
+
+
+def test_file_backend_fences_and_excludes_other_handles(tmp_path):
+    if app.fcntl is None:
+        pytest.skip("file locks need fcntl")
+
+    async def run():
+        first, second = app.FileLockBackend(str(tmp_path)), app.FileLockBackend(str(tmp_path))
+        token = await first.try_acquire("thread_file", "a", LEASE_SECONDS)
+        blocked = await second.try_acquire("thread_file", "b", LEASE_SECONDS)
+        stale_release = await second.release("thread_file", "b")
+        await first.release("thread_file", "a")
+        next_token = await second.try_acquire("thread_file", "b", LEASE_SECONDS)
+        await second.release("thread_file", "b")
+        return token, blocked, stale_release, next_token
+
+    token, blocked, stale_release, next_token = asyncio.run(run())
+    assert blocked is None
+    assert not stale_release
+    assert next_token == token + 1
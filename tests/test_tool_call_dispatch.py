@@ -0,0 +1,78 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import app
+
+MAX_CONCURRENCY = 2
+HANG_TIMEOUT = 0.3
+
+
+def _tool_call(index, name, delay):
+    return SimpleNamespace(
+        id=f"call_{index}",
+        function=SimpleNamespace(name=name, arguments=json.dumps({"index": index, "delay": delay})),
+    )
+
+
+def test_tool_calls_run_concurrently_and_keep_their_order(monkeypatch):
+    monkeypatch.setitem(app.TOOL_CALL_TIMEOUTS, "hang", HANG_TIMEOUT)
+    running, peak, finish_order = 0, 0, []
+
+    async def sleepy_tool(tool_call, args, emit):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            emit(f"{args['index']}:start ")
+            await asyncio.sleep(args["delay"])
+            emit(f"{args['index']}:end ")
+            finish_order.append(args["index"])
+            return f"output {args['index']}"
+        finally:
+            running -= 1
+
+    # Earlier calls take longer, so they finish out of order
+    tool_calls = [
+        _tool_call(0, "sleepy", 0.8),
+        _tool_call(1, "hang", 10),
+        _tool_call(2, "sleepy", 0.2),
+        _tool_call(3, "sleepy", 0.1),
+        _tool_call(4, "sleepy", 0.05),
+    ]
+    handlers = {"sleepy": sleepy_tool, "hang": sleepy_tool}
+
+    async def run():
+        texts, outputs = [], None
+        async for item in app.stream_tool_calls(tool_calls, handlers, max_concurrency=MAX_CONCURRENCY):
+            if item["type"] == "outputs":
+                outputs = item["outputs"]
+            else:
+                texts.append(item["text"])
+        return texts, outputs
+
+    texts, outputs = asyncio.run(run())
+
+    assert finish_order == [2, 3, 4, 0]
+    assert peak == MAX_CONCURRENCY
+    assert [output["tool_call_id"] for output in outputs] == [f"call_{i}" for i in range(5)]
+    assert outputs[0]["output"] == "output 0"
+    assert outputs[1]["output"] == f"Error running hang: the tool did not finish within {HANG_TIMEOUT} seconds"
+    assert [output["output"] for output in outputs[2:]] == ["output 2", "output 3", "output 4"]
+    # Each call's text reaches the client in one piece, in tool call order
+    assert "".join(texts) == (
+        "0:start 0:end 1:start \n[Error: hang timed out]\n2:start 2:end 3:start 3:end 4:start 4:end "
+    )
+
+
+def test_unknown_tools_and_failures_become_error_outputs():
+    async def broken_tool(tool_call, args, emit):
+        raise ValueError("bad input")
+
+    tool_calls = [_tool_call(0, "pandas_agent", 0), _tool_call(1, "unknown", 0)]
+    outputs = asyncio.run(app.dispatch_tool_calls(tool_calls, {"pandas_agent": broken_tool}))
+
+    assert outputs == [
+        {"tool_call_id": "call_0", "output": "Error analyzing data: bad input"},
+        {"tool_call_id": "call_1", "output": "Error running unknown: unsupported tool"},
+    ]
@@ -0,0 +1,57 @@
+import asyncio
+import gc
+import io
+import os
+import threading
+
+from fastapi import UploadFile
+
+import app
+
+CSV = b"region,amount\nnorth,1\nsouth,2\n"
+
+
+def test_uploads_are_committed_off_the_event_loop(isolated_storage, monkeypatch):
+    store, _ = isolated_storage
+    commit_threads = []
+    commit = store._commit
+
+    def recording_commit(*args):
+        commit_threads.append(threading.get_ident())
+        return commit(*args)
+    monkeypatch.setattr(store, "_commit", recording_commit)
+
+    async def upload_twice():
+        loop_thread = threading.get_ident()
+        first = await store.save_upload(UploadFile(io.BytesIO(CSV), filename="sales.csv"))
+        second = await store.save_upload(UploadFile(io.BytesIO(CSV), filename="sales.csv"))
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(upload_twice())
+
+    assert len(commit_threads) == 2 and loop_thread not in commit_threads
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert first["path"] == second["path"]
+    with open(first["path"], "rb") as f:
+        assert f.read() == CSV
+    assert os.listdir(store.staging_dir) == []
+
+
+def test_upload_profiling_tasks_are_kept_until_they_finish(monkeypatch):
+    profiled = []
+
+    async def profile(file_info):
+        await asyncio.sleep(0.05)
+        profiled.append(file_info["name"])
+    monkeypatch.setattr(app, "profile_upload_in_background", profile)
+
+    async def run():
+        task = app.schedule_upload_profiling({"name": "sales.csv"})
+        del task
+        gc.collect()
+        assert len(app.upload_profiling_tasks) == 1
+        while app.upload_profiling_tasks:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert profiled == ["sales.csv"]